@@ -0,0 +1,71 @@
+# benchmark_xd.py: time EM iterations of extreme_deconvolution
+#
+# Usage: python benchmark_xd.py [--ndata N] [--ngauss K] [--niter NITER]
+#                               [--dims 5 6 7 8 9 10] [--proj]
+#                               [--threads 1 2 4 8]
+#
+# With --threads, every thread count is run in a separate process with
+# OMP_NUM_THREADS set; point PYTHONPATH at different builds to compare them
+import os
+import sys
+import subprocess
+import time
+import argparse
+import numpy
+from extreme_deconvolution import extreme_deconvolution
+
+def make_problem(ndata,ngauss,dim,proj=False,seed=1):
+    """Generate a test problem with full error covariances"""
+    rng= numpy.random.RandomState(seed)
+    xmean= rng.normal(size=(ngauss,dim))*3.
+    assign= rng.choice(ngauss,size=ndata)
+    ydata= rng.normal(size=(ndata,dim))+xmean[assign]
+    tmp= rng.normal(size=(ndata,dim,dim))*0.3
+    ycovar= numpy.einsum('nij,nkj->nik',tmp,tmp)+0.01*numpy.eye(dim)
+    ydata+= numpy.einsum('nij,nj->ni',numpy.linalg.cholesky(ycovar),
+                         rng.normal(size=(ndata,dim)))
+    if proj:
+        projection= numpy.tile(numpy.eye(dim),(ndata,1,1))
+    else:
+        projection= None
+    xamp= numpy.ones(ngauss)/ngauss
+    xcovar= numpy.tile(numpy.eye(dim)*4.,(ngauss,1,1))
+    return (ydata,ycovar,projection,xamp,xmean+rng.normal(size=xmean.shape),
+            xcovar)
+
+def time_em(ndata,ngauss,dim,niter,proj=False):
+    """Return the wall-clock time per EM iteration"""
+    ydata,ycovar,projection,xamp,xmean,xcovar= \
+        make_problem(ndata,ngauss,dim,proj=proj)
+    start= time.time()
+    extreme_deconvolution(ydata,ycovar,xamp,xmean,xcovar,
+                          projection=projection,tol=1.e-300,
+                          maxiter=niter)
+    return (time.time()-start)/niter
+
+if __name__ == '__main__':
+    parser= argparse.ArgumentParser()
+    parser.add_argument('--ndata',type=int,default=20000)
+    parser.add_argument('--ngauss',type=int,default=5)
+    parser.add_argument('--niter',type=int,default=10)
+    parser.add_argument('--dims',type=int,nargs='+',default=[5,6,7,8,9,10])
+    parser.add_argument('--proj',action='store_true',
+                        help='pass (identity) projection matrices')
+    parser.add_argument('--threads',type=int,nargs='+',default=None,
+                        help='thread counts to scan')
+    args= parser.parse_args()
+    if args.threads is not None:
+        cmd= [sys.executable,os.path.abspath(__file__),
+              '--ndata',str(args.ndata),'--ngauss',str(args.ngauss),
+              '--niter',str(args.niter),'--dims']\
+              +[str(dim) for dim in args.dims]
+        if args.proj: cmd.append('--proj')
+        for nthreads in args.threads:
+            env= dict(os.environ,OMP_NUM_THREADS=str(nthreads))
+            out= subprocess.check_output(cmd,env=env)
+            for line in out.decode().splitlines():
+                sys.stdout.write('threads = %2i, %s\n' % (nthreads,line))
+        sys.exit(0)
+    for dim in args.dims:
+        t= time_em(args.ndata,args.ngauss,dim,args.niter,proj=args.proj)
+        sys.stdout.write('d = %2i: %.4f s per EM iteration\n' % (dim,t))
@@ -1 +1,5 @@
-from .extreme_deconvolution import extreme_deconvolution
+from .extreme_deconvolution import extreme_deconvolution, score_samples, \
+    membership_prob, batch_extreme_deconvolution, XDResult, kmeans_init, \
+    multistart_extreme_deconvolution, select_ngauss, \
+    resample_extreme_deconvolution, crossvalidate_extreme_deconvolution, \
+    sample, deconvolve, XDModel
@@ -25,6 +25,317 @@ if _PY3: #pragma: no cover
     long= int
     chr= lambda x: bytes([x]) # Back to python 2 chr...
 
+#Declare the argument types of the C functions once, rather than in every
+#call, such that fits can run concurrently from several threads (ctypes
+#releases the GIL while the C code runs)
+_inFlags= ('C_CONTIGUOUS',)
+_ndarrayFlags= ('C_CONTIGUOUS','WRITEABLE')
+class _xdstats(ctypes.Structure):
+    """Statistics of a fit, collected by the C code (struct xdstats)"""
+    _fields_= [('loglike',ctypes.POINTER(ctypes.c_double)),
+               ('nloglike',ctypes.c_longlong),
+               ('sizeloglike',ctypes.c_longlong),
+               ('emiter',ctypes.POINTER(ctypes.c_longlong)),
+               ('nem',ctypes.c_longlong),
+               ('sizeem',ctypes.c_longlong),
+               ('snmmoves',ctypes.POINTER(ctypes.c_int)),
+               ('nsnm',ctypes.c_longlong),
+               ('sizesnm',ctypes.c_longlong),
+               ('testep',ctypes.c_double),
+               ('tmstep',ctypes.c_double),
+               ('tsnm',ctypes.c_double),
+               ('ttotal',ctypes.c_double)]
+class _xdoptions(ctypes.Structure):
+    """Options beyond those of the IDL interface (struct xdoptions)"""
+    _fields_= [('batchsize',ctypes.c_int),
+               ('stepexp',ctypes.c_double),
+               ('nepoch',ctypes.c_int),
+               ('polish',ctypes.c_bool),
+               ('accelerate',ctypes.c_bool),
+               ('steploglike',ctypes.POINTER(ctypes.c_double)),
+               ('smoothloglike',ctypes.POINTER(ctypes.c_double)),
+               ('nsteps',ctypes.c_longlong),
+               ('stochconverged',ctypes.c_bool),
+               ('niter',ctypes.c_longlong),
+               ('converged',ctypes.c_bool),
+               ('stats',ctypes.POINTER(_xdstats)),
+               ('snmworkers',ctypes.c_int),
+               ('snmbest',ctypes.c_bool),
+               ('snmskip',ctypes.c_double),
+               ('snmtrial',ctypes.c_longlong),
+               ('linweights',ctypes.c_bool)]
+_lib.free_xdstats.argtypes= [ctypes.POINTER(_xdstats)]
+_lib.proj_gauss_mixtures_strided.argtypes= \
+    [ndpointer(dtype=nu.float64),
+     ndpointer(dtype=nu.longlong,flags=_inFlags),
+     ndpointer(dtype=nu.float64),
+     ndpointer(dtype=nu.longlong,flags=_inFlags),
+     ndpointer(dtype=nu.float64),
+     ndpointer(dtype=nu.longlong,flags=_inFlags),
+     ndpointer(dtype=nu.float64),
+     ctypes.c_longlong,
+     ctypes.c_int,
+     ctypes.c_int,
+     ndpointer(dtype=nu.float64,flags=_ndarrayFlags),
+     ndpointer(dtype=nu.float64,flags=_ndarrayFlags),
+     ndpointer(dtype=nu.float64,flags=_ndarrayFlags),
+     ctypes.c_int,
+     ctypes.c_int,
+     ctypes.c_char_p,
+     ctypes.c_char_p,
+     ctypes.c_char_p,
+     ctypes.POINTER(ctypes.c_double),
+     ctypes.c_double,
+     ctypes.c_longlong,
+     ctypes.c_bool,
+     ctypes.c_double,
+     ctypes.c_char_p,
+     ctypes.c_int,
+     ctypes.c_char_p,
+     ctypes.c_bool,
+     ctypes.c_bool,
+     ctypes.c_bool,
+     ctypes.c_int,
+     ctypes.POINTER(_xdoptions)]
+_lib.batch_proj_gauss_mixtures.argtypes= \
+    [ctypes.c_int,
+     ndpointer(dtype=nu.float64,flags=_inFlags),
+     ndpointer(dtype=nu.float64,flags=_inFlags),
+     ndpointer(dtype=nu.float64,flags=_inFlags),
+     ndpointer(dtype=nu.float64,flags=_inFlags),
+     ndpointer(dtype=nu.intc,flags=_inFlags),
+     ctypes.c_int,
+     ndpointer(dtype=nu.float64,flags=_ndarrayFlags),
+     ndpointer(dtype=nu.float64,flags=_ndarrayFlags),
+     ndpointer(dtype=nu.float64,flags=_ndarrayFlags),
+     ctypes.c_int,
+     ndpointer(dtype=nu.intc,flags=_inFlags),
+     ctypes.c_char_p,
+     ctypes.c_char_p,
+     ctypes.c_char_p,
+     ndpointer(dtype=nu.float64,flags=_ndarrayFlags),
+     ctypes.c_double,
+     ctypes.c_longlong,
+     ctypes.c_char,
+     ctypes.c_double,
+     ctypes.c_int,
+     ctypes.c_char,
+     ctypes.c_char,
+     ctypes.c_char,
+     ndpointer(dtype=nu.longlong,flags=_ndarrayFlags),
+     ndpointer(dtype=nu.int8,flags=_ndarrayFlags)]
+_lib.calc_loglike.argtypes= [ndpointer(dtype=nu.float64,flags=_inFlags),
+                             ndpointer(dtype=nu.float64,flags=_inFlags),
+                             ndpointer(dtype=nu.float64,flags=_inFlags),
+                             ctypes.c_int,
+                             ctypes.c_int,
+                             ndpointer(dtype=nu.float64,flags=_inFlags),
+                             ndpointer(dtype=nu.float64,flags=_inFlags),
+                             ndpointer(dtype=nu.float64,flags=_inFlags),
+                             ctypes.c_int,
+                             ctypes.c_int,
+                             ndpointer(dtype=nu.float64,flags=_ndarrayFlags),
+                             ctypes.c_void_p,
+                             ctypes.c_void_p,
+                             ctypes.c_void_p,
+                             ctypes.c_char,
+                             ctypes.c_char]
+_lib.multistart_proj_gauss_mixtures.argtypes= \
+    [ctypes.c_int,
+     ndpointer(dtype=nu.float64),
+     ndpointer(dtype=nu.longlong,flags=_inFlags),
+     ndpointer(dtype=nu.float64),
+     ndpointer(dtype=nu.longlong,flags=_inFlags),
+     ndpointer(dtype=nu.float64),
+     ndpointer(dtype=nu.longlong,flags=_inFlags),
+     ndpointer(dtype=nu.float64),
+     ctypes.c_longlong,
+     ctypes.c_int,
+     ctypes.c_int,
+     ndpointer(dtype=nu.float64,flags=_ndarrayFlags),
+     ndpointer(dtype=nu.float64,flags=_ndarrayFlags),
+     ndpointer(dtype=nu.float64,flags=_ndarrayFlags),
+     ctypes.c_int,
+     ctypes.c_int,
+     ctypes.c_char_p,
+     ctypes.c_char_p,
+     ctypes.c_char_p,
+     ndpointer(dtype=nu.float64,flags=_ndarrayFlags),
+     ctypes.c_double,
+     ctypes.c_longlong,
+     ctypes.c_double,
+     ctypes.c_int,
+     ctypes.c_char,
+     ctypes.c_char,
+     ctypes.c_char,
+     ctypes.c_longlong,
+     ctypes.c_double,
+     ndpointer(dtype=nu.longlong,flags=_ndarrayFlags),
+     ndpointer(dtype=nu.int8,flags=_ndarrayFlags),
+     ndpointer(dtype=nu.int8,flags=_ndarrayFlags)]
+_lib.multistart_proj_gauss_mixtures.restype= ctypes.c_int
+_lib.resample_proj_gauss_mixtures.argtypes= \
+    [ctypes.c_int,
+     ctypes.c_char,
+     ndpointer(dtype=nu.intc,flags=_inFlags),
+     ctypes.c_ulong,
+     ndpointer(dtype=nu.float64),
+     ndpointer(dtype=nu.longlong,flags=_inFlags),
+     ndpointer(dtype=nu.float64),
+     ndpointer(dtype=nu.longlong,flags=_inFlags),
+     ndpointer(dtype=nu.float64),
+     ndpointer(dtype=nu.longlong,flags=_inFlags),
+     ndpointer(dtype=nu.float64),
+     ctypes.c_longlong,
+     ctypes.c_int,
+     ctypes.c_int,
+     ndpointer(dtype=nu.float64,flags=_ndarrayFlags),
+     ndpointer(dtype=nu.float64,flags=_ndarrayFlags),
+     ndpointer(dtype=nu.float64,flags=_ndarrayFlags),
+     ctypes.c_int,
+     ctypes.c_int,
+     ctypes.c_char_p,
+     ctypes.c_char_p,
+     ctypes.c_char_p,
+     ndpointer(dtype=nu.float64,flags=_ndarrayFlags),
+     ctypes.c_double,
+     ctypes.c_longlong,
+     ctypes.c_double,
+     ctypes.c_int,
+     ctypes.c_char,
+     ctypes.c_char,
+     ctypes.c_char,
+     ndpointer(dtype=nu.longlong,flags=_ndarrayFlags),
+     ndpointer(dtype=nu.int8,flags=_ndarrayFlags)]
+_lib.crossvalidate_proj_gauss_mixtures.argtypes= \
+    [ctypes.c_int,
+     ndpointer(dtype=nu.intc,flags=_inFlags),
+     ctypes.c_int,
+     ndpointer(dtype=nu.float64,flags=_inFlags),
+     ndpointer(dtype=nu.float64),
+     ndpointer(dtype=nu.longlong,flags=_inFlags),
+     ndpointer(dtype=nu.float64),
+     ndpointer(dtype=nu.longlong,flags=_inFlags),
+     ndpointer(dtype=nu.float64),
+     ndpointer(dtype=nu.longlong,flags=_inFlags),
+     ndpointer(dtype=nu.float64),
+     ctypes.c_longlong,
+     ctypes.c_int,
+     ctypes.c_int,
+     ndpointer(dtype=nu.float64,flags=_ndarrayFlags),
+     ndpointer(dtype=nu.float64,flags=_ndarrayFlags),
+     ndpointer(dtype=nu.float64,flags=_ndarrayFlags),
+     ctypes.c_int,
+     ctypes.c_int,
+     ctypes.c_char_p,
+     ctypes.c_char_p,
+     ctypes.c_char_p,
+     ndpointer(dtype=nu.float64,flags=_ndarrayFlags),
+     ndpointer(dtype=nu.float64,flags=_ndarrayFlags),
+     ctypes.c_double,
+     ctypes.c_longlong,
+     ctypes.c_int,
+     ctypes.c_char,
+     ctypes.c_char,
+     ctypes.c_char,
+     ndpointer(dtype=nu.longlong,flags=_ndarrayFlags),
+     ndpointer(dtype=nu.int8,flags=_ndarrayFlags)]
+_lib.kmeans_init.argtypes= [ndpointer(dtype=nu.float64,flags=_inFlags),
+                            ndpointer(dtype=nu.float64,flags=_inFlags),
+                            ctypes.c_int,
+                            ctypes.c_int,
+                            ctypes.c_int,
+                            ctypes.c_char,
+                            ctypes.c_int,
+                            ctypes.c_int,
+                            ctypes.c_ulong,
+                            ndpointer(dtype=nu.float64,flags=_ndarrayFlags),
+                            ndpointer(dtype=nu.float64,flags=_ndarrayFlags),
+                            ndpointer(dtype=nu.float64,flags=_ndarrayFlags)]
+
+class XDResult(object):
+    """
+    NAME:
+       XDResult
+    PURPOSE:
+       result of extreme_deconvolution(...,fullresult=True), the one
+       container for the metadata of a fit
+    ATTRIBUTES:
+       avgloglikedata - average log likelihood of the data of the final model
+       niter - total number of full EM iterations (E-steps), including
+               those of rejected split and merge moves
+       converged - whether the EM that produced the final model converged
+                   to within tol (rather than hitting maxiter)
+       emiter - [ncall] number of iterations of every call of the EM, in
+                order (the initial EM, then for every split and merge move
+                the partial and the full EM)
+       loglike - [niter] average log likelihood of the data after every
+                 E-step, concatenated over the calls of the EM ([1] if
+                 likeonly)
+       snmmoves - [nmove,3] (j,k,l) of every split and merge move that was
+                  tried (merge j and k, split l)
+       snmaccepted - [nmove] whether every move was accepted
+       nsteps, stochconverged - number of steps and convergence of the
+                                stochastic EM (None without minibatch)
+       stepsize, minibatch_loglike, smoothed_loglike - [nsteps] step size,
+                   mini-batch log likelihood, and smoothed log likelihood
+                   of every step of the stochastic EM (None without
+                   minibatch)
+       time - dictionary of the wall-clock time (s) spent in the 'estep',
+              'mstep', 'snm' (split and merge, including its EM steps)
+              and 'total'; with snmworkers > 1, 'estep' and 'mstep' are
+              summed over the concurrent moves and can exceed 'total'
+    HISTORY:
+       2026-10-18 - Written
+    """
+    def __init__(self,avgloglikedata,options,stats,
+                 steploglike=None,smoothloglike=None,stepexp=None):
+        self.avgloglikedata= avgloglikedata
+        self.niter= int(options.niter)
+        self.converged= bool(options.converged)
+        self.emiter= _stats2array(stats.emiter,stats.nem,nu.int64)
+        self.loglike= _stats2array(stats.loglike,stats.nloglike,nu.float64)
+        moves= _stats2array(stats.snmmoves,4*stats.nsnm,nu.intc)\
+            .reshape((stats.nsnm,4))
+        self.snmmoves= moves[:,:3].astype(int)
+        self.snmaccepted= moves[:,3].astype(bool)
+        if steploglike is None:
+            self.nsteps= None
+            self.stochconverged= None
+            self.stepsize= None
+            self.minibatch_loglike= None
+            self.smoothed_loglike= None
+        else:
+            self.nsteps= int(options.nsteps)
+            self.stochconverged= bool(options.stochconverged)
+            self.stepsize= (1.+nu.arange(self.nsteps))**-stepexp
+            self.minibatch_loglike= steploglike[:self.nsteps]
+            self.smoothed_loglike= smoothloglike[:self.nsteps]
+        self.time= {'estep':stats.testep,'mstep':stats.tmstep,
+                    'snm':stats.tsnm,'total':stats.ttotal}
+
+    @property
+    def naccepted(self):
+        """Number of accepted split and merge moves"""
+        return int(nu.sum(self.snmaccepted))
+
+    @property
+    def nrejected(self):
+        """Number of rejected split and merge moves"""
+        return len(self.snmaccepted)-self.naccepted
+
+    def __repr__(self):
+        return 'XDResult(avgloglikedata=%g, niter=%i, converged=%s, ' \
+            % (self.avgloglikedata,self.niter,self.converged) \
+            +'naccepted=%i, nrejected=%i, time=%.3gs)' \
+            % (self.naccepted,self.nrejected,self.time['total'])
+
+def _stats2array(ptr,n,dtype):
+    """Internal function that copies an array of the C statistics"""
+    if n == 0:
+        return nu.zeros(0,dtype=dtype)
+    return nu.ctypeslib.as_array(ptr,shape=(n,)).astype(dtype)
+
 def _fix2chararray(fix,ngauss):
     """Internal function to process the fix* inputs"""
     if fix is None:
@@ -42,6 +353,62 @@ def _fix2chararray(fix,ngauss):
     else:
         return ''.join(fix)
 
+#Default number of data points per chunk when streaming memory-mapped data
+_CHUNKSIZE= 65536
+
+def _strided(x,contiguousrows=False):
+    """Internal function that returns a float64 array that the C code can
+    view in place, and its strides in units of doubles; only copies when
+    the array cannot be viewed (wrong dtype, negative or unaligned strides,
+    or non-contiguous rows when contiguousrows)"""
+    x= nu.asarray(x,dtype=nu.float64)
+    strides= [s // x.itemsize for s in x.strides]
+    if any([s % x.itemsize != 0 for s in x.strides]) \
+            or any([s < 0 for s in strides]) \
+            or any([s <= 0 for s,n in zip(strides[1:],x.shape[1:]) if n > 1]) \
+            or (contiguousrows and x.shape[-1] > 1 and strides[-1] != 1) \
+            or (contiguousrows and x.ndim == 3 and x.shape[1] > 1
+                and strides[1] < x.shape[2]):
+        x= nu.ascontiguousarray(x)
+        strides= [s // x.itemsize for s in x.strides]
+    #Strides of axes of length one are never used, but have to be valid,
+    #so use those of a C-contiguous array
+    strides= [s if n > 1 else max(1,int(nu.prod(x.shape[ii+1:])))
+              for ii,(s,n) in enumerate(zip(strides,x.shape))]
+    return (x,nu.array(strides[:2],dtype=nu.longlong))
+
+def _logweights(weight,logweight):
+    """Internal function that returns noweight and the log weights to pass
+    to the C code"""
+    if weight is None:
+        return (True,nu.zeros(1))
+    elif not logweight:
+        return (False,nu.log(weight))
+    else:
+        return (False,weight)
+
+def _strided_data(ydata,ycovar,projection,weight,logweight,diagerrors,
+                  takelog=True):
+    """Internal function that returns the data of a fit such that the C
+    code can view them in place (see _strided), as (ydata, ystrides,
+    ycovar, cstrides, projection, pstrides, logweights, wstride,
+    noprojection, noweight); if not takelog, the weights are returned as
+    given and the C code takes their log (xdoptions.linweights)"""
+    noprojection= projection is None
+    if noprojection:
+        projection= nu.zeros(1)
+    if takelog:
+        noweight, logweights= _logweights(weight,logweight)
+    else:
+        noweight= weight is None
+        logweights= nu.zeros(1) if noweight else weight
+    ydata, ystrides= _strided(ydata)
+    ycovar, cstrides= _strided(ycovar,contiguousrows=not diagerrors)
+    projection, pstrides= _strided(projection,contiguousrows=True)
+    logweights, wstrides= _strided(logweights)
+    return (ydata,ystrides,ycovar,cstrides,projection,pstrides,logweights,
+            wstrides[0],noprojection,noweight)
+
 def extreme_deconvolution(ydata,ycovar,
                           xamp,xmean,xcovar,
                           projection=None,
@@ -49,14 +416,19 @@ def extreme_deconvolution(ydata,ycovar,
                           fixamp=None,fixmean=None,fixcovar=None,
                           tol=1.e-6,maxiter=long(1e9),w=0.,logfile=None,
                           splitnmerge=0,maxsnm=False,likeonly=False,
-                          logweight=False):
+                          logweight=False,chunksize=None,
+                          minibatch=None,nepoch=10,stepexp=0.6,polish=True,
+                          accelerate=False,fullresult=False,snmworkers=1,
+                          snmbest=False,snmskip=0.,snmtrial=0):
     """
     NAME:
        extreme_deconvolution
     PURPOSE:
        run the underlying C-extreme-deconvolution code
     INPUT:
-       ydata - [ndata,dy] numpy array of observed quantities
+       ydata - [ndata,dy] numpy array of observed quantities (ydata, ycovar,
+               projection, and weight can also be numpy.memmap arrays or
+               paths to .npy files, which are memory-mapped)
        ycovar - [ndata,dy(,dy)] numpy array of observational error covariances
                 (if [ndata,dy] then the error correlations are assumed to vanish)
        xamp - [ngauss] numpy array of initial amplitudes (*not* [1,ngauss])
@@ -81,13 +453,84 @@ def extreme_deconvolution(ydata,ycovar,
        splitnmerge - (int, default=0) depth to go down the splitnmerge path
        maxsnm - (Bool, default=False) use the maximum number of split 'n'
                  merge steps, K*(K-1)*(K-2)/2
+       snmworkers - (int, default=1) evaluate this many split 'n' merge
+                    moves concurrently, each on its own copy of the model
+                    (the E-step of a move then runs in a single thread);
+                    the first move in the split 'n' merge hierarchy that
+                    improves the likelihood is accepted, which gives the
+                    same result for any snmworkers > 1 (but not the same
+                    as snmworkers=1, which draws the random splits in a
+                    different order); the logfile only has the final log
+                    likelihood of every move
+       snmbest - (Bool, default=False) with snmworkers > 1, accept the
+                 move with the largest likelihood among the first batch
+                 of concurrently evaluated moves that contains an
+                 improvement, rather than the first improving move
+       snmskip - (double, default=0.) the partial EM after a split 'n'
+                 merge move only updates the three gaussians that were
+                 moved; leave data points whose posterior probability for
+                 these three is less than snmskip out of it
+       snmtrial - (int, default=0) if > 0, the full EM after a split 'n'
+                  merge move is abandoned after snmtrial iterations if its
+                  log likelihood, and that extrapolated from its last three
+                  iterations (assuming linear convergence), does not exceed
+                  the log likelihood before the move
        likeonly - (Bool, default=False) only compute the total log
                    likelihood of the data
+       chunksize - (int, default=None) if > 0, stream the data through the
+                   E-step in chunks of this many data points, such that
+                   only a chunk of the data and of the posterior
+                   probabilities needs to be in memory (for data larger
+                   than memory); None uses chunks of 65536 for memory-mapped
+                   data without split and merge or stochastic EM, and no
+                   chunks otherwise; split and merge is not possible when
+                   streaming, and memory-mapped arrays that are streamed
+                   need to be float64 (they are not converted as a whole)
+       minibatch - (int, default=None) if set, start with stochastic EM:
+                   every step runs the E-step on a random mini-batch of this
+                   many data points and moves running averages of the
+                   sufficient statistics towards those of the mini-batch
+                   with step size (1+t)^-stepexp
+       nepoch - (int, default=10) maximum number of epochs (ndata/minibatch
+                steps) of the stochastic EM; it stops earlier when the
+                smoothed mini-batch log likelihood changes by less than tol
+                over an epoch
+       stepexp - (double, default=0.6) exponent of the step-size schedule,
+                 in (0.5,1]
+       polish - (Bool, default=True) finish the stochastic EM with the full
+                EM (always done when using split and merge); if False, the
+                returned avgloglikedata is the smoothed mini-batch estimate
+       accelerate - (Bool, default=False) accelerate the EM with SQUAREM
+                    (squared extrapolation of the parameters, falling back
+                    onto the plain EM step when the extrapolated model is
+                    invalid or has a lower likelihood); useful when the EM
+                    converges slowly, e.g., for large uncertainties
+       fullresult - (Bool, default=False) return an XDResult with the
+                    number of iterations and convergence, the iterations
+                    of every EM call, the log likelihood after every
+                    E-step, the split and merge moves that were tried, the
+                    per-step log likelihoods of the stochastic EM, and the
+                    time spent in the E-step, M-step, and split and merge,
+                    rather than only avgloglikedata; this is the way to
+                    get the metadata of a fit
     OUTPUT:
-       avgloglikedata after convergence,
+       avgloglikedata after convergence (or an XDResult if fullresult),
        +updated xamp, xmean, xcovar
     HISTORY:
        2010-02-10 - Written - Bovy (NYU)
+       2026-10-18 - Fits can run concurrently in several threads, the GIL
+                    is released while the C code runs
+       2026-10-18 - The data are used in place rather than copied, they can
+                    be read-only and need not be C-contiguous
+       2026-10-18 - Added chunksize, to stream memory-mapped data
+       2026-10-18 - Added stochastic EM (minibatch)
+       2026-10-18 - Added accelerate (SQUAREM)
+       2026-10-18 - Added fullresult
+       2026-10-18 - Added snmworkers and snmbest
+       2026-10-18 - Added snmskip
+       2026-10-18 - Added snmtrial
+       2026-10-18 - The log of the weights is taken as the data points are
+                    viewed, such that streamed weights are never copied
     DOCTEST:
     >>> import numpy as nu
     >>> ydata= nu.array([[  2.62434536e+00],
@@ -346,6 +789,26 @@ def extreme_deconvolution(ydata,ycovar,
     >>> ydata.flags['F_CONTIGUOUS']
     True
     """
+    #Data given as paths to .npy files are memory-mapped
+    ydata, ycovar, projection, weight= \
+        [nu.load(x,mmap_mode='r') if isinstance(x,str) else x
+         for x in [ydata,ycovar,projection,weight]]
+    snm= (splitnmerge > 0 or maxsnm) and not likeonly
+    if chunksize is None:
+        #Only stream by default if nothing needs all of the data in memory
+        if minibatch is None and not snm and any([isinstance(x,nu.memmap)
+                for x in [ydata,ycovar,projection,weight]]):
+            chunksize= _CHUNKSIZE
+        else:
+            chunksize= 0
+    if chunksize > 0 and snm:
+        raise ValueError('split and merge is not possible when streaming the data in chunks, use chunksize=0 to fit data in memory')
+    if chunksize > 0 and minibatch is not None:
+        raise ValueError('stochastic EM draws mini-batches from all of the data and cannot stream the data in chunks')
+    if chunksize > 0 and any([isinstance(x,nu.memmap) and x.dtype != nu.float64
+                              for x in [ydata,ycovar,projection,weight]]):
+        raise ValueError('memory-mapped data that are streamed in chunks need to be float64, convert them first or use chunksize=0 to fit them in memory')
+
     ndata= ydata.shape[0]
     dataDim= ydata.shape[1]
     ngauss= len(xamp)
@@ -363,88 +826,58 @@ def extreme_deconvolution(ydata,ycovar,
     avgloglikedata= ctypes.pointer(ctypes.c_double(0.))
 
     if logfile is None:
-        clog= ''
-        clog2= ''
-        n_clog= 0
-        n_clog2= 0
+        clog= None
+        clog2= None
     else:
         clog= logfile + '_c.log'
-        n_clog= len(clog)
         clog2= logfile + '_loglike.log'
-        n_clog2= len(clog2)
-    if _PY3: #pragma: no cover
-        clog= clog.encode('utf8')
-        clog2= clog2.encode('utf8')
+        if _PY3: #pragma: no cover
+            clog= clog.encode('utf8')
+            clog2= clog2.encode('utf8')
 
     if maxsnm:
         splitnmerge = long(ngauss*(ngauss-1)*(ngauss-2)/2)
 
-    if projection is None:
-        noprojection= True
-        projection= nu.zeros(1)
-    else:
-        noprojection= False
-        
-    if weight is None:
-        noweight= True
-        logweights= nu.zeros(1)
-    elif not logweight:
-        noweight= False
-        logweights= nu.log(weight)
-    else:
-        noweight= False
-        logweights= weight
-        
-    ndarrayFlags= ('C_CONTIGUOUS','WRITEABLE')
-    exdeconvFunc= _lib.proj_gauss_mixtures_IDL
-    exdeconvFunc.argtypes = [ndpointer(dtype=nu.float64,flags=ndarrayFlags),
-                             ndpointer(dtype=nu.float64,flags=ndarrayFlags),
-                             ndpointer(dtype=nu.float64,flags=ndarrayFlags),
-                             ndpointer(dtype=nu.float64,flags=ndarrayFlags),
-                             ctypes.c_int,
-                             ctypes.c_int,
-                             ndpointer(dtype=nu.float64,flags=ndarrayFlags),
-                             ndpointer(dtype=nu.float64,flags=ndarrayFlags),
-                             ndpointer(dtype=nu.float64,flags=ndarrayFlags),
-                             ctypes.c_int,
-                             ctypes.c_int,
-                             ctypes.c_char_p,
-                             ctypes.c_char_p,
-                             ctypes.c_char_p,
-                             ctypes.POINTER(ctypes.c_double),
-                             ctypes.c_double,
-                             ctypes.c_int,
-                             ctypes.c_char,
-                             ctypes.c_double,
-                             ctypes.c_char_p,
-                             ctypes.c_int,
-                             ctypes.c_int,
-                             ctypes.c_char_p,
-                             ctypes.c_int,
-                             ctypes.c_char,
-                             ctypes.c_char,
-                             ctypes.c_char]
-                                             
-    #Requirements, first store old order
-    f_cont= [ydata.flags['F_CONTIGUOUS'],
-             ycovar.flags['F_CONTIGUOUS'],
-             projection.flags['F_CONTIGUOUS'],
-             logweights.flags['F_CONTIGUOUS'],
-             xamp.flags['F_CONTIGUOUS'],
-             xmean.flags['F_CONTIGUOUS'],
-             xcovar.flags['F_CONTIGUOUS']]
-    ydata= nu.require(ydata,dtype=nu.float64,requirements=['C','W'])
-    ycovar= nu.require(ycovar,dtype=nu.float64,requirements=['C','W'])
-    projection= nu.require(projection,dtype=nu.float64,requirements=['C','W'])
-    logweights= nu.require(logweights,dtype=nu.float64,requirements=['C','W'])
+    exdeconvFunc= _lib.proj_gauss_mixtures_strided
+
+    options= _xdoptions(batchsize=0 if minibatch is None else minibatch,
+                        stepexp=stepexp,nepoch=nepoch,polish=polish,
+                        accelerate=accelerate,snmworkers=snmworkers,
+                        snmbest=snmbest,snmskip=snmskip,
+                        snmtrial=snmtrial,linweights=not logweight)
+    if fullresult:
+        stats= _xdstats()
+        options.stats= ctypes.pointer(stats)
+    steploglike, smoothloglike= None, None
+    if minibatch is not None and not likeonly:
+        nbatch= min(minibatch,ndata)
+        maxsteps= nepoch*((ndata+nbatch-1)//nbatch)
+        steploglike= nu.zeros(maxsteps)
+        smoothloglike= nu.zeros(maxsteps)
+        options.steploglike= \
+            steploglike.ctypes.data_as(ctypes.POINTER(ctypes.c_double))
+        options.smoothloglike= \
+            smoothloglike.ctypes.data_as(ctypes.POINTER(ctypes.c_double))
+
+    #The data are viewed in place, whatever their memory layout, and the C
+    #code takes the log of the weights as it views the data points; the
+    #model gaussians are updated by the C code and need to be C-contiguous
+    ydata,ystrides,ycovar,cstrides,projection,pstrides,logweights,wstride,\
+        noprojection,noweight= \
+        _strided_data(ydata,ycovar,projection,weight,logweight,diagerrors,
+                      takelog=False)
     xamp_tmp= nu.require(xamp,dtype=nu.float64,requirements=['C','W'])
     xmean_tmp= nu.require(xmean,dtype=nu.float64,requirements=['C','W'])
     xcovar_tmp= nu.require(xcovar,dtype=nu.float64,requirements=['C','W'])
 
     exdeconvFunc(ydata,
+                 ystrides,
                  ycovar,
+                 cstrides,
                  projection,
+                 pstrides,
                  logweights,
+                 ctypes.c_longlong(wstride),
                  ctypes.c_int(ndata),
                  ctypes.c_int(dataDim),
                  xamp_tmp,
@@ -457,32 +890,1269 @@ def extreme_deconvolution(ydata,ycovar,
                  ctypes.c_char_p(fixcovar),
                  avgloglikedata,
                  ctypes.c_double(tol),
-                 ctypes.c_int(maxiter),
-                 ctypes.c_char(chr(likeonly)),
+                 ctypes.c_longlong(maxiter),
+                 ctypes.c_bool(likeonly),
                  ctypes.c_double(w),
-                 ctypes.create_string_buffer(clog),
-                 ctypes.c_int(n_clog),
+                 clog,
                  ctypes.c_int(splitnmerge),
-                 ctypes.create_string_buffer(clog2),
-                 ctypes.c_int(n_clog2),
-                 ctypes.c_char(chr(noprojection)),
-                 ctypes.c_char(chr(diagerrors)),
-                 ctypes.c_char(chr(noweight)))
-    #Reset input arrays
-    if f_cont[0]: ydata= nu.asfortranarray(ydata)
-    if f_cont[1]: ycovar= nu.asfortranarray(ycovar)
-    if f_cont[2]: projection= nu.asfortranarray(projection)
-    if f_cont[3]: logweights= nu.asfortranarray(logweights)
-    if f_cont[4]: xamp_tmp=  nu.asfortranarray(xamp_tmp)
-    if f_cont[5]: xmean_tmp=  nu.asfortranarray(xmean_tmp)
-    if f_cont[6]: xcovar_tmp=  nu.asfortranarray(xcovar_tmp)
+                 clog2,
+                 ctypes.c_bool(noprojection),
+                 ctypes.c_bool(diagerrors),
+                 ctypes.c_bool(noweight),
+                 ctypes.c_int(chunksize),
+                 ctypes.byref(options))
 
     xamp[0:ngauss]= xamp_tmp
     xmean[0:ngauss,0:gaussDim]= xmean_tmp
     xcovar[0:ngauss,0:gaussDim,0:gaussDim]= xcovar_tmp
 
+    if fullresult:
+        result= XDResult(avgloglikedata.contents.value,options,stats,
+                         steploglike,smoothloglike,stepexp)
+        _lib.free_xdstats(ctypes.byref(stats))
+        return result
     return avgloglikedata.contents.value
 
+def _calc_loglike(ydata,ycovar,xamp,xmean,xcovar,projection,calcpost,
+                  calcx=False):
+    """Internal function to run the C scoring kernel, returns the log
+    likelihoods, the log posterior probabilities (if calcpost), and the
+    posterior means and covariances of x (if calcx)"""
+    ndata= ydata.shape[0]
+    dataDim= ydata.shape[1]
+    ngauss= len(xamp)
+    gaussDim= xmean.shape[1]
+
+    if len(ycovar.shape) == 2:
+        diagerrors= True
+    else:
+        diagerrors= False
+
+    if projection is None:
+        noprojection= True
+        projection= nu.zeros(1)
+    else:
+        noprojection= False
+
+    loglikeFunc= _lib.calc_loglike
+
+    ydata= nu.require(ydata,dtype=nu.float64,requirements=['C'])
+    ycovar= nu.require(ycovar,dtype=nu.float64,requirements=['C'])
+    projection= nu.require(projection,dtype=nu.float64,requirements=['C'])
+    xamp= nu.require(xamp,dtype=nu.float64,requirements=['C'])
+    xmean= nu.require(xmean,dtype=nu.float64,requirements=['C'])
+    xcovar= nu.require(xcovar,dtype=nu.float64,requirements=['C'])
+    loglike= nu.empty(ndata)
+    if calcpost:
+        logpost= nu.empty((ndata,ngauss))
+        logpost_ptr= logpost.ctypes.data_as(ctypes.c_void_p)
+    else:
+        logpost= None
+        logpost_ptr= None
+    if calcx:
+        xpostmean= nu.empty((ndata,gaussDim))
+        xpostcovar= nu.empty((ndata,gaussDim,gaussDim))
+        xpostmean_ptr= xpostmean.ctypes.data_as(ctypes.c_void_p)
+        xpostcovar_ptr= xpostcovar.ctypes.data_as(ctypes.c_void_p)
+    else:
+        xpostmean= xpostcovar= None
+        xpostmean_ptr= xpostcovar_ptr= None
+
+    loglikeFunc(ydata,
+                ycovar,
+                projection,
+                ctypes.c_int(ndata),
+                ctypes.c_int(dataDim),
+                xamp,
+                xmean,
+                xcovar,
+                ctypes.c_int(gaussDim),
+                ctypes.c_int(ngauss),
+                loglike,
+                logpost_ptr,
+                xpostmean_ptr,
+                xpostcovar_ptr,
+                ctypes.c_char(chr(noprojection)),
+                ctypes.c_char(chr(diagerrors)))
+    return (loglike,logpost,xpostmean,xpostcovar)
+
+def score_samples(ydata,ycovar,xamp,xmean,xcovar,projection=None):
+    """
+    NAME:
+       score_samples
+    PURPOSE:
+       compute the log likelihood of each data point under the
+       error-convolved mixture, without running EM (Python counterpart
+       of addons/calc_loglike.pro)
+    INPUT:
+       ydata - [ndata,dy] numpy array of observed quantities
+       ycovar - [ndata,dy(,dy)] numpy array of observational error covariances
+                (if [ndata,dy] then the error correlations are assumed to vanish)
+       xamp - [ngauss] numpy array of amplitudes
+       xmean - [ngauss,dx] numpy array of means
+       xcovar - [ngauss,dx,dx] numpy array of covariances
+    OPTIONAL INPUTS:
+       projection - [ndata,dy,dx] numpy array of projection matrices
+    OUTPUT:
+       [ndata] numpy array of log likelihoods
+    HISTORY:
+       2026-10-18 - Written
+    """
+    return _calc_loglike(ydata,ycovar,xamp,xmean,xcovar,projection,False)[0]
+
+def membership_prob(ydata,ycovar,xamp,xmean,xcovar,projection=None,
+                    log=False):
+    """
+    NAME:
+       membership_prob
+    PURPOSE:
+       compute the posterior probability for each data point to belong
+       to each of the components of the error-convolved mixture, without
+       running EM (Python counterpart of addons/calc_membership_prob.pro)
+    INPUT:
+       ydata - [ndata,dy] numpy array of observed quantities
+       ycovar - [ndata,dy(,dy)] numpy array of observational error covariances
+                (if [ndata,dy] then the error correlations are assumed to vanish)
+       xamp - [ngauss] numpy array of amplitudes
+       xmean - [ngauss,dx] numpy array of means
+       xcovar - [ngauss,dx,dx] numpy array of covariances
+    OPTIONAL INPUTS:
+       projection - [ndata,dy,dx] numpy array of projection matrices
+       log - (Bool, default=False) return the log of the posterior
+             probabilities
+    OUTPUT:
+       [ndata,ngauss] numpy array of (log) posterior probabilities
+    HISTORY:
+       2026-10-18 - Written
+    """
+    logpost= _calc_loglike(ydata,ycovar,xamp,xmean,xcovar,projection,True)[1]
+    if log:
+        return logpost
+    else:
+        return nu.exp(logpost)
+
+def deconvolve(ydata,ycovar,xamp,xmean,xcovar,projection=None,
+               condition=None):
+    """
+    NAME:
+       deconvolve
+    PURPOSE:
+       compute the posterior mean and covariance of the deconvolved
+       (error-free) x of each data point under the mixture, i.e., the bij
+       and Bij of the E-step mixed over the components by the posterior
+       probabilities, without running EM
+    INPUT:
+       ydata - [ndata,dy] numpy array of observed quantities
+       ycovar - [ndata,dy(,dy)] numpy array of observational error covariances
+                (if [ndata,dy] then the error correlations are assumed to vanish)
+       xamp - [ngauss] numpy array of amplitudes
+       xmean - [ngauss,dx] numpy array of means
+       xcovar - [ngauss,dx,dx] numpy array of covariances
+    OPTIONAL INPUTS:
+       projection - [ndata,dy,dx] numpy array of projection matrices
+       condition - indices (or a boolean mask) of the dimensions of ydata
+                   to condition on; the other dimensions are treated as
+                   unobserved (default: all dimensions); e.g., to predict
+                   some dimensions of x from the others, set the errors of
+                   the known dimensions to zero and condition on them
+    OUTPUT:
+       ([ndata,dx] numpy array of posterior means,
+        [ndata,dx,dx] numpy array of posterior covariances)
+    HISTORY:
+       2026-10-18 - Written
+    """
+    if condition is not None:
+        condition= nu.arange(ydata.shape[1])[condition]
+        ydata= ydata[:,condition]
+        if len(ycovar.shape) == 2:
+            ycovar= ycovar[:,condition]
+        else:
+            ycovar= ycovar[:,condition][:,:,condition]
+        if projection is None:
+            projection= nu.broadcast_to(nu.eye(xmean.shape[1])[condition],
+                                        (ydata.shape[0],len(condition),
+                                         xmean.shape[1]))
+        else:
+            projection= projection[:,condition]
+    return tuple(_calc_loglike(ydata,ycovar,xamp,xmean,xcovar,projection,
+                               False,calcx=True)[2:])
+
+def batch_extreme_deconvolution(ydata,ycovar,xamp,xmean,xcovar,
+                                projection=None,weight=None,
+                                fixamp=None,fixmean=None,fixcovar=None,
+                                tol=1.e-6,maxiter=long(1e9),w=0.,
+                                splitnmerge=0,maxsnm=False,likeonly=False,
+                                logweight=False,ndata=None,ngauss=None):
+    """
+    NAME:
+       batch_extreme_deconvolution
+    PURPOSE:
+       run extreme deconvolution on many independent problems at once,
+       fitting different problems in parallel (rather than parallelizing
+       each fit over its data points); use this for many small problems
+    INPUT:
+       ydata - list of [ndata,dy] numpy arrays of observed quantities, one
+               per problem, or a single [sum(ndata),dy] array with all
+               problems one after the other (set ndata=)
+       ycovar - list of [ndata,dy(,dy)] numpy arrays of observational error
+                covariances (or a single concatenated array)
+       xamp - list of [ngauss] numpy arrays of initial amplitudes, or a
+              single [sum(ngauss)] array (set ngauss=)
+       xmean - list of [ngauss,dx] numpy arrays of initial means (or a
+               single concatenated array)
+       xcovar - list of [ngauss,dx,dx] numpy arrays of initial covariances
+                (or a single concatenated array)
+    OPTIONAL INPUTS:
+       projection - list of [ndata,dy,dx] numpy arrays of projection
+                    matrices (or a single concatenated array)
+       weight - list of [ndata] numpy arrays of weights (or a single
+                concatenated array)
+       logweight - (bool, default=False) if True, weight is actually
+                   log(weight)
+       fixamp, fixmean, fixcovar - (default=None) None or True/False for
+                                   all problems, or a list with an entry
+                                   for each problem, as in
+                                   extreme_deconvolution
+       ndata - [nproblem] number of data points of each problem, when
+               the data are given as concatenated arrays
+       ngauss - [nproblem] number of gaussians of each problem, when the
+                initial conditions are given as concatenated arrays
+       tol, maxiter, w, splitnmerge, maxsnm, likeonly - as in
+                   extreme_deconvolution, the same for all problems
+    OUTPUT:
+       (avgloglikedata,niter,converged), each a [nproblem] numpy array
+       with the average log likelihood after convergence, the total
+       number of EM iterations, and whether the fit converged to within
+       tol (rather than stopping at maxiter)
+       +updated xamp, xmean, xcovar
+    HISTORY:
+       2026-10-18 - Written
+    """
+    if ndata is None:
+        ndata= [len(y) for y in ydata]
+        ydata= nu.concatenate([nu.asarray(y,dtype=nu.float64)
+                               for y in ydata])
+        ycovar= nu.concatenate([nu.asarray(y,dtype=nu.float64)
+                                for y in ycovar])
+        if not projection is None:
+            projection= nu.concatenate([nu.asarray(p,dtype=nu.float64)
+                                        for p in projection])
+        if not weight is None:
+            weight= nu.concatenate([nu.asarray(ww,dtype=nu.float64)
+                                    for ww in weight])
+    ndata= nu.require(ndata,dtype=nu.intc,requirements=['C'])
+    nproblem= len(ndata)
+    if ngauss is None:
+        xlist= (xamp,xmean,xcovar)
+        ngauss= [len(a) for a in xamp]
+        xamp_tmp= nu.concatenate([nu.asarray(a,dtype=nu.float64)
+                                  for a in xamp])
+        xmean_tmp= nu.concatenate([nu.asarray(m,dtype=nu.float64)
+                                   for m in xmean])
+        xcovar_tmp= nu.concatenate([nu.asarray(c,dtype=nu.float64)
+                                    for c in xcovar])
+    else:
+        xlist= None
+        xamp_tmp= nu.require(xamp,dtype=nu.float64,requirements=['C','W'])
+        xmean_tmp= nu.require(xmean,dtype=nu.float64,requirements=['C','W'])
+        xcovar_tmp= nu.require(xcovar,dtype=nu.float64,
+                               requirements=['C','W'])
+    ngauss= nu.require(ngauss,dtype=nu.intc,requirements=['C'])
+    dataDim= ydata.shape[1]
+    gaussDim= xmean_tmp.shape[1]
+
+    if len(ycovar.shape) == 2:
+        diagerrors= True
+    else:
+        diagerrors= False
+
+    fixs= []
+    for fix in [fixamp,fixmean,fixcovar]:
+        if fix is None or isinstance(fix,(bool,nu.bool_)):
+            fix= [fix for pp in range(nproblem)]
+        fix= [_fix2chararray(fix[pp],ngauss[pp]) for pp in range(nproblem)]
+        if _PY3: #pragma: no cover
+            fixs.append(b''.join(fix))
+        else:
+            fixs.append(''.join(fix))
+
+    if maxsnm:
+        splitnmerge= long(nu.amax(ngauss*(ngauss-1)*(ngauss-2)//2))
+
+    if projection is None:
+        noprojection= True
+        projection= nu.zeros(1)
+    else:
+        noprojection= False
+    noweight, logweights= _logweights(weight,logweight)
+
+    ydata= nu.require(ydata,dtype=nu.float64,requirements=['C'])
+    ycovar= nu.require(ycovar,dtype=nu.float64,requirements=['C'])
+    projection= nu.require(projection,dtype=nu.float64,requirements=['C'])
+    logweights= nu.require(logweights,dtype=nu.float64,requirements=['C'])
+    avgloglikedata= nu.zeros(nproblem)
+    niter= nu.zeros(nproblem,dtype=nu.longlong)
+    converged= nu.zeros(nproblem,dtype=nu.int8)
+
+    _lib.batch_proj_gauss_mixtures(ctypes.c_int(nproblem),
+                                   ydata,
+                                   ycovar,
+                                   projection,
+                                   logweights,
+                                   ndata,
+                                   ctypes.c_int(dataDim),
+                                   xamp_tmp,
+                                   xmean_tmp,
+                                   xcovar_tmp,
+                                   ctypes.c_int(gaussDim),
+                                   ngauss,
+                                   ctypes.c_char_p(fixs[0]),
+                                   ctypes.c_char_p(fixs[1]),
+                                   ctypes.c_char_p(fixs[2]),
+                                   avgloglikedata,
+                                   ctypes.c_double(tol),
+                                   ctypes.c_longlong(maxiter),
+                                   ctypes.c_char(chr(likeonly)),
+                                   ctypes.c_double(w),
+                                   ctypes.c_int(splitnmerge),
+                                   ctypes.c_char(chr(noprojection)),
+                                   ctypes.c_char(chr(diagerrors)),
+                                   ctypes.c_char(chr(noweight)),
+                                   niter,
+                                   converged)
+    #Copy the results back into the input arrays
+    if xlist is None:
+        xamp[...]= xamp_tmp
+        xmean[...]= xmean_tmp
+        xcovar[...]= xcovar_tmp
+    else:
+        offset= nu.cumsum(nu.append(0,ngauss))
+        for pp in range(nproblem):
+            xamp[pp][...]= xamp_tmp[offset[pp]:offset[pp+1]]
+            xmean[pp][...]= xmean_tmp[offset[pp]:offset[pp+1]]
+            xcovar[pp][...]= xcovar_tmp[offset[pp]:offset[pp+1]]
+    return (avgloglikedata,niter.astype(int),converged.astype(bool))
+
+def multistart_extreme_deconvolution(ydata,ycovar,xamp,xmean,xcovar,
+                                     projection=None,weight=None,
+                                     fixamp=None,fixmean=None,fixcovar=None,
+                                     tol=1.e-6,maxiter=long(1e9),w=0.,
+                                     splitnmerge=0,maxsnm=False,
+                                     logweight=False,pruneiter=20,
+                                     prunetol=0.1):
+    """
+    NAME:
+       multistart_extreme_deconvolution
+    PURPOSE:
+       run extreme deconvolution from several initial conditions on the
+       same data, to find the best of the local maxima of the likelihood;
+       the restarts run in parallel on a single copy of the data, and
+       restarts that trail the best one after a few iterations are pruned
+    INPUT:
+       ydata, ycovar - data and error covariances, as in
+                       extreme_deconvolution
+       xamp - [nstart,ngauss] numpy array of initial amplitudes of every
+              restart
+       xmean - [nstart,ngauss,dx] numpy array of initial means
+       xcovar - [nstart,ngauss,dx,dx] numpy array of initial covariances
+    OPTIONAL INPUTS:
+       projection, weight, logweight, fixamp, fixmean, fixcovar, tol,
+       maxiter, w, splitnmerge, maxsnm - as in extreme_deconvolution, the
+                   same for all restarts (split 'n' merge is only done for
+                   the restarts that are not pruned)
+       pruneiter - (int, default=20) number of EM iterations after which
+                   to prune restarts (0: don't prune)
+       prunetol - (double, default=0.1) prune the restarts whose average
+                  log likelihood after pruneiter iterations is less than
+                  that of the best restart minus prunetol
+    OUTPUT:
+       (best,avgloglikedata,niter,converged,pruned): best is the index of
+       the restart with the largest likelihood, the others are [nstart]
+       numpy arrays with the average log likelihood of every restart, its
+       total number of EM iterations, whether it converged to within tol,
+       and whether it was pruned (its model and likelihood are then those
+       after pruneiter iterations)
+       +updated xamp, xmean, xcovar of every restart; the best model is
+       xamp[best], xmean[best], xcovar[best]
+    HISTORY:
+       2026-10-18 - Written
+    """
+    nstart= len(xamp)
+    ndata= ydata.shape[0]
+    dataDim= ydata.shape[1]
+    ngauss= len(xamp[0])
+    gaussDim= xmean[0].shape[1]
+
+    if len(ycovar.shape) == 2:
+        diagerrors= True
+    else:
+        diagerrors= False
+
+    fixamp= _fix2chararray(fixamp,ngauss)
+    fixmean= _fix2chararray(fixmean,ngauss)
+    fixcovar= _fix2chararray(fixcovar,ngauss)
+
+    if maxsnm:
+        splitnmerge = long(ngauss*(ngauss-1)*(ngauss-2)/2)
+
+    #The data are viewed in place by all restarts
+    ydata,ystrides,ycovar,cstrides,projection,pstrides,logweights,wstride,\
+        noprojection,noweight= \
+        _strided_data(ydata,ycovar,projection,weight,logweight,diagerrors)
+    xamp_tmp= nu.require(xamp,dtype=nu.float64,requirements=['C','W'])
+    xmean_tmp= nu.require(xmean,dtype=nu.float64,requirements=['C','W'])
+    xcovar_tmp= nu.require(xcovar,dtype=nu.float64,requirements=['C','W'])
+    avgloglikedata= nu.zeros(nstart)
+    niter= nu.zeros(nstart,dtype=nu.longlong)
+    converged= nu.zeros(nstart,dtype=nu.int8)
+    pruned= nu.zeros(nstart,dtype=nu.int8)
+
+    best= _lib.multistart_proj_gauss_mixtures(ctypes.c_int(nstart),
+                                              ydata,
+                                              ystrides,
+                                              ycovar,
+                                              cstrides,
+                                              projection,
+                                              pstrides,
+                                              logweights,
+                                              ctypes.c_longlong(wstride),
+                                              ctypes.c_int(ndata),
+                                              ctypes.c_int(dataDim),
+                                              xamp_tmp,
+                                              xmean_tmp,
+                                              xcovar_tmp,
+                                              ctypes.c_int(gaussDim),
+                                              ctypes.c_int(ngauss),
+                                              ctypes.c_char_p(fixamp),
+                                              ctypes.c_char_p(fixmean),
+                                              ctypes.c_char_p(fixcovar),
+                                              avgloglikedata,
+                                              ctypes.c_double(tol),
+                                              ctypes.c_longlong(maxiter),
+                                              ctypes.c_double(w),
+                                              ctypes.c_int(splitnmerge),
+                                              ctypes.c_char(chr(noprojection)),
+                                              ctypes.c_char(chr(diagerrors)),
+                                              ctypes.c_char(chr(noweight)),
+                                              ctypes.c_longlong(pruneiter),
+                                              ctypes.c_double(prunetol),
+                                              niter,
+                                              converged,
+                                              pruned)
+    #Copy the results back into the input arrays
+    for ii in range(nstart):
+        xamp[ii][...]= xamp_tmp[ii]
+        xmean[ii][...]= xmean_tmp[ii]
+        xcovar[ii][...]= xcovar_tmp[ii]
+    return (best,avgloglikedata,niter.astype(int),converged.astype(bool),
+            pruned.astype(bool))
+
+def resample_extreme_deconvolution(ydata,ycovar,xamp,xmean,xcovar,
+                                   method='jackknife',nresample=100,
+                                   projection=None,weight=None,
+                                   logweight=False,fixamp=None,fixmean=None,
+                                   fixcovar=None,tol=1.e-6,
+                                   maxiter=long(1e9),w=0.,splitnmerge=0,
+                                   maxsnm=False,seed=None):
+    """
+    NAME:
+       resample_extreme_deconvolution
+    PURPOSE:
+       estimate the uncertainties of the best-fit parameters by fitting
+       jackknife or bootstrap resamples of the data (Python counterpart of
+       addons/exd_jackerr.pro); every resample is warm-started from the
+       best fit to all of the data, the resamples run in parallel, and
+       their data points refer to the data in place rather than to copies
+    INPUT:
+       ydata, ycovar - data and error covariances, as in
+                       extreme_deconvolution
+       xamp, xmean, xcovar - best fit to all of the data
+    OPTIONAL INPUTS:
+       method - (default='jackknife') 'jackknife': leave out each of
+                nresample random groups of the data in turn, or
+                'bootstrap': draw nresample resamples of ndata data points
+                with replacement
+       nresample - (int, default=100) number of resamples
+       projection, weight, logweight, fixamp, fixmean, fixcovar, tol,
+       maxiter, w, splitnmerge, maxsnm - as in extreme_deconvolution
+       seed - (int, default=None) seed of the random number generator
+    OUTPUT:
+       dictionary with
+          xamperr, xmeanerr, xcovarerr - [ngauss], [ngauss,dx],
+                                         [ngauss,dx,dx] uncertainties
+          cov - covariance matrix of the parameters xamp, xmean, and the
+                upper triangle (row by row) of every xcovar, in that order
+          xamp, xmean, xcovar - [nresample,...] best fits to the resamples
+          avgloglikedata, niter, converged - [nresample] as in
+                                             batch_extreme_deconvolution
+    HISTORY:
+       2026-10-18 - Written
+    """
+    if method.lower() not in ['jackknife','bootstrap']:
+        raise ValueError("method has to be 'jackknife' or 'bootstrap'")
+    bootstrap= method.lower() == 'bootstrap'
+    ndata= ydata.shape[0]
+    dataDim= ydata.shape[1]
+    ngauss= len(xamp)
+    gaussDim= xmean.shape[1]
+    if not bootstrap and nresample > ndata:
+        raise ValueError('the jackknife cannot have more resamples than data points')
+
+    if len(ycovar.shape) == 2:
+        diagerrors= True
+    else:
+        diagerrors= False
+
+    fixamp= _fix2chararray(fixamp,ngauss)
+    fixmean= _fix2chararray(fixmean,ngauss)
+    fixcovar= _fix2chararray(fixcovar,ngauss)
+
+    if maxsnm:
+        splitnmerge = long(ngauss*(ngauss-1)*(ngauss-2)/2)
+
+    #Jackknife groups of about equal size
+    rng= nu.random.RandomState(seed)
+    group= nu.zeros(ndata,dtype=nu.intc)
+    group[rng.permutation(ndata)]= nu.arange(ndata) % nresample
+    #The data are viewed in place by all resamples
+    ydata,ystrides,ycovar,cstrides,projection,pstrides,logweights,wstride,\
+        noprojection,noweight= \
+        _strided_data(ydata,ycovar,projection,weight,logweight,diagerrors)
+    #Warm starts
+    ramp= nu.tile(nu.asarray(xamp,dtype=nu.float64),(nresample,1))
+    rmean= nu.tile(nu.asarray(xmean,dtype=nu.float64),(nresample,1,1))
+    rcovar= nu.tile(nu.asarray(xcovar,dtype=nu.float64),(nresample,1,1,1))
+    avgloglikedata= nu.zeros(nresample)
+    niter= nu.zeros(nresample,dtype=nu.longlong)
+    converged= nu.zeros(nresample,dtype=nu.int8)
+
+    _lib.resample_proj_gauss_mixtures(ctypes.c_int(nresample),
+                                      ctypes.c_char(chr(bootstrap)),
+                                      group,
+                                      ctypes.c_ulong(rng.randint(2**31)),
+                                      ydata,
+                                      ystrides,
+                                      ycovar,
+                                      cstrides,
+                                      projection,
+                                      pstrides,
+                                      logweights,
+                                      ctypes.c_longlong(wstride),
+                                      ctypes.c_int(ndata),
+                                      ctypes.c_int(dataDim),
+                                      ramp,
+                                      rmean,
+                                      rcovar,
+                                      ctypes.c_int(gaussDim),
+                                      ctypes.c_int(ngauss),
+                                      ctypes.c_char_p(fixamp),
+                                      ctypes.c_char_p(fixmean),
+                                      ctypes.c_char_p(fixcovar),
+                                      avgloglikedata,
+                                      ctypes.c_double(tol),
+                                      ctypes.c_longlong(maxiter),
+                                      ctypes.c_double(w),
+                                      ctypes.c_int(splitnmerge),
+                                      ctypes.c_char(chr(noprojection)),
+                                      ctypes.c_char(chr(diagerrors)),
+                                      ctypes.c_char(chr(noweight)),
+                                      niter,
+                                      converged)
+    #Covariance of the parameters
+    triu= nu.triu_indices(gaussDim)
+    params= nu.hstack([ramp,rmean.reshape(nresample,-1),
+                       rcovar[:,:,triu[0],triu[1]].reshape(nresample,-1)])
+    if bootstrap:
+        cov= nu.atleast_2d(nu.cov(params,rowvar=False))
+    else:
+        delta= params-nu.mean(params,axis=0)
+        cov= (nresample-1.)/nresample*nu.dot(delta.T,delta)
+    err= nu.sqrt(nu.diag(cov))
+    xcovarerr= nu.zeros((ngauss,gaussDim,gaussDim))
+    xcovarerr[:,triu[0],triu[1]]= \
+        err[ngauss*(1+gaussDim):].reshape(ngauss,-1)
+    xcovarerr[:,triu[1],triu[0]]= xcovarerr[:,triu[0],triu[1]]
+    return {'xamperr':err[:ngauss],
+            'xmeanerr':err[ngauss:ngauss*(1+gaussDim)]\
+                .reshape(ngauss,gaussDim),
+            'xcovarerr':xcovarerr,
+            'cov':cov,
+            'xamp':ramp,'xmean':rmean,'xcovar':rcovar,
+            'avgloglikedata':avgloglikedata,
+            'niter':niter.astype(int),
+            'converged':converged.astype(bool)}
+
+def crossvalidate_extreme_deconvolution(ydata,ycovar,xamp,xmean,xcovar,
+                                        w=[0.],nfold=5,projection=None,
+                                        weight=None,logweight=False,
+                                        fixamp=None,fixmean=None,
+                                        fixcovar=None,tol=1.e-6,
+                                        maxiter=long(1e9),splitnmerge=0,
+                                        maxsnm=False,seed=None):
+    """
+    NAME:
+       crossvalidate_extreme_deconvolution
+    PURPOSE:
+       k-fold cross-validation of extreme_deconvolution over a grid of
+       regularization parameters w; the folds are fit in parallel, the fit
+       for every w is warm-started from that for the previous (smaller) w,
+       and the held-out data are scored in place, factorizing the
+       convolved covariance of every gaussian only once for data points
+       that share the same error covariance and projection (e.g., when
+       ycovar is a numpy.broadcast_to array)
+    INPUT:
+       ydata, ycovar - data and error covariances, as in
+                       extreme_deconvolution
+       xamp, xmean, xcovar - initial model, the starting point of the fit
+                             of every fold for the smallest w (not
+                             changed)
+    OPTIONAL INPUTS:
+       w - (default=[0.]) regularization parameters to sweep
+       nfold - (int, default=5) number of folds
+       projection, weight, logweight, fixamp, fixmean, fixcovar, tol,
+       maxiter, splitnmerge, maxsnm - as in extreme_deconvolution
+       seed - (int, default=None) seed of the random assignment of the data
+              points to folds
+    OUTPUT:
+       dictionary with
+          w - [nw] sorted regularization parameters
+          train, heldout - [nfold,nw] average log likelihood of the data
+                           outside of and in every fold (with weight,
+                           of the weighted log likelihoods, as in the
+                           fit)
+          avgtrain, avgheldout - [nw] average log likelihood of all
+                                 training and held-out data points
+          heldouterr - [nw] standard error of avgheldout over the folds
+          best - index of the w with the largest avgheldout
+          xamp, xmean, xcovar - [nfold,nw,...] fit to every fold for every w
+          niter, converged - [nfold,nw] as in batch_extreme_deconvolution
+    HISTORY:
+       2026-10-18 - Written
+    """
+    ndata= ydata.shape[0]
+    dataDim= ydata.shape[1]
+    ngauss= len(xamp)
+    gaussDim= xmean.shape[1]
+    if nfold < 2 or nfold > ndata:
+        raise ValueError('nfold has to be between 2 and the number of data points')
+    ws= nu.unique(nu.atleast_1d(nu.asarray(w,dtype=nu.float64)))
+    nw= len(ws)
+
+    if len(ycovar.shape) == 2:
+        diagerrors= True
+    else:
+        diagerrors= False
+
+    fixamp= _fix2chararray(fixamp,ngauss)
+    fixmean= _fix2chararray(fixmean,ngauss)
+    fixcovar= _fix2chararray(fixcovar,ngauss)
+
+    if maxsnm:
+        splitnmerge = long(ngauss*(ngauss-1)*(ngauss-2)/2)
+
+    #Folds of about equal size
+    rng= nu.random.RandomState(seed)
+    fold= nu.zeros(ndata,dtype=nu.intc)
+    fold[rng.permutation(ndata)]= nu.arange(ndata) % nfold
+    #The data are viewed in place by all folds
+    ydata,ystrides,ycovar,cstrides,projection,pstrides,logweights,wstride,\
+        noprojection,noweight= \
+        _strided_data(ydata,ycovar,projection,weight,logweight,diagerrors)
+    #Every fold starts from the initial model
+    famp= nu.zeros((nfold,nw,ngauss))
+    fmean= nu.zeros((nfold,nw,ngauss,gaussDim))
+    fcovar= nu.zeros((nfold,nw,ngauss,gaussDim,gaussDim))
+    famp[:,0]= xamp
+    fmean[:,0]= xmean
+    fcovar[:,0]= xcovar
+    train= nu.zeros((nfold,nw))
+    heldout= nu.zeros((nfold,nw))
+    niter= nu.zeros((nfold,nw),dtype=nu.longlong)
+    converged= nu.zeros((nfold,nw),dtype=nu.int8)
+
+    _lib.crossvalidate_proj_gauss_mixtures(ctypes.c_int(nfold),
+                                           fold,
+                                           ctypes.c_int(nw),
+                                           ws,
+                                           ydata,
+                                           ystrides,
+                                           ycovar,
+                                           cstrides,
+                                           projection,
+                                           pstrides,
+                                           logweights,
+                                           ctypes.c_longlong(wstride),
+                                           ctypes.c_int(ndata),
+                                           ctypes.c_int(dataDim),
+                                           famp,
+                                           fmean,
+                                           fcovar,
+                                           ctypes.c_int(gaussDim),
+                                           ctypes.c_int(ngauss),
+                                           ctypes.c_char_p(fixamp),
+                                           ctypes.c_char_p(fixmean),
+                                           ctypes.c_char_p(fixcovar),
+                                           train,
+                                           heldout,
+                                           ctypes.c_double(tol),
+                                           ctypes.c_longlong(maxiter),
+                                           ctypes.c_int(splitnmerge),
+                                           ctypes.c_char(chr(noprojection)),
+                                           ctypes.c_char(chr(diagerrors)),
+                                           ctypes.c_char(chr(noweight)),
+                                           niter,
+                                           converged)
+    #Averages over all data points, weighting every fold by its size
+    nheldout= nu.bincount(fold,minlength=nfold)[:,None]
+    avgtrain= nu.sum((ndata-nheldout)*train,axis=0)/((nfold-1.)*ndata)
+    avgheldout= nu.sum(nheldout*heldout,axis=0)/float(ndata)
+    return {'w':ws,
+            'train':train,'heldout':heldout,
+            'avgtrain':avgtrain,'avgheldout':avgheldout,
+            'heldouterr':nu.std(heldout,axis=0)/nu.sqrt(nfold-1.),
+            'best':int(nu.argmax(avgheldout)),
+            'xamp':famp,'xmean':fmean,'xcovar':fcovar,
+            'niter':niter.astype(int),
+            'converged':converged.astype(bool)}
+
+def _split_gauss(xamp,xmean,xcovar,l,rng):
+    """Internal function that splits gaussian l in two, as the split of
+    splitnmergegauss: each half gets half of the amplitude, an isotropic
+    covariance with the same determinant, and a randomly offset mean"""
+    dx= xmean.shape[1]
+    scale= nu.linalg.det(xcovar[l])**(1./dx)
+    xamp= nu.append(xamp,0.5*xamp[l])
+    xamp[l]*= 0.5
+    xmean= nu.append(xmean,xmean[l:l+1],axis=0)
+    xcovar= nu.append(xcovar,xcovar[l:l+1],axis=0)
+    for kk in [l,-1]:
+        xcovar[kk]= scale*nu.eye(dx)
+        xmean[kk]+= (2.*rng.uniform(size=dx)-1.)*nu.sqrt(scale/dx)
+    return (xamp,xmean,xcovar)
+
+def select_ngauss(ydata,ycovar,ngauss,xamp=None,xmean=None,xcovar=None,
+                  projection=None,weight=None,logweight=False,
+                  tol=1.e-6,maxiter=long(1e9),w=0.,splitnmerge=0,
+                  accelerate=False,heldout=None,seed=None):
+    """
+    NAME:
+       select_ngauss
+    PURPOSE:
+       fit a range of numbers of gaussians, warm-starting every fit from
+       the previous one by splitting its worst-fitting gaussians, and
+       compute model-selection criteria; every fit runs in parallel over
+       the data points, as extreme_deconvolution does
+    INPUT:
+       ydata, ycovar - data and error covariances, as in
+                       extreme_deconvolution
+       ngauss - increasing list of numbers of gaussians to fit
+    OPTIONAL INPUTS:
+       xamp, xmean, xcovar - initial conditions for ngauss[0] gaussians
+                             (default: from kmeans_init, which is only
+                             possible without projection)
+       projection, weight, logweight, tol, maxiter, w, splitnmerge,
+       accelerate - as in extreme_deconvolution
+       heldout - (default=None) held-out data to compute the log
+                 likelihood of, (ydata,ycovar) or (ydata,ycovar,projection)
+       seed - (int, default=None) seed of the random number generator for
+              the initial conditions and the splits
+    OUTPUT:
+       dictionary with [len(ngauss)] numpy arrays
+          ngauss - the numbers of gaussians
+          avgloglikedata - average log likelihood of the data
+          aic - Akaike information criterion, -2 N avgloglike + 2 npar
+          bic - Bayesian information criterion, -2 N avgloglike + npar log N
+          mdl - minimum description length, -N avgloglike + npar log(N)/2
+          heldout - average log likelihood of the held-out data (if given)
+       with npar= ngauss (1 + dx + dx (dx+1)/2) - 1 free parameters, and
+       lists xamp, xmean, xcovar of the best-fit model for each ngauss;
+       the worst-fitting gaussian is the one with the largest
+       Kullback-Leibler divergence between the local data density and the
+       error-convolved gaussian (Ueda et al. 2000)
+    HISTORY:
+       2026-10-18 - Written
+    """
+    ngauss= [int(k) for k in ngauss]
+    if any([k2 <= k1 for k1,k2 in zip(ngauss[:-1],ngauss[1:])]):
+        raise ValueError('ngauss has to be increasing')
+    rng= nu.random.RandomState(seed)
+    if xamp is None:
+        if projection is not None:
+            raise ValueError('initial conditions are needed when the data are projected')
+        xamp, xmean, xcovar= kmeans_init(ydata,ycovar,ngauss[0],
+                                         seed=rng.randint(2**31))
+    xamp= nu.array(xamp,dtype=nu.float64)
+    xmean= nu.array(xmean,dtype=nu.float64)
+    xcovar= nu.array(xcovar,dtype=nu.float64)
+    if weight is None:
+        dataweight= 1.
+    elif logweight:
+        dataweight= nu.exp(weight)[:,None]
+    else:
+        dataweight= nu.asarray(weight)[:,None]
+    ndata= ydata.shape[0]
+    dx= xmean.shape[1]
+    out= {'ngauss':nu.array(ngauss),'avgloglikedata':[],'heldout':[],
+          'xamp':[],'xmean':[],'xcovar':[]}
+    for ii,K in enumerate(ngauss):
+        #Warm start: split the worst-fitting gaussians of the previous fit
+        if ii > 0:
+            loglike, logpost= _calc_loglike(ydata,ycovar,xamp,xmean,xcovar,
+                                            projection,True)[:2]
+            q= nu.exp(logpost)*dataweight
+            with nu.errstate(divide='ignore',invalid='ignore'):
+                p= q/nu.sum(q,axis=0)
+                logN= logpost+loglike[:,None]-nu.log(xamp)
+                jsplit= nu.nansum(p*(nu.log(p)-logN),axis=0)
+            for l in nu.argsort(-jsplit)[:K-ngauss[ii-1]]:
+                xamp, xmean, xcovar= _split_gauss(xamp,xmean,xcovar,l,rng)
+            #K-ngauss[ii-1] can be more than the number of gaussians
+            while len(xamp) < K:
+                xamp, xmean, xcovar= _split_gauss(xamp,xmean,xcovar,
+                                                  nu.argmax(xamp),rng)
+        out['avgloglikedata'].append(
+            extreme_deconvolution(ydata,ycovar,xamp,xmean,xcovar,
+                                  projection=projection,weight=weight,
+                                  logweight=logweight,tol=tol,
+                                  maxiter=maxiter,w=w,
+                                  splitnmerge=splitnmerge,
+                                  accelerate=accelerate))
+        if heldout is not None:
+            out['heldout'].append(nu.mean(score_samples(heldout[0],
+                                                        heldout[1],
+                                                        xamp,xmean,xcovar,
+                                                        projection=heldout[2] if len(heldout) > 2 else None)))
+        out['xamp'].append(nu.copy(xamp))
+        out['xmean'].append(nu.copy(xmean))
+        out['xcovar'].append(nu.copy(xcovar))
+    out['avgloglikedata']= nu.array(out['avgloglikedata'])
+    if heldout is None:
+        del out['heldout']
+    else:
+        out['heldout']= nu.array(out['heldout'])
+    npar= out['ngauss']*(1+dx+dx*(dx+1)//2)-1
+    out['aic']= -2.*ndata*out['avgloglikedata']+2.*npar
+    out['bic']= -2.*ndata*out['avgloglikedata']+npar*nu.log(ndata)
+    out['mdl']= -ndata*out['avgloglikedata']+0.5*npar*nu.log(ndata)
+    return out
+
+def kmeans_init(ydata,ycovar,ngauss,niter=10,subsample=None,seed=None):
+    """
+    NAME:
+       kmeans_init
+    PURPOSE:
+       initial conditions for extreme_deconvolution from k-means: k-means++
+       seeding followed by Lloyd iterations; the amplitudes are the
+       fractions of the data in each cluster, the means the cluster means,
+       and the covariances the cluster covariances minus the average
+       error covariance of the cluster (as much of it as keeps them
+       positive definite)
+    INPUT:
+       ydata - [ndata,dy] numpy array of observed quantities
+       ycovar - [ndata,dy(,dy)] numpy array of observational error covariances
+                (if [ndata,dy] then the error correlations are assumed to vanish)
+       ngauss - number of gaussians
+    OPTIONAL INPUTS:
+       niter - (int, default=10) maximum number of Lloyd iterations (they
+               stop earlier when no data point changes cluster)
+       subsample - (int, default=None) only use a random subsample of this
+                   many data points, for speed
+       seed - (int, default=None) seed of the random number generator
+              (default: drawn from numpy.random)
+    OUTPUT:
+       (xamp,xmean,xcovar), [ngauss], [ngauss,dy], and [ngauss,dy,dy]
+       numpy arrays that can be given to extreme_deconvolution; projections
+       are not taken into account, so these are only good initial
+       conditions if the data live in the space of the model
+    HISTORY:
+       2026-10-18 - Written
+    """
+    ndata= ydata.shape[0]
+    dataDim= ydata.shape[1]
+    if len(ycovar.shape) == 2:
+        diagerrors= True
+    else:
+        diagerrors= False
+    if subsample is None or subsample >= ndata:
+        subsample= 0
+    if ngauss > (ndata if subsample == 0 else subsample):
+        raise ValueError('k-means needs at least as many data points as gaussians')
+    if seed is None:
+        seed= nu.random.randint(2**31)
+    ydata= nu.require(ydata,dtype=nu.float64,requirements=['C'])
+    ycovar= nu.require(ycovar,dtype=nu.float64,requirements=['C'])
+    xamp= nu.empty(ngauss)
+    xmean= nu.empty((ngauss,dataDim))
+    xcovar= nu.empty((ngauss,dataDim,dataDim))
+    _lib.kmeans_init(ydata,
+                     ycovar,
+                     ctypes.c_int(ndata),
+                     ctypes.c_int(dataDim),
+                     ctypes.c_int(ngauss),
+                     ctypes.c_char(chr(diagerrors)),
+                     ctypes.c_int(niter),
+                     ctypes.c_int(subsample),
+                     ctypes.c_ulong(seed),
+                     xamp,
+                     xmean,
+                     xcovar)
+    return (xamp,xmean,xcovar)
+
+def _alias_table(xamp):
+    """Internal function that sets up Walker's alias table for drawing
+    from the discrete distribution xamp in constant time per draw: draw
+    k uniformly and keep it with probability prob[k], otherwise take
+    alias[k]"""
+    ngauss= len(xamp)
+    prob= ngauss*nu.asarray(xamp,dtype=nu.float64)/nu.sum(xamp)
+    alias= nu.arange(ngauss)
+    small= [kk for kk in range(ngauss) if prob[kk] < 1.]
+    large= [kk for kk in range(ngauss) if prob[kk] >= 1.]
+    while small and large:
+        ss, ll= small.pop(), large.pop()
+        alias[ss]= ll
+        prob[ll]-= 1.-prob[ss]
+        if prob[ll] < 1.:
+            small.append(ll)
+        else:
+            large.append(ll)
+    #What is left is one up to round-off
+    prob[small+large]= 1.
+    return (prob,alias)
+
+def _sqrtm(covar):
+    """Internal function that returns the Cholesky factors of a stack of
+    covariances, or the symmetric square roots of those that are only
+    positive semi-definite"""
+    covar= 0.5*(covar+nu.swapaxes(covar,-1,-2))
+    try:
+        return nu.linalg.cholesky(covar)
+    except nu.linalg.LinAlgError:
+        eigval, eigvec= nu.linalg.eigh(covar)
+        return nu.einsum('...ij,...kj->...ik',
+                         eigvec*nu.sqrt(nu.clip(eigval,0.,None))[...,None,:],
+                         eigvec)
+
+def sample(xamp,xmean,xcovar,nsample,ycovar=None,projection=None,
+           seed=None,label=False,batchsize=65536,_xchol=None):
+    """
+    NAME:
+       sample
+    PURPOSE:
+       draw samples from the (deconvolved) mixture of gaussians, and
+       optionally noisy samples of the observed quantities (Python
+       counterpart of addons/sample_gaussians.pro); the gaussians are
+       factorized once, the labels are drawn from an alias table, and the
+       samples are drawn in vectorized batches, grouped by gaussian
+    INPUT:
+       xamp - [ngauss] numpy array of amplitudes
+       xmean - [ngauss,dx] numpy array of means
+       xcovar - [ngauss,dx,dx] numpy array of covariances
+       nsample - (int) number of samples
+    OPTIONAL INPUTS:
+       ycovar - [nsample,dy(,dy)] numpy array of the error covariance of
+                every sample (if [nsample,dy] then the error correlations
+                are assumed to vanish); an array that repeats the same
+                covariance (e.g., numpy.broadcast_to) is factorized once
+       projection - [nsample,dy,dx] numpy array of projection matrices
+                    (requires ycovar), idem
+       seed - (int, default=None) seed of the random number generator
+              (the samples for a given seed also depend on batchsize)
+       label - (Bool, default=False) also return the gaussian that every
+               sample was drawn from
+       batchsize - (int, default=65536) number of samples drawn at once
+    OUTPUT:
+       [nsample,dx] numpy array of samples x, or (x,y) with the
+       [nsample,dy] numpy array of noisy samples y = projection x + noise
+       if ycovar is given, with the [nsample] numpy array of labels
+       appended if label
+    HISTORY:
+       2026-10-18 - Written
+    """
+    if projection is not None and ycovar is None:
+        raise ValueError('projection requires ycovar')
+    xmean= nu.asarray(xmean,dtype=nu.float64)
+    ngauss, gaussDim= xmean.shape
+    #Factorize everything that is shared by all samples once
+    prob, alias= _alias_table(xamp)
+    if _xchol is None:
+        xchol= _sqrtm(nu.asarray(xcovar,dtype=nu.float64))
+    else:
+        xchol= _xchol
+    noisy= ycovar is not None
+    if noisy:
+        ycovar= nu.asarray(ycovar)
+        if ycovar.shape[0] != nsample \
+                or (projection is not None and len(projection) != nsample):
+            raise ValueError('ycovar and projection have to have nsample rows')
+        if projection is not None \
+                and projection.shape[1:] != (ycovar.shape[1],gaussDim):
+            raise ValueError('projection has to be [nsample,dy,dx]')
+        diagerrors= len(ycovar.shape) == 2
+        dataDim= ycovar.shape[1]
+        sharedcovar= ycovar.strides[0] == 0
+        if sharedcovar:
+            ychol= nu.sqrt(ycovar[0]) if diagerrors else _sqrtm(ycovar[0])
+        if projection is not None:
+            projection= nu.asarray(projection)
+            sharedproj= projection.strides[0] == 0
+        elif dataDim != gaussDim:
+            raise ValueError('ycovar has to have the dimension of xmean if there is no projection')
+    rng= nu.random.RandomState(seed)
+    xsample= nu.empty((nsample,gaussDim))
+    ysample= nu.empty((nsample,dataDim)) if noisy else None
+    labels= nu.empty(nsample,dtype=int)
+    for start in range(0,nsample,batchsize):
+        end= min(start+batchsize,nsample)
+        n= end-start
+        #Labels from the alias table
+        kk= rng.randint(ngauss,size=n)
+        kk= nu.where(rng.uniform(size=n) < prob[kk],kk,alias[kk])
+        labels[start:end]= kk
+        #Samples, one matrix product per gaussian
+        z= rng.standard_normal(size=(n,gaussDim))
+        order= nu.argsort(kk,kind='stable')
+        bounds= nu.cumsum(nu.bincount(kk,minlength=ngauss))
+        x= xsample[start:end]
+        for jj in range(ngauss):
+            indx= order[(bounds[jj-1] if jj > 0 else 0):bounds[jj]]
+            x[indx]= xmean[jj]+nu.dot(z[indx],xchol[jj].T)
+        if not noisy:
+            continue
+        #Noisy samples
+        if projection is None:
+            y= nu.copy(x)
+        elif sharedproj:
+            y= nu.dot(x,projection[0].T)
+        else:
+            y= nu.einsum('nij,nj->ni',projection[start:end],x)
+        z= rng.standard_normal(size=(n,dataDim))
+        if sharedcovar and diagerrors:
+            y+= z*ychol
+        elif sharedcovar:
+            y+= nu.dot(z,ychol.T)
+        elif diagerrors:
+            y+= z*nu.sqrt(ycovar[start:end])
+        else:
+            y+= nu.einsum('nij,nj->ni',_sqrtm(ycovar[start:end]),z)
+        ysample[start:end]= y
+    out= (xsample,ysample) if noisy else (xsample,)
+    if label:
+        out+= (labels,)
+    return out[0] if len(out) == 1 else out
+
+_MODELMAGIC= b'XDMODEL\x00'
+_MODELVERSION= 1
+
+def _logsumexp(logq):
+    """Internal function that returns the log of the summed exp of every
+    row of logq"""
+    maxlogq= nu.amax(logq,axis=1)
+    return maxlogq+nu.log(nu.sum(nu.exp(logq-maxlogq[:,None]),axis=1))
+
+class XDModel(object):
+    """
+    NAME:
+       XDModel
+    PURPOSE:
+       a fitted mixture of gaussians that caches the factorizations of its
+       covariances, such that scoring data without errors does not
+       factorize the covariances again, and that can be saved to a binary
+       file and loaded from it (memory-mapped) without recomputing them
+    INPUT:
+       xamp - [ngauss] numpy array of amplitudes
+       xmean - [ngauss,dx] numpy array of means
+       xcovar - [ngauss,dx,dx] numpy array of (positive definite)
+                covariances
+    ATTRIBUTES:
+       xamp, xmean, xcovar - the model
+       xchol - [ngauss,dx,dx] lower Cholesky factors of xcovar
+       xinv - [ngauss,dx,dx] inverses of xcovar
+       logdet - [ngauss] log determinants of xcovar
+    FILE FORMAT:
+       the header consists of the 8-byte magic string XDMODEL\\0 and the
+       format version, ngauss, and dx as little-endian 64-bit integers;
+       it is followed by xamp, xmean, xcovar, xchol, xinv, and logdet as
+       little-endian 64-bit floats, C-contiguous, in that order
+    HISTORY:
+       2026-10-18 - Written
+    """
+    def __init__(self,xamp,xmean,xcovar,_cache=None):
+        self.xamp= nu.asarray(xamp,dtype=nu.float64)
+        self.xmean= nu.asarray(xmean,dtype=nu.float64)
+        self.xcovar= nu.asarray(xcovar,dtype=nu.float64)
+        if _cache is not None:
+            self.xchol, self.xinv, self.logdet= _cache
+            return None
+        try:
+            self.xchol= nu.linalg.cholesky(self.xcovar)
+        except nu.linalg.LinAlgError:
+            raise ValueError('xcovar has to be positive definite')
+        cholinv= nu.linalg.inv(self.xchol)
+        self.xinv= nu.einsum('kji,kjl->kil',cholinv,cholinv)
+        self.logdet= 2.*nu.sum(nu.log(nu.diagonal(self.xchol,axis1=1,
+                                                  axis2=2)),axis=1)
+
+    @property
+    def ngauss(self):
+        """Number of gaussians"""
+        return len(self.xamp)
+
+    @property
+    def dim(self):
+        """Dimension of the gaussians"""
+        return self.xmean.shape[1]
+
+    def save(self,filename):
+        """
+        NAME:
+           save
+        PURPOSE:
+           save the model and its factorizations to a binary file
+        INPUT:
+           filename - name of the file
+        OUTPUT:
+           (none)
+        HISTORY:
+           2026-10-18 - Written
+        """
+        with open(filename,'wb') as savefile:
+            savefile.write(_MODELMAGIC)
+            nu.array([_MODELVERSION,self.ngauss,self.dim],
+                     dtype='<i8').tofile(savefile)
+            for x in [self.xamp,self.xmean,self.xcovar,self.xchol,
+                      self.xinv,self.logdet]:
+                nu.ascontiguousarray(x,dtype='<f8').tofile(savefile)
+        return None
+
+    @classmethod
+    def load(cls,filename,mmap=True):
+        """
+        NAME:
+           load
+        PURPOSE:
+           load a model saved with save, including its factorizations
+        INPUT:
+           filename - name of the file
+        OPTIONAL INPUTS:
+           mmap - (Bool, default=True) memory-map the arrays (read-only)
+                  rather than reading them into memory
+        OUTPUT:
+           XDModel; raises ValueError if the file is not a (complete)
+           XDModel file
+        HISTORY:
+           2026-10-18 - Written
+        """
+        with open(filename,'rb') as loadfile:
+            magic= loadfile.read(len(_MODELMAGIC))
+            header= nu.fromfile(loadfile,dtype='<i8',count=3)
+        if magic != _MODELMAGIC or len(header) != 3:
+            raise ValueError('%s is not an XDModel file' % filename)
+        if header[0] != _MODELVERSION:
+            raise ValueError('%s has unsupported XDModel format version %i'
+                             % (filename,header[0]))
+        ngauss, dim= int(header[1]), int(header[2])
+        shapes= [(ngauss,),(ngauss,dim),(ngauss,dim,dim),(ngauss,dim,dim),
+                 (ngauss,dim,dim),(ngauss,)]
+        offset= len(_MODELMAGIC)+header.nbytes
+        if os.path.getsize(filename) \
+                < offset+8*sum([int(nu.prod(shape)) for shape in shapes]):
+            raise ValueError('%s is truncated' % filename)
+        if mmap:
+            arrays= []
+            for shape in shapes:
+                arrays.append(nu.memmap(filename,dtype='<f8',mode='r',
+                                        offset=offset,shape=shape))
+                offset+= 8*int(nu.prod(shape))
+        else:
+            with open(filename,'rb') as loadfile:
+                loadfile.seek(offset)
+                arrays= [nu.fromfile(loadfile,dtype='<f8',
+                                     count=int(nu.prod(shape)))\
+                             .reshape(shape) for shape in shapes]
+        return cls(*arrays[:3],_cache=tuple(arrays[3:]))
+
+    def _logq(self,ydata):
+        """Log of the amplitude times the gaussian of every error-free
+        data point and gaussian, from the cached factorizations"""
+        ydata= nu.asarray(ydata,dtype=nu.float64)
+        out= nu.empty((ydata.shape[0],self.ngauss))
+        for kk in range(self.ngauss):
+            delta= ydata-self.xmean[kk]
+            out[:,kk]= nu.log(self.xamp[kk])-0.5*self.dim*nu.log(2.*nu.pi)\
+                -0.5*self.logdet[kk]\
+                -0.5*nu.sum(nu.dot(delta,self.xinv[kk])*delta,axis=1)
+        return out
+
+    def score_samples(self,ydata,ycovar=None,projection=None):
+        """
+        NAME:
+           score_samples
+        PURPOSE:
+           compute the log likelihood of each data point, see score_samples
+        INPUT:
+           ydata - [ndata,dy] numpy array of observed quantities
+        OPTIONAL INPUTS:
+           ycovar - [ndata,dy(,dy)] numpy array of observational error
+                    covariances; if None, the data are error-free and are
+                    scored with the cached factorizations
+           projection - [ndata,dy,dx] numpy array of projection matrices
+                        (requires ycovar)
+        OUTPUT:
+           [ndata] numpy array of log likelihoods
+        HISTORY:
+           2026-10-18 - Written
+        """
+        if ycovar is not None:
+            return score_samples(ydata,ycovar,self.xamp,self.xmean,
+                                 self.xcovar,projection=projection)
+        if projection is not None:
+            raise ValueError('projection requires ycovar')
+        return _logsumexp(self._logq(ydata))
+
+    def membership_prob(self,ydata,ycovar=None,projection=None,log=False):
+        """
+        NAME:
+           membership_prob
+        PURPOSE:
+           compute the posterior probability for each data point to belong
+           to each of the gaussians, see membership_prob
+        INPUT:
+           ydata - [ndata,dy] numpy array of observed quantities
+        OPTIONAL INPUTS:
+           ycovar, projection - as in score_samples
+           log - (Bool, default=False) return the log of the posterior
+                 probabilities
+        OUTPUT:
+           [ndata,ngauss] numpy array of (log) posterior probabilities
+        HISTORY:
+           2026-10-18 - Written
+        """
+        if ycovar is not None:
+            return membership_prob(ydata,ycovar,self.xamp,self.xmean,
+                                   self.xcovar,projection=projection,log=log)
+        if projection is not None:
+            raise ValueError('projection requires ycovar')
+        logq= self._logq(ydata)
+        logpost= logq-_logsumexp(logq)[:,None]
+        if log:
+            return logpost
+        else:
+            return nu.exp(logpost)
+
+    def deconvolve(self,ydata,ycovar,projection=None,condition=None):
+        """Posterior means and covariances of x, see deconvolve"""
+        return deconvolve(ydata,ycovar,self.xamp,self.xmean,self.xcovar,
+                          projection=projection,condition=condition)
+
+    def sample(self,nsample,**kwargs):
+        """Draw samples with the cached Cholesky factors, see sample"""
+        return sample(self.xamp,self.xmean,self.xcovar,nsample,
+                      _xchol=self.xchol,**kwargs)
+
+    def __repr__(self):
+        return 'XDModel(ngauss=%i, dim=%i)' % (self.ngauss,self.dim)
+
 if __name__ == '__main__': #pragma: no cover
     import doctest
     doctest.testmod(verbose=True)
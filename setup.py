@@ -8,7 +8,18 @@ srcFiles= ['src/bovy_randvec.c','src/calc_splitnmerge.c',
 		'src/logsum.c','src/minmax.c','src/normalize_row.c','src/proj_EM.c',
 		'src/proj_EM_step.c','src/proj_gauss_mixtures.c',
 		'src/splitnmergegauss.c','src/bovy_det.c',
-		'src/proj_gauss_mixtures_IDL.c']
+		'src/proj_gauss_mixtures_IDL.c','src/calc_loglike.c',
+		'src/bovy_cholesky.c','src/lowdim_estep.c',
+		'src/estepwork.c','src/pairwise_sum.c',
+		'src/batch_proj_gauss_mixtures.c','src/view_data.c',
+		'src/proj_gauss_mixtures_strided.c','src/proj_EM_estep.c',
+		'src/proj_EM_mstep.c','src/stream_data.c',
+		'src/proj_EM_stochastic.c','src/proj_EM_squarem.c',
+		'src/xdstats.c','src/splitnmerge_parallel.c',
+		'src/proj_EM_partial.c','src/snm_hopeless.c',
+		'src/kmeans_init.c','src/multistart_proj_gauss_mixtures.c',
+		'src/resample_proj_gauss_mixtures.c',
+		'src/crossvalidate_proj_gauss_mixtures.c']
 libraries=['m','gsl','gslcblas','gomp']
 
 #Option to forego OpenMP
@@ -0,0 +1,155 @@
+/*
+  NAME:
+     batch_proj_gauss_mixtures
+  PURPOSE:
+     run the projected gaussian mixtures algorithm on many independent
+     problems at once, parallelizing over problems rather than over data
+     points (called from python)
+  CALLING SEQUENCE:
+     batch_proj_gauss_mixtures(int P, double * ydata, double * ycovar,
+     double * projection, double * logweights, int * ndata, int dy,
+     double * amp, double * xmean, double * xcovar, int d, int * ngauss,
+     char * fixamp, char * fixmean, char * fixcovar,
+     double * avgloglikedata, double tol, long long int maxiter,
+     char likeonly, double w, int splitnmerge, char noprojection,
+     char diagerrors, char noweights, long long int * niter,
+     char * converged)
+  INPUT:
+     P            - number of problems
+     ydata        - [sum(ndata),dy] data of all problems, one after the other
+     ycovar       - [sum(ndata),dy,dy] or [sum(ndata),dy] (diagerrors)
+                    error covariances
+     projection   - [sum(ndata),dy,d] projection matrices
+     logweights   - [sum(ndata)] log weights of the data points
+     ndata        - [P] number of data points of each problem
+     dy           - dimension of the data
+     amp          - [sum(ngauss)] initial amplitudes
+     xmean        - [sum(ngauss),d] initial means
+     xcovar       - [sum(ngauss),d,d] initial covariances
+     d            - dimension of the gaussians
+     ngauss       - [P] number of gaussians of each problem
+     fix*         - [sum(ngauss)] fix the amplitude, mean, covariance?
+     tol          - proj_EM convergence limit
+     maxiter      - maximum number of iterations in each proj_EM
+     likeonly     - only compute the likelihood?
+     w            - regularization parameter
+     splitnmerge  - split 'n' merge depth
+     noprojection - don't perform any projections
+     diagerrors   - the ycovar errors-squared are diagonal
+     noweights    - don't use data-weights
+  OUTPUT:
+     amp, xmean, xcovar - updated model gaussians
+     avgloglikedata     - [P] average log likelihood of each problem
+     niter              - [P] total number of EM iterations of each problem
+     converged          - [P] whether each problem converged to within tol
+  REVISION HISTORY:
+     2026-10-18 - Written
+     2026-10-18 Run on views of the data instead of copying the data
+     2026-10-18 maxiter and niter are long long int, as in the rest of
+                the code
+*/
+#include <stdlib.h>
+#include <stdbool.h>
+#include <gsl/gsl_matrix.h>
+#include <gsl/gsl_vector.h>
+#include <proj_gauss_mixtures.h>
+
+struct batchproblem{
+  double cost;
+  int p;
+};
+
+/* sort problems by decreasing cost, such that the largest start first */
+static int compare_cost(const void * a, const void * b){
+  double ca= ((const struct batchproblem *) a)->cost;
+  double cb= ((const struct batchproblem *) b)->cost;
+  return (ca < cb) - (ca > cb);
+}
+
+int batch_proj_gauss_mixtures(int P, double * ydata, double * ycovar,
+			      double * projection, double * logweights,
+			      int * ndata, int dy, double * amp,
+			      double * xmean, double * xcovar, int d,
+			      int * ngauss, char * fixamp, char * fixmean,
+			      char * fixcovar, double * avgloglikedata,
+			      double tol, long long int maxiter,
+			      char likeonly, double w, int splitnmerge,
+			      char noprojection, char diagerrors,
+			      char noweights, long long int * niter,
+			      char * converged){
+  bool noproj= (bool) noprojection;
+  bool noweight= (bool) noweights;
+  bool diagerrs= (bool) diagerrors;
+  int dSS= diagerrs ? dy : dy*dy;
+  long long int ystrides[2]= {dy,1};
+  long long int cstrides[2]= {dSS,diagerrs ? 1 : dy};
+  long long int pstrides[2]= {dy*d,d};
+  //Offsets of each problem into the concatenated arrays
+  long long int * dataoffset= (long long int *) malloc(P * sizeof (long long int) );
+  long long int * gaussoffset= (long long int *) malloc(P * sizeof (long long int) );
+  struct batchproblem * order= (struct batchproblem *) malloc(P * sizeof (struct batchproblem) );
+  int pp;
+  for (pp = 0; pp != P; ++pp){
+    dataoffset[pp]= (pp == 0) ? 0 : dataoffset[pp-1]+ndata[pp-1];
+    gaussoffset[pp]= (pp == 0) ? 0 : gaussoffset[pp-1]+ngauss[pp-1];
+    order[pp].p= pp;
+    order[pp].cost= (double) ndata[pp] * ngauss[pp];
+  }
+  qsort(order,P,sizeof (struct batchproblem),compare_cost);
+  //Each problem is fit by a single thread
+#pragma omp parallel for schedule(dynamic,1)
+  for (pp = 0; pp < P; ++pp){
+    int thisp= order[pp].p;
+    int N= ndata[thisp], K= ngauss[thisp];
+    long long int doff= dataoffset[thisp], goff= gaussoffset[thisp];
+    bool thisconverged;
+    int jj, dd1, dd2;
+    //Views of this problem's data
+    struct dataviews * views;
+    struct datapoint * data =
+      view_data(ydata+doff*dy,ycovar+doff*dSS,
+		noproj ? projection : projection+doff*dy*d,
+		noweight ? logweights : logweights+doff,N,dy,d,
+		ystrides,cstrides,pstrides,1,noproj,diagerrs,noweight,&views);
+    struct gaussian * gaussians = (struct gaussian *) malloc (K * sizeof (struct gaussian) );
+    for (jj = 0; jj != K; ++jj){
+      (gaussians+jj)->mm = gsl_vector_alloc(d);
+      (gaussians+jj)->VV = gsl_matrix_alloc(d,d);
+      (gaussians+jj)->alpha = amp[goff+jj];
+      for (dd1 = 0; dd1 != d; ++dd1)
+	gsl_vector_set((gaussians+jj)->mm,dd1,xmean[(goff+jj)*d+dd1]);
+      for (dd1 = 0; dd1 != d; ++dd1)
+	for (dd2 = 0; dd2 != d; ++dd2)
+	  gsl_matrix_set((gaussians+jj)->VV,dd1,dd2,
+			 xcovar[(goff+jj)*d*d+dd1*d+dd2]);
+    }
+    //Run projected_gauss_mixtures
+    proj_gauss_mixtures(data,N,gaussians,K,(bool *) (fixamp+goff),
+			(bool *) (fixmean+goff),(bool *) (fixcovar+goff),
+			avgloglikedata+thisp,tol,maxiter,
+			(bool) likeonly,w,splitnmerge,false,NULL,NULL,
+			noproj,diagerrs,noweight,niter+thisp,&thisconverged,
+			NULL,NULL);
+    converged[thisp]= (char) thisconverged;
+    //Update the arrays given to us and free
+    for (jj = 0; jj != K; ++jj){
+      amp[goff+jj]= (gaussians+jj)->alpha;
+      for (dd1 = 0; dd1 != d; ++dd1)
+	xmean[(goff+jj)*d+dd1]= gsl_vector_get((gaussians+jj)->mm,dd1);
+      for (dd1 = 0; dd1 != d; ++dd1)
+	for (dd2 = 0; dd2 != d; ++dd2)
+	  xcovar[(goff+jj)*d*d+dd1*d+dd2]=
+	    gsl_matrix_get((gaussians+jj)->VV,dd1,dd2);
+      gsl_vector_free((gaussians+jj)->mm);
+      gsl_matrix_free((gaussians+jj)->VV);
+    }
+    free(data);
+    free(views);
+    free(gaussians);
+  }
+  free(dataoffset);
+  free(gaussoffset);
+  free(order);
+
+  return 0;
+}
@@ -0,0 +1,49 @@
+/*
+  NAME:
+     bovy_cholesky
+  PURPOSE:
+     in-place Cholesky decomposition of a symmetric positive-definite
+     matrix, also returning its log determinant; unlike the gsl routine
+     this does not call the gsl error handler when the matrix is not
+     positive definite, such that the caller can recover
+  CALLING SEQUENCE:
+     bovy_cholesky(gsl_matrix * A, double * lndet)
+  INPUT:
+     A     - symmetric matrix (only the lower triangle is used)
+  OUTPUT:
+     A     - the lower triangle holds L, with A = L L^T
+     lndet - log of the determinant of A
+     returns 0 on success, or k > 0 if the leading k x k submatrix of A
+     is not (numerically) positive definite
+  REVISION HISTORY:
+     2026-10-18 - Written
+*/
+#include <math.h>
+#include <gsl/gsl_matrix.h>
+#include <proj_gauss_mixtures.h>
+
+int bovy_cholesky(gsl_matrix * A, double * lndet){
+  int n = A->size1;
+  size_t tda = A->tda;
+  double * a = A->data;
+  double diag, sum;
+  int ii, jj, kk;
+  *lndet = 0.;
+  for (jj = 0; jj != n; ++jj){
+    diag = a[jj*tda+jj];
+    for (kk = 0; kk != jj; ++kk)
+      diag -= a[jj*tda+kk] * a[jj*tda+kk];
+    if ( diag <= 0. || ! bovy_isfin(diag) ) return jj+1;
+    diag = sqrt(diag);
+    a[jj*tda+jj] = diag;
+    *lndet += 2. * log(diag);
+    for (ii = jj+1; ii != n; ++ii){
+      sum = a[ii*tda+jj];
+      for (kk = 0; kk != jj; ++kk)
+	sum -= a[ii*tda+kk] * a[jj*tda+kk];
+      a[ii*tda+jj] = sum / diag;
+    }
+  }
+
+  return 0;
+}
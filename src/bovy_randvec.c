@@ -4,21 +4,25 @@
    PURPOSE:
       returns a (uniform) random vector with a maximum length
    CALLING SEQUENCE:
-      bovy_randvec(gsl_vector * eps, int d, double length)
+      bovy_randvec(gsl_vector * eps, int d, double length,
+      gsl_rng * randgen)
    INPUT:
-      d      - dimension of the vector
-      length - maximum length of the random vector
+      d       - dimension of the vector
+      length  - maximum length of the random vector
+      randgen - random number generator
    OUTPUT:
       eps    - random vector
    REVISION HISTORY:
       2008-09-21
+      2026-10-18 Pass the random number generator
 */
 #include <math.h>
 #include <gsl/gsl_vector.h>
 #include <gsl/gsl_rng.h>
 #include <proj_gauss_mixtures.h>
 
-void bovy_randvec(gsl_vector * eps, int d, double length){
+void bovy_randvec(gsl_vector * eps, int d, double length,
+		  gsl_rng * randgen){
   length /= sqrt((double)d);
   int dd;
   for (dd = 0; dd != d; ++dd)
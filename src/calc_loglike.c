@@ -0,0 +1,239 @@
+/*
+  NAME:
+     calc_loglike
+  PURPOSE:
+     calculate the log likelihood of each data point under the
+     error-convolved mixture model, and optionally the posterior
+     probabilities for each point to belong to each of the components,
+     and the posterior mean and covariance of the deconvolved x of each
+     point (bij and Bij mixed over the components by the posterior
+     probabilities), without running EM (C counterpart of
+     addons/calc_loglike.pro and addons/calc_membership_prob.pro)
+  CALLING SEQUENCE:
+     calc_loglike(double * ydata, double * ycovar, double * projection,
+     int N, int dy, double * amp, double * xmean, double * xcovar,
+     int d, int K, double * loglike, double * logpost, double * xpostmean,
+     double * xpostcovar, char noprojection, char diagerrors)
+  INPUT:
+     ydata        - [N,dy] data
+     ycovar       - [N,dy,dy] or [N,dy] (diagerrors) error covariances
+     projection   - [N,dy,d] projection matrices
+     N            - number of data points
+     dy           - dimension of the data
+     amp          - [K] amplitudes of the gaussians
+     xmean        - [K,d] means of the gaussians
+     xcovar       - [K,d,d] covariances of the gaussians
+     d            - dimension of the gaussians
+     K            - number of gaussians
+     noprojection - don't perform any projections
+     diagerrors   - the ycovar errors-squared are diagonal
+  OUTPUT:
+     loglike      - [N] log likelihood of each data point
+     logpost      - [N,K] log posterior probabilities for each data point to
+                    belong to each gaussian (not calculated if NULL)
+     xpostmean    - [N,d] posterior mean of x for each data point (not
+                    calculated if NULL)
+     xpostcovar   - [N,d,d] posterior covariance of x for each data point
+                    (only calculated together with xpostmean)
+  REVISION HISTORY:
+     2026-10-18 - Written
+     2026-10-18 Posterior mean and covariance of the deconvolved x
+*/
+#ifdef _OPENMP
+#include <omp.h>
+#endif
+#include <stdlib.h>
+#include <math.h>
+#include <stdbool.h>
+#include <gsl/gsl_matrix.h>
+#include <gsl/gsl_vector.h>
+#include <gsl/gsl_linalg.h>
+#include <gsl/gsl_blas.h>
+#include <proj_gauss_mixtures.h>
+
+int calc_loglike(double * ydata, double * ycovar, double * projection,
+		 int N, int dy, double * amp, double * xmean,
+		 double * xcovar, int d, int K, double * loglike,
+		 double * logpost, double * xpostmean, double * xpostcovar,
+		 char noprojection, char diagerrors){
+  bool noproj= (bool) noprojection;
+  bool diagerrs= (bool) diagerrors;
+  bool lowdim= noproj && d <= LOWDIMMAX;
+  bool calcx= xpostmean != NULL;
+  double halflogtwopi= 0.5 * log(8. * atan(1.0));
+  //Set up views of the model gaussians, these are shared by all threads
+  gsl_vector_view * mmview= (gsl_vector_view *) malloc(K * sizeof (gsl_vector_view) );
+  gsl_matrix_view * VVview= (gsl_matrix_view *) malloc(K * sizeof (gsl_matrix_view) );
+  int ii, jj, kk, ll;
+  for (jj = 0; jj != K; ++jj){
+    mmview[jj]= gsl_vector_view_array(xmean+jj*d,d);
+    VVview[jj]= gsl_matrix_view_array(xcovar+jj*d*d,d,d);
+  }
+  //Loop over the data, allocating the scratch space once per thread
+#pragma omp parallel private(ii,jj,kk,ll)
+  {
+    int signum, cholfail;
+    double exponent, lndetTij, sumSV, lognormi, qj;
+    gsl_vector_view ww, postmean;
+    gsl_matrix_view SS, RR, logq, postcovar;
+    gsl_matrix * VV;
+    gsl_permutation * p = gsl_permutation_alloc (dy);
+    gsl_vector * wminusRm = gsl_vector_alloc (dy);
+    gsl_vector * TinvwminusRm = gsl_vector_alloc (dy);
+    gsl_matrix * Tij = gsl_matrix_alloc(dy,dy);
+    gsl_matrix * Tcopy = gsl_matrix_alloc(dy,dy);
+    gsl_matrix * VRT = NULL, * Rtrans = NULL, * VRTTinv = NULL;
+    if ( ! noproj || calcx ) VRT = gsl_matrix_alloc(d,dy);
+    if ( ! noproj ) Rtrans = gsl_matrix_alloc(d,dy);
+    //bij and bij bij^T + Bij of every gaussian
+    struct modelbs * bs = NULL;
+    if ( calcx ) {
+      VRTTinv = gsl_matrix_alloc(d,dy);
+      bs = (struct modelbs *) malloc(K * sizeof (struct modelbs) );
+      for (jj = 0; jj != K; ++jj){
+	(bs+jj)->bbij = gsl_vector_alloc(d);
+	(bs+jj)->BBij = gsl_matrix_alloc(d,d);
+      }
+    }
+    double * thislogq = (double *) malloc(K * sizeof (double) );
+#pragma omp for schedule(static)
+    for (ii = 0; ii < N; ++ii){
+      ww= gsl_vector_view_array(ydata+ii*dy,dy);
+      if ( diagerrs ) SS= gsl_matrix_view_array(ycovar+ii*dy,dy,1);
+      else SS= gsl_matrix_view_array(ycovar+ii*dy*dy,dy,dy);
+      if ( ! noproj ) RR= gsl_matrix_view_array(projection+ii*dy*d,dy,d);
+      //Write into logpost directly if we need to return it
+      if ( logpost == NULL ) logq= gsl_matrix_view_array(thislogq,1,K);
+      else logq= gsl_matrix_view_array(logpost+ii*K,1,K);
+      for (jj = 0; jj != K; ++jj){
+	VV= &(VVview[jj].matrix);
+	if ( lowdim
+	     && lowdim_estep(d,&(ww.vector),&(SS.matrix),diagerrs,
+			     &(mmview[jj].vector),VV,&lndetTij,&exponent,
+			     calcx ? (bs+jj)->bbij : NULL,
+			     calcx ? (bs+jj)->BBij : NULL) == 0 ) {
+	  gsl_matrix_set(&(logq.matrix),0,jj,log(amp[jj]) - dy * halflogtwopi - 0.5 * lndetTij -0.5 * exponent);
+	  continue;
+	}
+	gsl_vector_memcpy(wminusRm,&(ww.vector));
+	//Calculate Tij
+	if ( ! noproj ) {
+	  if ( diagerrs ) {
+	    gsl_matrix_set_zero(Tij);
+	    for (ll = 0; ll != dy; ++ll)
+	      gsl_matrix_set(Tij,ll,ll,gsl_matrix_get(&(SS.matrix),ll,0));}
+	  else
+	    gsl_matrix_memcpy(Tij,&(SS.matrix));
+	  gsl_matrix_transpose_memcpy(Rtrans,&(RR.matrix));
+	  gsl_blas_dsymm(CblasLeft,CblasUpper,1.0,VV,Rtrans,0.0,VRT);
+	  gsl_blas_dgemm(CblasNoTrans,CblasNoTrans,1.0,&(RR.matrix),VRT,1.0,Tij);
+	  gsl_blas_dgemv(CblasNoTrans,-1.0,&(RR.matrix),&(mmview[jj].vector),1.0,wminusRm);
+	}
+	else {
+	  for (kk = 0; kk != d; ++kk){
+	    if ( diagerrs )
+	      gsl_matrix_set(Tij,kk,kk,gsl_matrix_get(&(SS.matrix),kk,0)+gsl_matrix_get(VV,kk,kk));
+	    else
+	      gsl_matrix_set(Tij,kk,kk,gsl_matrix_get(&(SS.matrix),kk,kk)+gsl_matrix_get(VV,kk,kk));
+	    for (ll = kk+1; ll != d; ++ll){
+	      sumSV= gsl_matrix_get(VV,kk,ll);
+	      if ( ! diagerrs ) sumSV+= gsl_matrix_get(&(SS.matrix),kk,ll);
+	      gsl_matrix_set(Tij,kk,ll,sumSV);
+	      gsl_matrix_set(Tij,ll,kk,sumSV);}}
+	  gsl_vector_sub(wminusRm,&(mmview[jj].vector));
+	  if ( calcx )
+	    for (kk = 0; kk != d; ++kk)
+	      for (ll = kk; ll != d; ++ll){
+		sumSV= gsl_matrix_get(VV,kk,ll);
+		gsl_matrix_set(VRT,kk,ll,sumSV);
+		gsl_matrix_set(VRT,ll,kk,sumSV);}
+	}
+	//Cholesky decomposition of Tij, with the same fallbacks as the E-step
+	gsl_matrix_memcpy(Tcopy,Tij);
+	cholfail= bovy_cholesky(Tij,&lndetTij);
+	if ( cholfail ) {
+	  gsl_matrix_memcpy(Tij,Tcopy);
+	  for (ll = 0; ll != dy; ++ll)
+	    gsl_matrix_set(Tij,ll,ll,(1.+CHOLJITTER)*gsl_matrix_get(Tij,ll,ll));
+	  cholfail= bovy_cholesky(Tij,&lndetTij);
+	}
+	if ( ! cholfail ) {
+	  gsl_blas_dtrsv(CblasLower,CblasNoTrans,CblasNonUnit,Tij,wminusRm);
+	  gsl_blas_ddot(wminusRm,wminusRm,&exponent);
+	  if ( calcx ) {
+	    //As in the E-step, bij = m + VRT L^-T z and
+	    //Bij = V - (VRT L^-T) (VRT L^-T)^T
+	    gsl_matrix_memcpy(VRTTinv,VRT);
+	    gsl_blas_dtrsm(CblasRight,CblasLower,CblasTrans,CblasNonUnit,1.0,Tij,VRTTinv);
+	    gsl_vector_memcpy((bs+jj)->bbij,&(mmview[jj].vector));
+	    gsl_blas_dgemv(CblasNoTrans,1.0,VRTTinv,wminusRm,1.0,(bs+jj)->bbij);
+	    gsl_matrix_memcpy((bs+jj)->BBij,VV);
+	    gsl_blas_dsyrk(CblasUpper,CblasNoTrans,-1.0,VRTTinv,1.0,(bs+jj)->BBij);
+	  }
+	}
+	else {
+	  gsl_matrix_memcpy(Tij,Tcopy);
+	  gsl_linalg_LU_decomp(Tij,p,&signum);
+	  gsl_linalg_LU_solve(Tij,p,wminusRm,TinvwminusRm);
+	  gsl_blas_ddot(wminusRm,TinvwminusRm,&exponent);
+	  lndetTij= gsl_linalg_LU_lndet(Tij);
+	  if ( calcx ) {
+	    gsl_linalg_LU_invert(Tij,p,Tcopy);//Tcopy now holds Tij^-1
+	    gsl_vector_memcpy((bs+jj)->bbij,&(mmview[jj].vector));
+	    gsl_blas_dgemv(CblasNoTrans,1.0,VRT,TinvwminusRm,1.0,(bs+jj)->bbij);
+	    gsl_blas_dgemm(CblasNoTrans,CblasNoTrans,1.0,VRT,Tcopy,0.0,VRTTinv);
+	    gsl_matrix_memcpy((bs+jj)->BBij,VV);
+	    gsl_blas_dgemm(CblasNoTrans,CblasTrans,-1.0,VRTTinv,VRT,1.0,(bs+jj)->BBij);
+	  }
+	}
+	if ( calcx )
+	  gsl_blas_dsyr(CblasUpper,1.0,(bs+jj)->bbij,(bs+jj)->BBij);
+	gsl_matrix_set(&(logq.matrix),0,jj,log(amp[jj]) - dy * halflogtwopi - 0.5 * lndetTij -0.5 * exponent);
+      }
+      if ( logpost == NULL ) loglike[ii]= logsum(&(logq.matrix),0,true);
+      else loglike[ii]= normalize_row(&(logq.matrix),0,true,true,0.);
+      if ( ! calcx ) continue;
+      //Mix bij and bij bij^T + Bij over the gaussians, only the upper
+      //triangle of bij bij^T + Bij is used
+      postmean= gsl_vector_view_array(xpostmean+ii*d,d);
+      postcovar= gsl_matrix_view_array(xpostcovar+ii*d*d,d,d);
+      gsl_vector_set_zero(&(postmean.vector));
+      gsl_matrix_set_zero(&(postcovar.matrix));
+      lognormi= ( logpost == NULL ) ? loglike[ii] : 0.;
+      for (jj = 0; jj != K; ++jj){
+	qj= exp(gsl_matrix_get(&(logq.matrix),0,jj)-lognormi);
+	gsl_blas_daxpy(qj,(bs+jj)->bbij,&(postmean.vector));
+	for (kk = 0; kk != d; ++kk)
+	  for (ll = kk; ll != d; ++ll)
+	    gsl_matrix_set(&(postcovar.matrix),kk,ll,
+			   gsl_matrix_get(&(postcovar.matrix),kk,ll)
+			   +qj*gsl_matrix_get((bs+jj)->BBij,kk,ll));
+      }
+      gsl_blas_dsyr(CblasUpper,-1.0,&(postmean.vector),&(postcovar.matrix));
+      for (kk = 0; kk != d; ++kk)
+	for (ll = kk+1; ll != d; ++ll)
+	  gsl_matrix_set(&(postcovar.matrix),ll,kk,
+			 gsl_matrix_get(&(postcovar.matrix),kk,ll));
+    }
+    gsl_permutation_free (p);
+    gsl_vector_free(wminusRm);
+    gsl_vector_free(TinvwminusRm);
+    gsl_matrix_free(Tij);
+    gsl_matrix_free(Tcopy);
+    if ( VRT != NULL ) gsl_matrix_free(VRT);
+    if ( ! noproj ) gsl_matrix_free(Rtrans);
+    if ( calcx ) {
+      gsl_matrix_free(VRTTinv);
+      for (jj = 0; jj != K; ++jj){
+	gsl_vector_free((bs+jj)->bbij);
+	gsl_matrix_free((bs+jj)->BBij);
+      }
+      free(bs);
+    }
+    free(thislogq);
+  }
+  free(mmview);
+  free(VVview);
+
+  return 0;
+}
@@ -0,0 +1,284 @@
+/*
+  NAME:
+     crossvalidate_proj_gauss_mixtures
+  PURPOSE:
+     k-fold cross-validation of the projected gaussian mixtures algorithm
+     over a grid of regularization parameters w: every fold is fit by a
+     single thread, on a list of the data points outside of the fold that
+     refer to the same views of the data, for every w in turn, warm-started
+     from the fit for the previous w; the data points in the fold are then
+     scored under the fit, factorizing Tij = R V R^T + S only once per
+     gaussian for consecutive data points that share the same error
+     covariance and projection (e.g., homoscedastic errors given as a
+     broadcast array) (called from python)
+  CALLING SEQUENCE:
+     crossvalidate_proj_gauss_mixtures(int nfold, int * fold, int nw,
+     double * ws, double * ydata, long long int * ystrides,
+     double * ycovar, long long int * cstrides, double * projection,
+     long long int * pstrides, double * logweights, long long int wstride,
+     int N, int dy, double * amp, double * xmean, double * xcovar, int d,
+     int K, char * fixamp, char * fixmean, char * fixcovar,
+     double * trainloglike, double * testloglike, double tol,
+     long long int maxiter, int splitnmerge, char noprojection,
+     char diagerrors, char noweights, long long int * niter,
+     char * converged)
+  INPUT:
+     nfold        - number of folds
+     fold         - [N] fold of every data point (0 to nfold-1)
+     nw           - number of regularization parameters
+     ws           - [nw] regularization parameters, neighbouring entries
+                    are warm-started from each other
+     ydata, ystrides, ycovar, cstrides, projection, pstrides, logweights,
+     wstride      - the data, see view_data
+     N            - number of data points
+     dy           - dimension of the data
+     amp          - [nfold,nw,K] amplitudes, [f,0] is the initial model of
+                    fold f
+     xmean        - [nfold,nw,K,d] means, idem
+     xcovar       - [nfold,nw,K,d,d] covariances, idem
+     d            - dimension of the gaussians
+     K            - number of gaussians
+     fix*         - [K] fix the amplitude, mean, covariance?
+     tol          - proj_EM convergence limit
+     maxiter      - maximum number of iterations in each proj_EM
+     splitnmerge  - split 'n' merge depth
+     noprojection - don't perform any projections
+     diagerrors   - the ycovar errors-squared are diagonal
+     noweights    - don't use data-weights
+  OUTPUT:
+     amp, xmean, xcovar - [f,i] is the fit to the data outside of fold f
+                          for regularization parameter ws[i]
+     trainloglike       - [nfold,nw] average log likelihood of the data
+                          outside of the fold
+     testloglike        - [nfold,nw] average log likelihood of the data in
+                          the fold (as avgloglikedata, i.e., the log
+                          likelihood of every data point multiplied by its
+                          weight, as in the E-step)
+     niter              - [nfold,nw] total number of EM iterations
+     converged          - [nfold,nw] whether the fit converged to within tol
+  REVISION HISTORY:
+     2026-10-18 - Written
+     2026-10-18 Weight the held-out log likelihoods as in the E-step
+*/
+#include <stdlib.h>
+#include <math.h>
+#include <stdbool.h>
+#include <gsl/gsl_matrix.h>
+#include <gsl/gsl_vector.h>
+#include <gsl/gsl_linalg.h>
+#include <gsl/gsl_blas.h>
+#include <proj_gauss_mixtures.h>
+
+struct tijcache{ /* factorization of Tij of a gaussian for one S and R */
+  double *SS, *RR; /* the error covariance and projection it belongs to */
+  gsl_matrix * Tij; /* Cholesky factor, or LU decomposition if cholfail */
+  gsl_permutation * p;
+  bool cholfail;
+  double lndet;
+};
+
+/* factorize Tij of gaussian g for data point dp into cache */
+static void factorize(struct tijcache * cache, struct datapoint * dp,
+		      struct gaussian * g, bool noproj, bool diagerrs,
+		      gsl_matrix * VRT, gsl_matrix * Rtrans, gsl_matrix * Tcopy){
+  int dy = (dp->ww)->size, kk, ll, signum;
+  gsl_matrix * Tij = cache->Tij;
+  for (kk = 0; kk != dy; ++kk)
+    for (ll = 0; ll != dy; ++ll)
+      if ( diagerrs )
+	gsl_matrix_set(Tij,kk,ll,kk == ll ? gsl_matrix_get(dp->SS,kk,0) : 0.);
+      else
+	gsl_matrix_set(Tij,kk,ll,gsl_matrix_get(dp->SS,kk,ll));
+  if ( ! noproj ) {
+    gsl_matrix_transpose_memcpy(Rtrans,dp->RR);
+    gsl_blas_dsymm(CblasLeft,CblasUpper,1.0,g->VV,Rtrans,0.0,VRT);
+    gsl_blas_dgemm(CblasNoTrans,CblasNoTrans,1.0,dp->RR,VRT,1.0,Tij);
+  }
+  else
+    for (kk = 0; kk != dy; ++kk)
+      for (ll = kk; ll != dy; ++ll){
+	gsl_matrix_set(Tij,kk,ll,gsl_matrix_get(Tij,kk,ll)
+		       +gsl_matrix_get(g->VV,kk,ll));
+	gsl_matrix_set(Tij,ll,kk,gsl_matrix_get(Tij,kk,ll));
+      }
+  //Same fallbacks as the E-step
+  gsl_matrix_memcpy(Tcopy,Tij);
+  cache->cholfail = bovy_cholesky(Tij,&(cache->lndet));
+  if ( cache->cholfail ) {
+    gsl_matrix_memcpy(Tij,Tcopy);
+    for (ll = 0; ll != dy; ++ll)
+      gsl_matrix_set(Tij,ll,ll,(1.+CHOLJITTER)*gsl_matrix_get(Tij,ll,ll));
+    cache->cholfail = bovy_cholesky(Tij,&(cache->lndet));
+    if ( cache->cholfail ) {
+      gsl_matrix_memcpy(Tij,Tcopy);
+      gsl_linalg_LU_decomp(Tij,cache->p,&signum);
+      cache->lndet = gsl_linalg_LU_lndet(Tij);
+    }
+  }
+  cache->SS = (dp->SS)->data;
+  cache->RR = noproj ? NULL : (dp->RR)->data;
+  return;
+}
+
+/* summed log likelihood of the data under the gaussians */
+static double score(struct datapoint * data, int N,
+		    struct gaussian * gaussians, int K, bool noproj,
+		    bool diagerrs, bool noweight){
+  int dy = ((data->ww)->size), d = ((gaussians->mm)->size);
+  int ii, jj;
+  bool lowdim = noproj && d <= LOWDIMMAX, shared;
+  double halflogtwopi = 0.5 * log(8. * atan(1.0)), lndet, exponent, sumloglike;
+  double * loglike = (double *) malloc(N * sizeof (double) );
+  double * prevSS = NULL, * prevRR = NULL, * thisRR;
+  gsl_vector * wminusRm = gsl_vector_alloc(dy);
+  gsl_vector * TinvwminusRm = gsl_vector_alloc(dy);
+  gsl_matrix * Tcopy = gsl_matrix_alloc(dy,dy);
+  gsl_matrix * VRT = gsl_matrix_alloc(d,dy);
+  gsl_matrix * Rtrans = gsl_matrix_alloc(d,dy);
+  gsl_matrix * logq = gsl_matrix_alloc(1,K);
+  struct tijcache * cache = (struct tijcache *) malloc(K * sizeof (struct tijcache) );
+  for (jj = 0; jj != K; ++jj){
+    (cache+jj)->SS = NULL;
+    (cache+jj)->Tij = gsl_matrix_alloc(dy,dy);
+    (cache+jj)->p = gsl_permutation_alloc(dy);
+  }
+  for (ii = 0; ii != N; ++ii){
+    thisRR = noproj ? NULL : ((data+ii)->RR)->data;
+    //The closed-form E-step beats the cache unless S and R are shared
+    shared = ((data+ii)->SS)->data == prevSS && thisRR == prevRR;
+    prevSS = ((data+ii)->SS)->data;
+    prevRR = thisRR;
+    for (jj = 0; jj != K; ++jj){
+      if ( lowdim && ! shared
+	   && lowdim_estep(d,(data+ii)->ww,(data+ii)->SS,diagerrs,
+			   (gaussians+jj)->mm,(gaussians+jj)->VV,&lndet,
+			   &exponent,NULL,NULL) == 0 ) {
+	gsl_matrix_set(logq,0,jj,log((gaussians+jj)->alpha) - dy * halflogtwopi - 0.5 * lndet - 0.5 * exponent);
+	continue;
+      }
+      if ( (cache+jj)->SS != ((data+ii)->SS)->data
+	   || (cache+jj)->RR != thisRR )
+	factorize(cache+jj,data+ii,gaussians+jj,noproj,diagerrs,VRT,Rtrans,
+		  Tcopy);
+      gsl_vector_memcpy(wminusRm,(data+ii)->ww);
+      if ( ! noproj ) gsl_blas_dgemv(CblasNoTrans,-1.0,(data+ii)->RR,(gaussians+jj)->mm,1.0,wminusRm);
+      else gsl_vector_sub(wminusRm,(gaussians+jj)->mm);
+      if ( ! (cache+jj)->cholfail ) {
+	gsl_blas_dtrsv(CblasLower,CblasNoTrans,CblasNonUnit,(cache+jj)->Tij,
+		       wminusRm);
+	gsl_blas_ddot(wminusRm,wminusRm,&exponent);
+      }
+      else {
+	gsl_linalg_LU_solve((cache+jj)->Tij,(cache+jj)->p,wminusRm,
+			    TinvwminusRm);
+	gsl_blas_ddot(wminusRm,TinvwminusRm,&exponent);
+      }
+      gsl_matrix_set(logq,0,jj,log((gaussians+jj)->alpha) - dy * halflogtwopi - 0.5 * (cache+jj)->lndet - 0.5 * exponent);
+    }
+    loglike[ii] = logsum(logq,0,true);
+    if ( ! noweight ) loglike[ii] *= exp((data+ii)->logweight);
+  }
+  sumloglike = pairwise_sum(loglike,N);
+  for (jj = 0; jj != K; ++jj){
+    gsl_matrix_free((cache+jj)->Tij);
+    gsl_permutation_free((cache+jj)->p);
+  }
+  free(cache);
+  free(loglike);
+  gsl_vector_free(wminusRm);
+  gsl_vector_free(TinvwminusRm);
+  gsl_matrix_free(Tcopy);
+  gsl_matrix_free(VRT);
+  gsl_matrix_free(Rtrans);
+  gsl_matrix_free(logq);
+  return sumloglike;
+}
+
+int crossvalidate_proj_gauss_mixtures(int nfold, int * fold, int nw,
+				      double * ws, double * ydata,
+				      long long int * ystrides,
+				      double * ycovar, long long int * cstrides,
+				      double * projection,
+				      long long int * pstrides,
+				      double * logweights,
+				      long long int wstride, int N, int dy,
+				      double * amp, double * xmean,
+				      double * xcovar, int d, int K,
+				      char * fixamp, char * fixmean,
+				      char * fixcovar, double * trainloglike,
+				      double * testloglike, double tol,
+				      long long int maxiter, int splitnmerge,
+				      char noprojection, char diagerrors,
+				      char noweights, long long int * niter,
+				      char * converged){
+  bool noproj= (bool) noprojection;
+  bool noweight= (bool) noweights;
+  bool diagerrs= (bool) diagerrors;
+  int ff;
+  //Views of the data, shared by all folds
+  struct dataviews * views;
+  struct datapoint * data = view_data(ydata,ycovar,projection,logweights,N,
+				      dy,d,ystrides,cstrides,pstrides,wstride,
+				      noproj,diagerrs,noweight,&views);
+  //Each fold is fit by a single thread
+#pragma omp parallel for schedule(dynamic,1)
+  for (ff = 0; ff < nfold; ++ff){
+    long long int off, thisniter;
+    bool thisconverged;
+    int ii, jj, dd1, dd2, ww, ntrain= 0, ntest= 0;
+    //The data points outside of and in this fold
+    struct datapoint * train = (struct datapoint *) malloc (N * sizeof (struct datapoint) );
+    struct datapoint * test = (struct datapoint *) malloc (N * sizeof (struct datapoint) );
+    for (ii = 0; ii != N; ++ii)
+      if ( fold[ii] != ff ) *(train+ntrain++)= *(data+ii);
+      else *(test+ntest++)= *(data+ii);
+    struct gaussian * gaussians = (struct gaussian *) malloc (K * sizeof (struct gaussian) );
+    off= (long long int) ff * nw * K;
+    for (jj = 0; jj != K; ++jj){
+      (gaussians+jj)->mm = gsl_vector_alloc(d);
+      (gaussians+jj)->VV = gsl_matrix_alloc(d,d);
+      (gaussians+jj)->alpha = amp[off+jj];
+      for (dd1 = 0; dd1 != d; ++dd1)
+	gsl_vector_set((gaussians+jj)->mm,dd1,xmean[(off+jj)*d+dd1]);
+      for (dd1 = 0; dd1 != d; ++dd1)
+	for (dd2 = 0; dd2 != d; ++dd2)
+	  gsl_matrix_set((gaussians+jj)->VV,dd1,dd2,
+			 xcovar[(off+jj)*d*d+dd1*d+dd2]);
+    }
+    //Sweep the regularization parameters, starting every fit from the
+    //previous one
+    for (ww = 0; ww != nw; ++ww){
+      off= ((long long int) ff * nw + ww) * K;
+      proj_gauss_mixtures(train,ntrain,gaussians,K,(bool *) fixamp,
+			  (bool *) fixmean,(bool *) fixcovar,
+			  trainloglike+ff*nw+ww,tol,maxiter,false,ws[ww],
+			  splitnmerge,false,NULL,NULL,noproj,diagerrs,noweight,
+			  &thisniter,&thisconverged,NULL,NULL);
+      niter[ff*nw+ww]= thisniter;
+      converged[ff*nw+ww]= (char) thisconverged;
+      testloglike[ff*nw+ww]= ( ntest > 0 )
+	? score(test,ntest,gaussians,K,noproj,diagerrs,noweight) / ntest
+	: 0.;
+      for (jj = 0; jj != K; ++jj){
+	amp[off+jj]= (gaussians+jj)->alpha;
+	for (dd1 = 0; dd1 != d; ++dd1)
+	  xmean[(off+jj)*d+dd1]= gsl_vector_get((gaussians+jj)->mm,dd1);
+	for (dd1 = 0; dd1 != d; ++dd1)
+	  for (dd2 = 0; dd2 != d; ++dd2)
+	    xcovar[(off+jj)*d*d+dd1*d+dd2]=
+	      gsl_matrix_get((gaussians+jj)->VV,dd1,dd2);
+      }
+    }
+    for (jj = 0; jj != K; ++jj){
+      gsl_vector_free((gaussians+jj)->mm);
+      gsl_matrix_free((gaussians+jj)->VV);
+    }
+    free(gaussians);
+    free(train);
+    free(test);
+  }
+  free(data);
+  free(views);
+
+  return 0;
+}
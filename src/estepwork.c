@@ -0,0 +1,59 @@
+/*
+  NAME:
+     alloc_estepwork, free_estepwork
+  PURPOSE:
+     allocate (free) the per-thread scratch space used by the E-step, such
+     that it does not need to be allocated for every data point; every
+     workspace is sized to the largest data dimension and the E-step works
+     on views of the leading di x di block for a data point of dimension di
+  CALLING SEQUENCE:
+     alloc_estepwork(int nws, int d, int dmax)
+     free_estepwork(struct estepwork * ws, int nws)
+  INPUT:
+     nws  - number of workspaces (one per thread)
+     d    - dimension of the model gaussians
+     dmax - maximum dimension of the data
+     ws   - workspaces to free
+  OUTPUT:
+     pointer to nws workspaces
+  REVISION HISTORY:
+     2026-10-18 - Written
+*/
+#include <stdlib.h>
+#include <gsl/gsl_matrix.h>
+#include <gsl/gsl_vector.h>
+#include <gsl/gsl_permutation.h>
+#include <proj_gauss_mixtures.h>
+
+struct estepwork * alloc_estepwork(int nws, int d, int dmax){
+  struct estepwork * ws;
+  int kk;
+  ws = (struct estepwork *) malloc(nws * sizeof (struct estepwork) );
+  for (kk = 0; kk != nws; ++kk){
+    (ws+kk)->p = gsl_permutation_alloc (dmax);
+    (ws+kk)->wminusRm = gsl_vector_alloc (dmax);
+    (ws+kk)->TinvwminusRm = gsl_vector_alloc (dmax);
+    (ws+kk)->Tij = gsl_matrix_alloc(dmax,dmax);
+    (ws+kk)->Tij_inv = gsl_matrix_alloc(dmax,dmax);
+    (ws+kk)->VRT = gsl_matrix_alloc(d,dmax);
+    (ws+kk)->VRTTinv = gsl_matrix_alloc(d,dmax);
+    (ws+kk)->Rtrans = gsl_matrix_alloc(d,dmax);
+  }
+  return ws;
+}
+
+void free_estepwork(struct estepwork * ws, int nws){
+  int kk;
+  for (kk = 0; kk != nws; ++kk){
+    gsl_permutation_free((ws+kk)->p);
+    gsl_vector_free((ws+kk)->wminusRm);
+    gsl_vector_free((ws+kk)->TinvwminusRm);
+    gsl_matrix_free((ws+kk)->Tij);
+    gsl_matrix_free((ws+kk)->Tij_inv);
+    gsl_matrix_free((ws+kk)->VRT);
+    gsl_matrix_free((ws+kk)->VRTTinv);
+    gsl_matrix_free((ws+kk)->Rtrans);
+  }
+  free(ws);
+  return;
+}
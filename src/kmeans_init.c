@@ -0,0 +1,256 @@
+/*
+  NAME:
+     kmeans_init
+  PURPOSE:
+     initial conditions for the model gaussians from k-means: greedy
+     k-means++ seeding (Arthur & Vassilvitskii 2007; the best of
+     2+log(K) candidates for every center) followed by Lloyd iterations,
+     optionally on a random subsample of the data; the amplitudes are the
+     fractions of the data points in each cluster, the means the cluster
+     means, and the covariances the cluster covariances minus the average
+     error covariance of the cluster (scaled down as needed to keep them
+     positive definite); projections are ignored (called from python)
+  CALLING SEQUENCE:
+     kmeans_init(double * ydata, double * ycovar, int N, int d, int K,
+     char diagerrors, int niter, int nsub, unsigned long int seed,
+     double * amp, double * xmean, double * xcovar)
+  INPUT:
+     ydata        - [N,d] data
+     ycovar       - [N,d,d] or [N,d] (diagerrors) error covariances
+     N            - number of data points
+     d            - dimension of the data
+     K            - number of gaussians (<= the number of data points used)
+     diagerrors   - the ycovar errors-squared are diagonal
+     niter        - maximum number of Lloyd iterations
+     nsub         - if 0 < nsub < N, only use a random subsample of nsub
+                    data points
+     seed         - seed of the random number generator
+  OUTPUT:
+     amp          - [K] amplitudes
+     xmean        - [K,d] means
+     xcovar       - [K,d,d] covariances
+     returns the number of Lloyd iterations
+  REVISION HISTORY:
+     2026-10-18 - Written
+     2026-10-18 Empty clusters keep their center rather than moving to
+                the origin
+*/
+#include <stdlib.h>
+#include <float.h>
+#include <math.h>
+#include <stdbool.h>
+#include <gsl/gsl_matrix.h>
+#include <gsl/gsl_rng.h>
+#include <proj_gauss_mixtures.h>
+
+#define KMEANSMAXSHRINK 10 /* maximum number of times the error covariance is halved */
+#define KMEANSMINVAR 1.e-3 /* variance added to degenerate clusters, relative to the average cluster variance */
+
+static double dist2(double * y, double * m, int d){
+  int dd;
+  double out = 0.;
+  for (dd = 0; dd != d; ++dd)
+    out += (y[dd]-m[dd]) * (y[dd]-m[dd]);
+  return out;
+}
+
+/* distance of every data point to its closest center, from centers k0 on */
+static bool assign(double * ydata, int * idx, int n, int d, double * xmean,
+		   int k0, int K, int * label, double * mind2){
+  int ii, kk;
+  bool changed = false;
+  double thisd2;
+#pragma omp parallel for schedule(static) private(kk,thisd2) reduction(||:changed)
+  for (ii = 0; ii < n; ++ii){
+    for (kk = k0; kk != K; ++kk){
+      thisd2 = dist2(ydata+(long long int) idx[ii]*d,xmean+kk*d,d);
+      if ( kk == 0 || thisd2 < mind2[ii] ){
+	if ( label[ii] != kk ) changed = true;
+	mind2[ii] = thisd2;
+	label[ii] = kk;
+      }
+    }
+  }
+  return changed;
+}
+
+int kmeans_init(double * ydata, double * ycovar, int N, int d, int K,
+		char diagerrors, int niter, int nsub, unsigned long int seed,
+		double * amp, double * xmean, double * xcovar){
+  bool diagerrs = (bool) diagerrors;
+  int ii, jj, kk, dd1, dd2, nshrink, iter = 0;
+  int n = ( nsub > 0 && nsub < N ) ? nsub : N;
+  double total, u, lndet, shrink, avgvar;
+  double * y, * c;
+  gsl_rng * randgen = gsl_rng_alloc(gsl_rng_mt19937);
+  gsl_rng_set(randgen,seed);
+  //The data points that are used: the first n of a random permutation
+  int * idx = (int *) malloc(N * sizeof (int) );
+  for (ii = 0; ii != N; ++ii) idx[ii] = ii;
+  if ( n < N )
+    for (ii = 0; ii != n; ++ii){
+      jj = ii + (int) gsl_rng_uniform_int(randgen,N-ii);
+      kk = idx[ii];
+      idx[ii] = idx[jj];
+      idx[jj] = kk;
+    }
+  int * label = (int *) malloc(n * sizeof (int) );
+  int * count = (int *) malloc(K * sizeof (int) );
+  double * mind2 = (double *) malloc(n * sizeof (double) );
+  for (ii = 0; ii != n; ++ii) label[ii] = -1;
+
+  //greedy k-means++: every next center is the best of ntrial data points
+  //drawn with probability proportional to their squared distance to the
+  //closest center so far
+  int tt, ntrial = 2 + (int) log(K), besttrial = 0;
+  double potential, bestpotential;
+  for (kk = 0; kk != K; ++kk){
+    if ( kk == 0 )
+      jj = (int) gsl_rng_uniform_int(randgen,n);
+    else {
+      total = 0.;
+      for (ii = 0; ii != n; ++ii) total += mind2[ii];
+      bestpotential = DBL_MAX;
+      for (tt = 0; tt != ntrial; ++tt){
+	if ( total <= 0. )
+	  jj = (int) gsl_rng_uniform_int(randgen,n);
+	else {
+	  u = gsl_rng_uniform(randgen) * total;
+	  for (jj = 0; jj != n-1; ++jj){
+	    u -= mind2[jj];
+	    if ( u < 0. ) break;
+	  }
+	}
+	y = ydata+(long long int) idx[jj]*d;
+	potential = 0.;
+#pragma omp parallel for schedule(static) reduction(+:potential)
+	for (ii = 0; ii < n; ++ii)
+	  potential += fmin(mind2[ii],dist2(ydata+(long long int) idx[ii]*d,y,d));
+	if ( potential < bestpotential ){
+	  bestpotential = potential;
+	  besttrial = jj;
+	}
+      }
+      jj = besttrial;
+    }
+    for (dd1 = 0; dd1 != d; ++dd1)
+      xmean[kk*d+dd1] = ydata[(long long int) idx[jj]*d+dd1];
+    assign(ydata,idx,n,d,xmean,kk,kk+1,label,mind2);
+  }
+
+  //Lloyd iterations
+  while ( iter < niter ){
+    ++iter;
+    for (kk = 0; kk != K; ++kk) count[kk] = 0;
+    for (kk = 0; kk != K*d; ++kk) xmean[kk] = 0.;
+    for (ii = 0; ii != n; ++ii){
+      ++count[label[ii]];
+      y = ydata+(long long int) idx[ii]*d;
+      for (dd1 = 0; dd1 != d; ++dd1)
+	xmean[label[ii]*d+dd1] += y[dd1];
+    }
+    for (kk = 0; kk != K; ++kk){
+      if ( count[kk] > 0 ){
+	for (dd1 = 0; dd1 != d; ++dd1)
+	  xmean[kk*d+dd1] /= count[kk];
+	continue;
+      }
+      //Re-seed an empty cluster at the data point farthest from its center
+      jj = 0;
+      for (ii = 1; ii != n; ++ii)
+	if ( mind2[ii] > mind2[jj] ) jj = ii;
+      for (dd1 = 0; dd1 != d; ++dd1)
+	xmean[kk*d+dd1] = ydata[(long long int) idx[jj]*d+dd1];
+      mind2[jj] = 0.;
+    }
+    if ( ! assign(ydata,idx,n,d,xmean,0,K,label,mind2) ) break;
+  }
+
+  //Amplitudes, means, and deconvolved covariances of the clusters; an
+  //empty cluster keeps its center
+  for (kk = 0; kk != K; ++kk) count[kk] = 0;
+  for (ii = 0; ii != n; ++ii) ++count[label[ii]];
+  for (kk = 0; kk != K; ++kk)
+    if ( count[kk] > 0 )
+      for (dd1 = 0; dd1 != d; ++dd1) xmean[kk*d+dd1] = 0.;
+  for (ii = 0; ii != n; ++ii){
+    y = ydata+(long long int) idx[ii]*d;
+    for (dd1 = 0; dd1 != d; ++dd1)
+      xmean[label[ii]*d+dd1] += y[dd1];
+  }
+  for (kk = 0; kk != K; ++kk)
+    if ( count[kk] > 0 )
+      for (dd1 = 0; dd1 != d; ++dd1) xmean[kk*d+dd1] /= count[kk];
+  //scatter in xcovar, average error covariance in errs
+  double * errs = (double *) calloc(K*d*d,sizeof (double) );
+  for (kk = 0; kk != K*d*d; ++kk) xcovar[kk] = 0.;
+  avgvar = 0.;
+  for (ii = 0; ii != n; ++ii){
+    kk = label[ii];
+    y = ydata+(long long int) idx[ii]*d;
+    c = ycovar+(long long int) idx[ii]*(diagerrs ? d : d*d);
+    for (dd1 = 0; dd1 != d; ++dd1){
+      for (dd2 = 0; dd2 != d; ++dd2)
+	xcovar[kk*d*d+dd1*d+dd2] += (y[dd1]-xmean[kk*d+dd1])
+	  * (y[dd2]-xmean[kk*d+dd2]);
+      if ( diagerrs )
+	errs[kk*d*d+dd1*d+dd1] += c[dd1];
+      else
+	for (dd2 = 0; dd2 != d; ++dd2)
+	  errs[kk*d*d+dd1*d+dd2] += c[dd1*d+dd2];
+    }
+    avgvar += mind2[ii];
+  }
+  //a cluster that is a single point gets a covariance the size of the
+  //average cluster
+  avgvar /= (double) n * d;
+  if ( avgvar <= 0. ) avgvar = 1.;
+  gsl_matrix * work = gsl_matrix_alloc(d,d);
+  gsl_matrix_view V;
+  for (kk = 0; kk != K; ++kk){
+    amp[kk] = (double) count[kk] / n;
+    for (dd1 = 0; dd1 != d*d; ++dd1){
+      xcovar[kk*d*d+dd1] /= ( count[kk] > 0 ) ? count[kk] : 1;
+      errs[kk*d*d+dd1] /= ( count[kk] > 0 ) ? count[kk] : 1;
+    }
+    V = gsl_matrix_view_array(xcovar+kk*d*d,d,d);
+    if ( count[kk] < 2 )
+      for (dd1 = 0; dd1 != d; ++dd1)
+	gsl_matrix_set(&(V.matrix),dd1,dd1,avgvar);
+    //subtract as much of the error covariance as possible
+    shrink = 1.;
+    for (nshrink = 0; nshrink <= KMEANSMAXSHRINK; ++nshrink){
+      for (dd1 = 0; dd1 != d*d; ++dd1)
+	gsl_matrix_set(work,dd1 / d,dd1 % d,
+		       xcovar[kk*d*d+dd1] - shrink * errs[kk*d*d+dd1]);
+      if ( bovy_cholesky(work,&lndet) == 0 ) break;
+      shrink *= 0.5;
+    }
+    if ( nshrink > KMEANSMAXSHRINK ) shrink = 0.;
+    for (dd1 = 0; dd1 != d*d; ++dd1)
+      xcovar[kk*d*d+dd1] -= shrink * errs[kk*d*d+dd1];
+    //a degenerate cluster (e.g., on a line)
+    for (dd1 = 0; dd1 != d*d; ++dd1)
+      gsl_matrix_set(work,dd1 / d,dd1 % d,xcovar[kk*d*d+dd1]);
+    if ( bovy_cholesky(work,&lndet) )
+      for (dd1 = 0; dd1 != d; ++dd1)
+	xcovar[kk*d*d+dd1*d+dd1] += KMEANSMINVAR * avgvar;
+  }
+  //empty clusters keep a small amplitude
+  total = 0.;
+  for (kk = 0; kk != K; ++kk){
+    if ( amp[kk] == 0. ) amp[kk] = 1. / n;
+    total += amp[kk];
+  }
+  for (kk = 0; kk != K; ++kk) amp[kk] /= total;
+
+  gsl_matrix_free(work);
+  gsl_rng_free(randgen);
+  free(idx);
+  free(label);
+  free(count);
+  free(mind2);
+  free(errs);
+
+  return iter;
+}
@@ -0,0 +1,174 @@
+/*
+  NAME:
+     lowdim_estep
+  PURPOSE:
+     E-step for a single data point and gaussian when there are no
+     projections and the dimension is small (d <= LOWDIMMAX), using
+     closed-form inverses and determinants on the stack instead of gsl
+     decompositions
+  CALLING SEQUENCE:
+     lowdim_estep(int d, gsl_vector * ww, gsl_matrix * SS, bool diagerrs,
+     gsl_vector * mm, gsl_matrix * VV, double * lndet, double * exponent,
+     gsl_vector * bbij, gsl_matrix * BBij)
+  INPUT:
+     d        - dimension (<= LOWDIMMAX)
+     ww       - data point
+     SS       - error covariance of the data point ([d,1] if diagerrs)
+     diagerrs - SS is diagonal
+     mm       - mean of the gaussian
+     VV       - covariance of the gaussian (only the upper triangle is used)
+  OUTPUT:
+     lndet    - log determinant of Tij = VV + SS
+     exponent - (w-m)^T Tij^-1 (w-m)
+     bbij     - bij (not calculated if NULL)
+     BBij     - bij bij^T + Bij (full matrix, not calculated if NULL)
+     returns 0 on success and 1 if Tij is numerically not positive
+     definite, in which case the caller should use the general E-step
+  REVISION HISTORY:
+     2026-10-18 - Written
+*/
+#include <math.h>
+#include <stdbool.h>
+#include <gsl/gsl_matrix.h>
+#include <gsl/gsl_vector.h>
+#include <proj_gauss_mixtures.h>
+
+/* inverse and log determinant of a symmetric 2x2 matrix [[a,b],[b,c]] */
+static inline bool invert2(double a, double b, double c, double * ia,
+			   double * ib, double * ic, double * det){
+  *det = a * c - b * b;
+  if ( a <= 0. || *det <= 0. ) return false;
+  *ia = c / *det;
+  *ib = -b / *det;
+  *ic = a / *det;
+  return true;
+}
+
+static inline bool lowdim_invert(int d, double T[LOWDIMMAX][LOWDIMMAX],
+				 double Tinv[LOWDIMMAX][LOWDIMMAX],
+				 double * lndet){
+  double det, c00, c01, c02, c11, c12, c22;
+  double Ai00, Ai01, Ai11, detA, S00, S01, S11, Si00, Si01, Si11, detS;
+  double AiB[2][2], X[2][2];
+  int kk, ll, mm;
+  switch (d){
+  case 1:
+    if ( T[0][0] <= 0. ) return false;
+    Tinv[0][0] = 1. / T[0][0];
+    *lndet = log(T[0][0]);
+    return true;
+  case 2:
+    if ( ! invert2(T[0][0],T[0][1],T[1][1],&Tinv[0][0],&Tinv[0][1],
+		   &Tinv[1][1],&det) ) return false;
+    Tinv[1][0] = Tinv[0][1];
+    *lndet = log(det);
+    return true;
+  case 3:
+    c00 = T[1][1] * T[2][2] - T[1][2] * T[1][2];
+    c01 = T[0][2] * T[1][2] - T[0][1] * T[2][2];
+    c02 = T[0][1] * T[1][2] - T[0][2] * T[1][1];
+    c11 = T[0][0] * T[2][2] - T[0][2] * T[0][2];
+    c12 = T[0][1] * T[0][2] - T[0][0] * T[1][2];
+    c22 = T[0][0] * T[1][1] - T[0][1] * T[0][1];
+    det = T[0][0] * c00 + T[0][1] * c01 + T[0][2] * c02;
+    if ( T[0][0] <= 0. || c22 <= 0. || det <= 0. ) return false;
+    Tinv[0][0] = c00 / det;
+    Tinv[0][1] = Tinv[1][0] = c01 / det;
+    Tinv[0][2] = Tinv[2][0] = c02 / det;
+    Tinv[1][1] = c11 / det;
+    Tinv[1][2] = Tinv[2][1] = c12 / det;
+    Tinv[2][2] = c22 / det;
+    *lndet = log(det);
+    return true;
+  case 4:
+    //Block inverse: T = [[A,B],[B^T,D]], with S = D - B^T A^-1 B
+    if ( ! invert2(T[0][0],T[0][1],T[1][1],&Ai00,&Ai01,&Ai11,&detA) )
+      return false;
+    for (ll = 0; ll != 2; ++ll){
+      AiB[0][ll] = Ai00 * T[0][2+ll] + Ai01 * T[1][2+ll];
+      AiB[1][ll] = Ai01 * T[0][2+ll] + Ai11 * T[1][2+ll];
+    }
+    S00 = T[2][2] - T[0][2] * AiB[0][0] - T[1][2] * AiB[1][0];
+    S01 = T[2][3] - T[0][2] * AiB[0][1] - T[1][2] * AiB[1][1];
+    S11 = T[3][3] - T[0][3] * AiB[0][1] - T[1][3] * AiB[1][1];
+    if ( ! invert2(S00,S01,S11,&Si00,&Si01,&Si11,&detS) ) return false;
+    //X = A^-1 B S^-1, Tinv = [[A^-1 + X B^T A^-1, -X],[-X^T, S^-1]]
+    for (kk = 0; kk != 2; ++kk){
+      X[kk][0] = AiB[kk][0] * Si00 + AiB[kk][1] * Si01;
+      X[kk][1] = AiB[kk][0] * Si01 + AiB[kk][1] * Si11;
+    }
+    Tinv[0][0] = Ai00;
+    Tinv[0][1] = Ai01;
+    Tinv[1][1] = Ai11;
+    for (kk = 0; kk != 2; ++kk)
+      for (ll = kk; ll != 2; ++ll)
+	for (mm = 0; mm != 2; ++mm)
+	  Tinv[kk][ll] += X[kk][mm] * AiB[ll][mm];
+    Tinv[1][0] = Tinv[0][1];
+    for (kk = 0; kk != 2; ++kk)
+      for (ll = 0; ll != 2; ++ll){
+	Tinv[kk][2+ll] = -X[kk][ll];
+	Tinv[2+ll][kk] = -X[kk][ll];
+      }
+    Tinv[2][2] = Si00;
+    Tinv[2][3] = Tinv[3][2] = Si01;
+    Tinv[3][3] = Si11;
+    *lndet = log(detA) + log(detS);
+    return true;
+  default:
+    return false;
+  }
+}
+
+int lowdim_estep(int d, gsl_vector * ww, gsl_matrix * SS, bool diagerrs,
+		 gsl_vector * mm, gsl_matrix * VV, double * lndet,
+		 double * exponent, gsl_vector * bbij, gsl_matrix * BBij){
+  double V[LOWDIMMAX][LOWDIMMAX], T[LOWDIMMAX][LOWDIMMAX];
+  double Tinv[LOWDIMMAX][LOWDIMMAX], TinvV[LOWDIMMAX][LOWDIMMAX];
+  double delta[LOWDIMMAX], u[LOWDIMMAX], bb[LOWDIMMAX];
+  double tmp;
+  int kk, ll, mm2;
+  //Tij = VV + SS, using only the upper triangle of VV
+  for (kk = 0; kk != d; ++kk)
+    for (ll = kk; ll != d; ++ll){
+      V[kk][ll] = V[ll][kk] = VV->data[kk*VV->tda+ll];
+      if ( diagerrs )
+	T[kk][ll] = V[kk][ll] + ((kk == ll) ? SS->data[kk*SS->tda] : 0.);
+      else
+	T[kk][ll] = V[kk][ll] + SS->data[kk*SS->tda+ll];
+      T[ll][kk] = T[kk][ll];
+    }
+  if ( ! lowdim_invert(d,T,Tinv,lndet) ) return 1;
+  //exponent = delta^T Tinv delta, with delta = w-m
+  for (kk = 0; kk != d; ++kk)
+    delta[kk] = ww->data[kk*ww->stride] - mm->data[kk*mm->stride];
+  *exponent = 0.;
+  for (kk = 0; kk != d; ++kk){
+    u[kk] = 0.;
+    for (ll = 0; ll != d; ++ll)
+      u[kk] += Tinv[kk][ll] * delta[ll];
+    *exponent += delta[kk] * u[kk];
+  }
+  if ( bbij == NULL ) return 0;
+  //bij = m + V Tinv (w-m), Bij = V - V Tinv V
+  for (kk = 0; kk != d; ++kk){
+    bb[kk] = mm->data[kk*mm->stride];
+    for (ll = 0; ll != d; ++ll){
+      bb[kk] += V[kk][ll] * u[ll];
+      TinvV[kk][ll] = 0.;
+      for (mm2 = 0; mm2 != d; ++mm2)
+	TinvV[kk][ll] += Tinv[kk][mm2] * V[mm2][ll];
+    }
+    bbij->data[kk*bbij->stride] = bb[kk];
+  }
+  for (kk = 0; kk != d; ++kk)
+    for (ll = kk; ll != d; ++ll){
+      tmp = V[kk][ll] + bb[kk] * bb[ll];
+      for (mm2 = 0; mm2 != d; ++mm2)
+	tmp -= V[kk][mm2] * TinvV[mm2][ll];
+      BBij->data[kk*BBij->tda+ll] = tmp;
+      BBij->data[ll*BBij->tda+kk] = tmp;
+    }
+
+  return 0;
+}
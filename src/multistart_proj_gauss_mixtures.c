@@ -0,0 +1,150 @@
+/*
+  NAME:
+     multistart_proj_gauss_mixtures
+  PURPOSE:
+     run the projected gaussian mixtures algorithm from several initial
+     conditions on the same data, running the restarts in parallel on a
+     single set of views of the data; after pruneiter EM iterations,
+     restarts whose log likelihood trails that of the best restart by more
+     than prunetol are abandoned, the others are run to convergence
+     (called from python)
+  CALLING SEQUENCE:
+     multistart_proj_gauss_mixtures(int R, double * ydata,
+     long long int * ystrides, double * ycovar, long long int * cstrides,
+     double * projection, long long int * pstrides, double * logweights,
+     long long int wstride, int N, int dy, double * amp, double * xmean,
+     double * xcovar, int d, int K, char * fixamp, char * fixmean,
+     char * fixcovar, double * avgloglikedata, double tol,
+     long long int maxiter, double w, int splitnmerge, char noprojection,
+     char diagerrors, char noweights, long long int pruneiter,
+     double prunetol, long long int * niter, char * converged,
+     char * pruned)
+  INPUT:
+     R            - number of restarts
+     ydata, ystrides, ycovar, cstrides, projection, pstrides, logweights,
+     wstride      - the data, see view_data
+     N            - number of data points
+     dy           - dimension of the data
+     amp          - [R,K] initial amplitudes of every restart
+     xmean        - [R,K,d] initial means
+     xcovar       - [R,K,d,d] initial covariances
+     d            - dimension of the gaussians
+     K            - number of gaussians
+     fix*         - [K] fix the amplitude, mean, covariance?
+     tol          - proj_EM convergence limit
+     maxiter      - maximum number of iterations in each proj_EM
+     w            - regularization parameter
+     splitnmerge  - split 'n' merge depth (only for restarts that are not
+                    pruned)
+     noprojection - don't perform any projections
+     diagerrors   - the ycovar errors-squared are diagonal
+     noweights    - don't use data-weights
+     pruneiter    - number of EM iterations after which to prune (0: don't)
+     prunetol     - prune restarts whose average log likelihood is less
+                    than that of the best restart minus prunetol
+  OUTPUT:
+     amp, xmean, xcovar - updated model gaussians of every restart
+     avgloglikedata     - [R] average log likelihood of every restart
+     niter              - [R] total number of EM iterations of every restart
+     converged          - [R] whether every restart converged to within tol
+     pruned             - [R] whether every restart was pruned
+     returns the index of the restart with the largest likelihood
+  REVISION HISTORY:
+     2026-10-18 - Written
+*/
+#include <stdlib.h>
+#include <stdbool.h>
+#include <gsl/gsl_matrix.h>
+#include <gsl/gsl_vector.h>
+#include <proj_gauss_mixtures.h>
+
+int multistart_proj_gauss_mixtures(int R, double * ydata,
+				   long long int * ystrides, double * ycovar,
+				   long long int * cstrides,
+				   double * projection,
+				   long long int * pstrides,
+				   double * logweights, long long int wstride,
+				   int N, int dy, double * amp, double * xmean,
+				   double * xcovar, int d, int K, char * fixamp,
+				   char * fixmean, char * fixcovar,
+				   double * avgloglikedata, double tol,
+				   long long int maxiter, double w,
+				   int splitnmerge, char noprojection,
+				   char diagerrors, char noweights,
+				   long long int pruneiter, double prunetol,
+				   long long int * niter, char * converged,
+				   char * pruned){
+  bool noproj= (bool) noprojection;
+  bool noweight= (bool) noweights;
+  bool diagerrs= (bool) diagerrors;
+  int rr, phase, best= 0;
+  //Views of the data, shared by all restarts
+  struct dataviews * views;
+  struct datapoint * data = view_data(ydata,ycovar,projection,logweights,N,
+				      dy,d,ystrides,cstrides,pstrides,wstride,
+				      noproj,diagerrs,noweight,&views);
+  for (rr = 0; rr != R; ++rr){
+    niter[rr]= 0;
+    converged[rr]= (char) false;
+    pruned[rr]= (char) false;
+  }
+  //Phase 0: the first pruneiter iterations of all restarts, phase 1: the
+  //remaining restarts to convergence
+  for (phase = ( pruneiter > 0 ) ? 0 : 1; phase != 2; ++phase){
+    if ( phase == 1 && pruneiter > 0 ){
+      for (rr = 1; rr != R; ++rr)
+	if ( avgloglikedata[rr] > avgloglikedata[best] ) best= rr;
+      for (rr = 0; rr != R; ++rr)
+	if ( avgloglikedata[rr] < avgloglikedata[best] - prunetol )
+	  pruned[rr]= (char) true;
+    }
+    //Each restart is fit by a single thread
+#pragma omp parallel for schedule(dynamic,1)
+    for (rr = 0; rr < R; ++rr){
+      long long int off= (long long int) rr * K, thisniter;
+      bool thisconverged;
+      int jj, dd1, dd2;
+      if ( pruned[rr] ) continue;
+      struct gaussian * gaussians = (struct gaussian *) malloc (K * sizeof (struct gaussian) );
+      for (jj = 0; jj != K; ++jj){
+	(gaussians+jj)->mm = gsl_vector_alloc(d);
+	(gaussians+jj)->VV = gsl_matrix_alloc(d,d);
+	(gaussians+jj)->alpha = amp[off+jj];
+	for (dd1 = 0; dd1 != d; ++dd1)
+	  gsl_vector_set((gaussians+jj)->mm,dd1,xmean[(off+jj)*d+dd1]);
+	for (dd1 = 0; dd1 != d; ++dd1)
+	  for (dd2 = 0; dd2 != d; ++dd2)
+	    gsl_matrix_set((gaussians+jj)->VV,dd1,dd2,
+			   xcovar[(off+jj)*d*d+dd1*d+dd2]);
+      }
+      proj_gauss_mixtures(data,N,gaussians,K,(bool *) fixamp,
+			  (bool *) fixmean,(bool *) fixcovar,
+			  avgloglikedata+rr,tol,
+			  phase == 0 ? pruneiter : maxiter,false,w,
+			  phase == 0 ? 0 : splitnmerge,false,NULL,NULL,
+			  noproj,diagerrs,noweight,&thisniter,&thisconverged,
+			  NULL,NULL);
+      niter[rr]+= thisniter;
+      converged[rr]= (char) thisconverged;
+      for (jj = 0; jj != K; ++jj){
+	amp[off+jj]= (gaussians+jj)->alpha;
+	for (dd1 = 0; dd1 != d; ++dd1)
+	  xmean[(off+jj)*d+dd1]= gsl_vector_get((gaussians+jj)->mm,dd1);
+	for (dd1 = 0; dd1 != d; ++dd1)
+	  for (dd2 = 0; dd2 != d; ++dd2)
+	    xcovar[(off+jj)*d*d+dd1*d+dd2]=
+	      gsl_matrix_get((gaussians+jj)->VV,dd1,dd2);
+	gsl_vector_free((gaussians+jj)->mm);
+	gsl_matrix_free((gaussians+jj)->VV);
+      }
+      free(gaussians);
+    }
+  }
+  best= 0;
+  for (rr = 1; rr != R; ++rr)
+    if ( avgloglikedata[rr] > avgloglikedata[best] ) best= rr;
+  free(data);
+  free(views);
+
+  return best;
+}
@@ -0,0 +1,32 @@
+/*
+  NAME:
+     pairwise_sum
+  PURPOSE:
+     sum an array using pairwise summation in a fixed order, such that the
+     result does not depend on how the elements were computed (e.g., on
+     the number of threads) and the round-off error only grows as log(n)
+  CALLING SEQUENCE:
+     pairwise_sum(double * x, int n)
+  INPUT:
+     x - array
+     n - number of elements
+  OUTPUT:
+     sum of x
+  REVISION HISTORY:
+     2026-10-18 - Written
+*/
+#include <proj_gauss_mixtures.h>
+
+#define PAIRWISEBLOCK 8 /* blocks this small are summed directly */
+
+double pairwise_sum(double * x, int n){
+  double sum;
+  int ii, half;
+  if ( n <= PAIRWISEBLOCK ){
+    sum= 0.;
+    for (ii = 0; ii != n; ++ii) sum += x[ii];
+    return sum;
+  }
+  half= n / 2;
+  return pairwise_sum(x,half) + pairwise_sum(x+half,n-half);
+}
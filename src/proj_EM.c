@@ -4,13 +4,14 @@
   PURPOSE:
      goes through proj_EM
   CALLING SEQUENCE:
-     proj_EM(struct datapoint * data, int N, struct gaussian * gaussians, 
-     int K, bool * fixamp, bool * fixmean, bool * fixcovar, 
+     proj_EM(struct xdcontext * ctx, struct datapoint * data, int N,
+     struct gaussian * gaussians, int K, bool * fixamp, bool * fixmean, bool * fixcovar, 
      double * avgloglikedata, double tol,long long int maxiter, 
      bool likeonly, double w,int partial_indx[3],double * qstarij,
      bool keeplog, FILE *logfile, FILE *tmplogfile, bool noproj, 
      bool diagerrs, bool noweight)
   INPUT:
+     ctx          - state of this fit
      data         - the data
      N            - number of data points
      gaussians    - model gaussians
@@ -31,46 +32,68 @@
      noweight     - don't use data-weights
   OUTPUT:
      avgloglikedata - average log likelihood of the data
+     ctx->niter     - increased by the number of iterations
+     ctx->converged - whether the log likelihood converged to within tol
   REVISION HISTORY:
      2008-09-21 - Written Bovy
      2010-03-01 Added noproj option - Bovy
      2010-04-01 Added noweight option - Bovy
+     2026-10-18 Keep all state in the context of the fit
+     2026-10-18 Report the number of iterations and convergence
+     2026-10-18 Optionally accelerated with SQUAREM (ctx->accelerate)
+     2026-10-18 Record the number of iterations in ctx->stats
+     2026-10-18 Stop early if a split and merge move is hopeless
 */
 #include <stdio.h>
 #include <math.h>
 #include <proj_gauss_mixtures.h>
 
-void proj_EM(struct datapoint * data, int N, struct gaussian * gaussians, 
-	     int K,bool * fixamp, bool * fixmean, bool * fixcovar, 
+void proj_EM(struct xdcontext * ctx, struct datapoint * data, int N,
+	     struct gaussian * gaussians, int K,bool * fixamp, bool * fixmean, bool * fixcovar, 
 	     double * avgloglikedata, double tol,long long int maxiter, 
 	     bool likeonly, double w, bool keeplog, FILE *logfile,
 	     FILE *tmplogfile, bool noproj, bool diagerrs, bool noweight){
-  double diff = 2. * tol, oldavgloglikedata;
+  double diff = 2. * tol, oldavgloglikedata = 0., olderavgloglikedata = 0.;
   int niter = 0;
   int d = (gaussians->mm)->size;
-  halflogtwopi  = 0.5 * log(8. * atan(1.0));
-  while ( diff > tol && niter < maxiter){
-    proj_EM_step(data,N,gaussians,K,fixamp,fixmean,fixcovar,avgloglikedata,
-		 likeonly,w,noproj,diagerrs,noweight);
-    if (keeplog){
-      fprintf(logfile,"%f\n",*avgloglikedata);
-      fprintf(tmplogfile,"%f\n",*avgloglikedata);
-      fflush(logfile);
-      fflush(tmplogfile);
-      //printf("%f\n",*avgloglikedata);
-    }
-    if (niter > 0){
-      diff = *avgloglikedata - oldavgloglikedata;
-      if (diff < 0){
-	printf("Warning: log likelihood decreased by %g\n",diff);
-	//fprintf(logfile,"oldavgloglike was %g\navgloglike is %g\n",oldavgloglikedata,*avgloglikedata);
+  long long int startniter = ctx->niter;
+  ctx->halflogtwopi  = 0.5 * log(8. * atan(1.0));
+  if ( ctx->accelerate && ! likeonly )
+    proj_EM_squarem(ctx,data,N,gaussians,K,fixamp,fixmean,fixcovar,
+		    avgloglikedata,tol,maxiter,w,keeplog,logfile,tmplogfile,
+		    noproj,diagerrs,noweight);
+  else {
+    while ( diff > tol && niter < maxiter){
+      proj_EM_step(ctx,data,N,gaussians,K,fixamp,fixmean,fixcovar,avgloglikedata,
+		   likeonly,w,noproj,diagerrs,noweight);
+      if (keeplog){
+	fprintf(logfile,"%f\n",*avgloglikedata);
+	fprintf(tmplogfile,"%f\n",*avgloglikedata);
+	fflush(logfile);
+	fflush(tmplogfile);
+	//printf("%f\n",*avgloglikedata);
+      }
+      if (niter > 0){
+	diff = *avgloglikedata - oldavgloglikedata;
+	if (diff < 0){
+	  printf("Warning: log likelihood decreased by %g\n",diff);
+	  //fprintf(logfile,"oldavgloglike was %g\navgloglike is %g\n",oldavgloglikedata,*avgloglikedata);
+	}
       }
+      if (likeonly) break;
+      ++niter;
+      //give up on a split and merge move that will not improve
+      if ( niter > 2 && snm_hopeless(ctx,niter,olderavgloglikedata,
+				       oldavgloglikedata,*avgloglikedata) )
+	break;
+      olderavgloglikedata = oldavgloglikedata;
+      oldavgloglikedata = *avgloglikedata;
+      //write_model("result.dat");
     }
-    oldavgloglikedata = *avgloglikedata;
-    if (likeonly) break;
-    ++niter;
-    //write_model("result.dat");
+    ctx->niter += niter;
+    ctx->converged = likeonly || diff <= tol;
   }
+  if ( ctx->stats != NULL ) xdstats_em(ctx->stats,ctx->niter - startniter);
   
  //post-processing: only the upper right of VV was computed, copy this to the lower left of VV
   int dd1,dd2,kk;
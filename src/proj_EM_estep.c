@@ -0,0 +1,292 @@
+/*
+  NAME:
+     proj_EM_estep
+  PURPOSE:
+     E-step of proj_EM on (a chunk of) the data: calculates the posterior
+     probabilities qij and adds the sufficient statistics of the M-step to
+     the accumulators in the context; qij is only kept for all data
+     points if ctx->denseqij, otherwise every thread reuses a single row
+  CALLING SEQUENCE:
+     proj_EM_estep(struct xdcontext * ctx, struct datapoint * data, int N,
+     struct gaussian * gaussians, int K, double * sumloglike, bool noproj,
+     bool diagerrs, bool noweight)
+  INPUT:
+     ctx          - state of this fit (scratch space, qij, accumulators)
+     data         - the data (or the current chunk of the data)
+     N            - number of data points in data
+     gaussians    - model gaussians
+     K            - number of model gaussians
+     noproj       - don't perform any projections
+     diagerrs     - the data->SS errors-squared are diagonal
+     noweight     - don't use data-weights
+  OUTPUT:
+     sumloglike   - increased by the summed log likelihood of the data
+     ctx->qij     - [N,K] log posterior probabilities (if ctx->denseqij);
+                    if ctx->fixedlognorm is set, the posterior
+                    probabilities are normalized including the components
+                    that are not part of gaussians
+     ctx->lognorm - [N] log of the summed alpha N of every data point (if
+                    not NULL)
+     ctx->newgaussians - increased by the sums of qij, qij bij, and
+                         qij (bij bij^T + Bij) over each of the
+                         ctx->nblocks fixed blocks of the data
+  REVISION HISTORY:
+     2008-09-21 - Written Bovy (as part of proj_EM_step)
+     2010-03-01 Added noproj option - Bovy
+     2010-04-01 Added noweight option - Bovy
+     2026-10-18 Cholesky-based E-step, LU only as a fallback
+     2026-10-18 Closed-form E-step for low-dimensional data
+     2026-10-18 Use per-thread workspaces instead of allocating per point
+     2026-10-18 Normalize qij without a critical section, deterministic
+                sum of the log likelihood
+     2026-10-18 Keep all state in the context of the fit
+     2026-10-18 Split off from proj_EM_step, such that the data can be
+                processed in chunks
+     2026-10-18 Accumulate the summed qij on the fly, such that the full
+                qij is only needed for split and merge
+     2026-10-18 Normalize with the components outside of the model
+                (ctx->fixedlognorm), keep the log normalization
+                (ctx->lognorm)
+     2026-10-18 Accumulate over fixed blocks of the data rather than per
+                thread, such that the result does not depend on the
+                number of threads
+*/
+#ifdef _OPENMP
+#include <omp.h>
+#endif
+
+#include <math.h>
+#include <gsl/gsl_matrix.h>
+#include <gsl/gsl_vector.h>
+#include <gsl/gsl_linalg.h>
+#include <gsl/gsl_blas.h>
+#include <proj_gauss_mixtures.h>
+
+void proj_EM_estep(struct xdcontext * ctx, struct datapoint * data, int N,
+		   struct gaussian * gaussians, int K, double * sumloglike,
+		   bool noproj, bool diagerrs, bool noweight){
+  struct datapoint * thisdata;
+  struct gaussian * thisgaussian;
+  struct gaussian * thisnewgaussian;
+  int signum,di,cholfail,tid;
+  double exponent,lndetTij;
+  double currqij, lognormi, fixedlognormi;
+  struct modelbs * thisbs;
+  struct estepwork * thisws;
+  gsl_permutation pp;
+  gsl_vector_view wminusRmview, TinvwminusRmview;
+  gsl_matrix_view Tijview, Tij_invview, VRTview, VRTTinvview, Rtransview;
+  gsl_permutation * p;
+  gsl_vector * wminusRm, * TinvwminusRm;
+  gsl_matrix * Tij, * Tij_inv, * VRT, * VRTTinv, * Rtrans;
+  int d = (gaussians->VV)->size1;//dim of mm
+  bool lowdim = noproj && d <= LOWDIMMAX;
+  int nthreads = ctx->nthreads;
+  int nblocks = ctx->nblocks;
+  double halflogtwopi = ctx->halflogtwopi;
+  struct gaussian * newgaussians = ctx->newgaussians;
+  gsl_matrix * qij = ctx->qij;
+  double * loglikei = ctx->loglikei;
+  struct modelbs * bs = ctx->bs;
+  struct estepwork * ws = ctx->ws;
+  bool denseqij = ctx->denseqij;
+  double * lognorm = ctx->lognorm;
+  double * fixedlognorm = ctx->fixedlognorm;
+  int kk, qrow;
+
+  //loop over data and gaussians to accumulate the sufficient statistics;
+  //every fixed block of the data is accumulated in order by a single
+  //thread, such that the sums do not depend on the number of threads
+  int ii, jj, ll, bb;
+  long long int start, end;
+  double sumSV;
+#pragma omp parallel for schedule(dynamic,1) num_threads(nthreads) \
+  private(tid,di,signum,cholfail,lndetTij,exponent,lognormi,fixedlognormi,bb,start,end,ii,jj,ll,kk,Tij,Tij_inv,wminusRm,p,VRTTinv,sumSV,VRT,TinvwminusRm,Rtrans,thisgaussian,thisdata,thisbs,thisnewgaussian,currqij,qrow,thisws,pp,wminusRmview,TinvwminusRmview,Tijview,Tij_invview,VRTview,VRTTinvview,Rtransview) \
+  shared(newgaussians,gaussians,bs,ws,K,d,data,loglikei,lognorm,fixedlognorm)
+  for (bb = 0; bb < nblocks; ++bb){
+#ifdef _OPENMP
+  tid= omp_get_thread_num();
+#else
+  tid = 0;
+#endif
+  start= (long long int) N * bb / nblocks;
+  end= (long long int) N * (bb+1) / nblocks;
+  for (ii = start; ii < end; ++ii){
+    thisdata= data+ii;
+    qrow = denseqij ? ii : tid;
+    di = (thisdata->SS)->size1;
+    //printf("Datapoint has dimension %i\n",di);
+    //Work on views of the leading part of this thread's workspace
+    thisws= ws+tid;
+    pp.size= di;
+    pp.data= thisws->p->data;
+    p= &pp;
+    wminusRmview= gsl_vector_subvector(thisws->wminusRm,0,di);
+    wminusRm= &(wminusRmview.vector);
+    TinvwminusRmview= gsl_vector_subvector(thisws->TinvwminusRm,0,di);
+    TinvwminusRm= &(TinvwminusRmview.vector);
+    Tijview= gsl_matrix_submatrix(thisws->Tij,0,0,di,di);
+    Tij= &(Tijview.matrix);
+    Tij_invview= gsl_matrix_submatrix(thisws->Tij_inv,0,0,di,di);
+    Tij_inv= &(Tij_invview.matrix);
+    VRTview= gsl_matrix_submatrix(thisws->VRT,0,0,d,di);
+    VRT= &(VRTview.matrix);
+    VRTTinvview= gsl_matrix_submatrix(thisws->VRTTinv,0,0,d,di);
+    VRTTinv= &(VRTTinvview.matrix);
+    Rtransview= gsl_matrix_submatrix(thisws->Rtrans,0,0,d,di);
+    Rtrans= &(Rtransview.matrix);
+    for (jj = 0; jj != K; ++jj){
+      //Low-dimensional data without projections: closed-form E-step
+      if ( lowdim ) {
+	thisgaussian= gaussians+jj;
+	thisbs= bs+tid*K+jj;
+	if ( lowdim_estep(d,thisdata->ww,thisdata->SS,diagerrs,
+			  thisgaussian->mm,thisgaussian->VV,&lndetTij,
+			  &exponent,thisbs->bbij,thisbs->BBij) == 0 ) {
+	  gsl_matrix_set(qij,qrow,jj,log(thisgaussian->alpha) - di * halflogtwopi - 0.5 * lndetTij -0.5 * exponent);
+	  continue;
+	}
+      }
+      //printf("%i,%i\n",(thisdata->ww)->size,wminusRm->size);
+      gsl_vector_memcpy(wminusRm,thisdata->ww);
+      //fprintf(stdout,"Where is the seg fault?\n");
+      thisgaussian= gaussians+jj;
+      //prepare...
+      if ( ! noproj ) {
+	if ( diagerrs ) {
+	  gsl_matrix_set_zero(Tij);
+	  for (ll = 0; ll != di; ++ll)
+	    gsl_matrix_set(Tij,ll,ll,gsl_matrix_get(thisdata->SS,ll,0));}
+	else
+	  gsl_matrix_memcpy(Tij,thisdata->SS);
+      }
+      //Calculate Tij
+      if ( ! noproj ) {
+	gsl_matrix_transpose_memcpy(Rtrans,thisdata->RR);
+	gsl_blas_dsymm(CblasLeft,CblasUpper,1.0,thisgaussian->VV,Rtrans,0.0,VRT);//Only the upper right part of VV is calculated --> use only that part
+	gsl_blas_dgemm(CblasNoTrans,CblasNoTrans,1.0,thisdata->RR,VRT,1.0,Tij);}//This is Tij
+      else {
+	if ( diagerrs ) {
+	  for (kk = 0; kk != d; ++kk){
+	    gsl_matrix_set(Tij,kk,kk,gsl_matrix_get(thisdata->SS,kk,0)+gsl_matrix_get(thisgaussian->VV,kk,kk));
+	    for (ll = kk+1; ll != d; ++ll){
+	      sumSV= gsl_matrix_get(thisgaussian->VV,kk,ll);
+	      gsl_matrix_set(Tij,kk,ll,sumSV);
+	      gsl_matrix_set(Tij,ll,kk,sumSV);}}}
+	else {
+	  for (kk = 0; kk != d; ++kk){
+	    gsl_matrix_set(Tij,kk,kk,gsl_matrix_get(thisdata->SS,kk,kk)+gsl_matrix_get(thisgaussian->VV,kk,kk));
+	    for (ll = kk+1; ll != d; ++ll){
+	      sumSV= gsl_matrix_get(thisdata->SS,kk,ll)+gsl_matrix_get(thisgaussian->VV,kk,ll);
+	      gsl_matrix_set(Tij,kk,ll,sumSV);
+	      gsl_matrix_set(Tij,ll,kk,sumSV);}}}}
+      //gsl_matrix_add(Tij,thisgaussian->VV);}
+      //Calculate the Cholesky decomposition of Tij; jitter the diagonal if
+      //Tij is numerically not positive definite and fall back onto the LU
+      //decomposition if that does not help either
+      gsl_matrix_memcpy(Tij_inv,Tij);//keep a copy of Tij
+      cholfail= bovy_cholesky(Tij,&lndetTij);
+      if ( cholfail ) {
+	gsl_matrix_memcpy(Tij,Tij_inv);
+	for (ll = 0; ll != di; ++ll)
+	  gsl_matrix_set(Tij,ll,ll,(1.+CHOLJITTER)*gsl_matrix_get(Tij,ll,ll));
+	cholfail= bovy_cholesky(Tij,&lndetTij);
+	if ( cholfail ) {
+	  gsl_matrix_memcpy(Tij,Tij_inv);
+	  gsl_linalg_LU_decomp(Tij,p,&signum);
+	  gsl_linalg_LU_invert(Tij,p,Tij_inv);
+	  lndetTij= gsl_linalg_LU_lndet(Tij);
+	}
+      }
+      //Calculate w-Rm
+      if ( ! noproj ) gsl_blas_dgemv(CblasNoTrans,-1.0,thisdata->RR,thisgaussian->mm,1.0,wminusRm);
+      else gsl_vector_sub(wminusRm,thisgaussian->mm);
+      //printf("wminusRm = %f\t%f\n",gsl_vector_get(wminusRm,0),gsl_vector_get(wminusRm,1));
+      //Now calculate bij and Bij
+      thisbs= bs+tid*K+jj;
+      gsl_vector_memcpy(thisbs->bbij,thisgaussian->mm);
+      gsl_matrix_memcpy(thisbs->BBij,thisgaussian->VV);
+      if ( ! cholfail ) {
+	//With Tij = L L^T and z = L^-1 (w-Rm), the exponent is z^T z,
+	//bij = m + VRT L^-T z and Bij = V - (VRT L^-T) (VRT L^-T)^T
+	gsl_blas_dtrsv(CblasLower,CblasNoTrans,CblasNonUnit,Tij,wminusRm);//wminusRm now holds z
+	gsl_blas_ddot(wminusRm,wminusRm,&exponent);
+	if ( ! noproj ) gsl_matrix_memcpy(VRTTinv,VRT);
+	else
+	  for (kk = 0; kk != d; ++kk)
+	    for (ll = kk; ll != d; ++ll){
+	      sumSV= gsl_matrix_get(thisgaussian->VV,kk,ll);
+	      gsl_matrix_set(VRTTinv,kk,ll,sumSV);
+	      gsl_matrix_set(VRTTinv,ll,kk,sumSV);}
+	gsl_blas_dtrsm(CblasRight,CblasLower,CblasTrans,CblasNonUnit,1.0,Tij,VRTTinv);//VRTTinv now holds VRT L^-T
+	gsl_blas_dgemv(CblasNoTrans,1.0,VRTTinv,wminusRm,1.0,thisbs->bbij);
+	gsl_blas_dsyrk(CblasUpper,CblasNoTrans,-1.0,VRTTinv,1.0,thisbs->BBij);
+      }
+      else {
+	//Calculate Tijinv*(w-Rm)
+	gsl_blas_dsymv(CblasUpper,1.0,Tij_inv,wminusRm,0.0,TinvwminusRm);
+	gsl_blas_ddot(wminusRm,TinvwminusRm,&exponent);
+	if ( ! noproj ) gsl_blas_dgemv(CblasNoTrans,1.0,VRT,TinvwminusRm,1.0,thisbs->bbij);
+	else gsl_blas_dsymv(CblasUpper,1.0,thisgaussian->VV,TinvwminusRm,1.0,thisbs->bbij);
+	if ( ! noproj ) {
+	  gsl_blas_dgemm(CblasNoTrans,CblasNoTrans,1.0,VRT,Tij_inv,0.0,VRTTinv);
+	  gsl_blas_dgemm(CblasNoTrans,CblasTrans,-1.0,VRTTinv,VRT,1.0,thisbs->BBij);}
+	else {
+	  gsl_blas_dsymm(CblasLeft,CblasUpper,1.0,thisgaussian->VV,Tij_inv,0.0,VRTTinv);
+	  gsl_blas_dsymm(CblasRight,CblasUpper,-1.0,thisgaussian->VV,VRTTinv,1.0,thisbs->BBij);}
+      }
+      gsl_matrix_set(qij,qrow,jj,log(thisgaussian->alpha) - di * halflogtwopi - 0.5 * lndetTij -0.5 * exponent);//This is actually the log of qij
+      //printf("bij = %f\t%f\n",gsl_vector_get(bs->bbij,0),gsl_vector_get(bs->bbij,1));
+      gsl_blas_dsyr(CblasUpper,1.0,thisbs->bbij,thisbs->BBij);//This is bijbijT + Bij, which is the relevant quantity
+      }
+    //Again loop over the gaussians to update the model(can this be more efficient? in any case this is not so bad since generally K << N)
+    //Normalize qij properly; rows are independent, so this needs no lock
+    if ( lognorm == NULL && fixedlognorm == NULL )
+      loglikei[ii]= normalize_row(qij,qrow,true,noweight,thisdata->logweight);
+    else {
+      //Add the summed alpha N of the components outside of the model to
+      //the normalization
+      lognormi= logsum(qij,qrow,true);
+      if ( fixedlognorm != NULL && bovy_isfin(fixedlognorm[ii]) ) {
+	fixedlognormi= fixedlognorm[ii];
+	lognormi= (lognormi > fixedlognormi)
+	  ? lognormi + log1p(exp(fixedlognormi-lognormi))
+	  : fixedlognormi + log1p(exp(lognormi-fixedlognormi));
+      }
+      if ( lognorm != NULL ) lognorm[ii]= lognormi;
+      for (jj = 0; jj != K; ++jj)
+	gsl_matrix_set(qij,qrow,jj,gsl_matrix_get(qij,qrow,jj)-lognormi
+		       +(noweight ? 0. : thisdata->logweight));
+      loglikei[ii]= noweight ? lognormi : lognormi*exp(thisdata->logweight);
+    }
+      //printf("qij = %f\t%f\n",gsl_matrix_get(qij,ii,0),gsl_matrix_get(qij,ii,1));
+      //printf("avgloglgge = %f\n",*avgloglikedata);
+      for (jj = 0; jj != K; ++jj){
+	currqij = exp(gsl_matrix_get(qij,qrow,jj));
+	//printf("Current qij = %f\n",currqij);
+	thisbs= bs+tid*K+jj;
+	thisnewgaussian= newgaussians+bb*K+jj;
+	thisnewgaussian->alpha += currqij;
+	if ( lowdim ) {
+	  for (kk = 0; kk != d; ++kk){
+	    thisnewgaussian->mm->data[kk] += currqij * thisbs->bbij->data[kk];
+	    for (ll = 0; ll != d; ++ll)
+	      thisnewgaussian->VV->data[kk*d+ll] += currqij * thisbs->BBij->data[kk*d+ll];
+	  }
+	}
+	else {
+	  gsl_vector_scale(thisbs->bbij,currqij);
+	  gsl_vector_add(thisnewgaussian->mm,thisbs->bbij);
+	  gsl_matrix_scale(thisbs->BBij,currqij);
+	  gsl_matrix_add(thisnewgaussian->VV,thisbs->BBij);
+	}
+	//printf("bij = %f\t%f\n",gsl_vector_get(bs->bbij,0),gsl_vector_get(bs->bbij,1));
+	//printf("Bij = %f\t%f\t%f\n",gsl_matrix_get(bs->BBij,0,0),gsl_matrix_get(bs->BBij,1,1),gsl_matrix_get(bs->BBij,0,1));
+      }
+  }
+  }
+  //Sum in a fixed order, independent of the number of threads
+  *sumloglike += pairwise_sum(loglikei,N);
+
+  return;
+}
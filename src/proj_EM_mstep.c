@@ -0,0 +1,160 @@
+/*
+  NAME:
+     proj_EM_mstep
+  PURPOSE:
+     M-step of proj_EM: updates the model gaussians from the sufficient
+     statistics accumulated by proj_EM_estep
+  CALLING SEQUENCE:
+     proj_EM_mstep(struct xdcontext * ctx, struct gaussian * gaussians,
+     int K, bool * fixamp, bool * fixmean, bool * fixcovar, double w,
+     int N, bool noweight)
+  INPUT:
+     ctx          - state of this fit (accumulators)
+     gaussians    - model gaussians
+     K            - number of model gaussians
+     fixamp       - fix the amplitude?
+     fixmean      - fix the mean?
+     fixcovar     - fix the covar?
+     w            - regularization parameter
+     N            - total number of data points
+     noweight     - don't use data-weights
+  OUTPUT:
+     updated model gaussians; the amplitudes are normalized to
+     1 - ctx->fixedamp - the fixed amplitudes
+  REVISION HISTORY:
+     2008-09-21 - Written Bovy (as part of proj_EM_step)
+     2010-04-01 Added noweight option - Bovy
+     2026-10-18 Keep all state in the context of the fit
+     2026-10-18 Split off from proj_EM_step, such that the data can be
+                processed in chunks
+     2026-10-18 Leave room for the amplitudes of the components outside
+                of the model (ctx->fixedamp)
+     2026-10-18 Gather the accumulators of the fixed blocks of the data
+                rather than of the threads
+*/
+#include <stdlib.h>
+#include <math.h>
+#include <float.h>
+#include <gsl/gsl_matrix.h>
+#include <gsl/gsl_vector.h>
+#include <gsl/gsl_blas.h>
+#include <proj_gauss_mixtures.h>
+
+#define CHUNKSIZE 1
+
+void proj_EM_mstep(struct xdcontext * ctx, struct gaussian * gaussians,
+		   int K, bool * fixamp, bool * fixmean, bool * fixcovar,
+		   double w, int N, bool noweight){
+  int nblocks = ctx->nblocks;
+  struct gaussian * newgaussians = ctx->newgaussians;
+  int kk, jj, ll;
+  int chunk;
+  chunk= CHUNKSIZE;
+
+  //check whether for some Gaussians none of the parameters get updated
+  double sumfixedamps= ctx->fixedamp;
+  bool * allfixed = (bool *) calloc(K, sizeof (bool) );
+  double ampnorm;
+  for (kk=0; kk != K; ++kk){
+    if (*fixamp == true){
+      sumfixedamps += gaussians->alpha;
+    }
+    ++gaussians;
+    if (*fixamp == true && *fixmean == true && *fixcovar == true)
+      *allfixed= true;
+    ++allfixed;
+    ++fixamp;
+    ++fixmean;
+    ++fixcovar;
+  }
+  gaussians -= K;
+  allfixed -= K;
+  fixamp -= K;
+  fixmean -= K;
+  fixcovar -= K;
+
+  //gather newgaussians, in the same order for any number of threads
+  if ( nblocks != 1 ) 
+#pragma omp parallel for schedule(static,chunk) \
+  private(ll,jj)
+    for (jj = 0; jj < K; ++jj) 
+      for (ll = 1; ll != nblocks; ++ll) {
+	(newgaussians+jj)->alpha += (newgaussians+ll*K+jj)->alpha;
+	gsl_vector_add((newgaussians+jj)->mm,(newgaussians+ll*K+jj)->mm);
+	gsl_matrix_add((newgaussians+jj)->VV,(newgaussians+ll*K+jj)->VV);
+      }
+  
+  //gettimeofday(&time4,NULL);
+
+  //Now update the parameters
+  //Thus, loop over gaussians again!
+  double qj;
+#pragma omp parallel for schedule(dynamic,chunk) \
+  private(jj,qj)
+  for (jj = 0; jj < K; ++jj){
+    if (*(allfixed+jj)){
+      continue;
+    }
+    else {
+      qj = (newgaussians+jj)->alpha;
+      (qj < DBL_MIN) ? qj = 0: 0;
+      //printf("qj = %f\n",qj);
+      if (*(fixamp+jj) != true) {
+	(gaussians+jj)->alpha = qj;
+	if (qj == 0) {//rethink this
+	  *(fixamp+jj)=1;
+	  *(fixmean+jj)=1;
+	  *(fixcovar+jj)=1;
+	  continue;
+	}
+      }
+      gsl_vector_scale((newgaussians+jj)->mm,1.0/qj);
+      if (*(fixmean+jj) != true){
+	gsl_vector_memcpy((gaussians+jj)->mm,(newgaussians+jj)->mm);
+    }
+      if (*(fixcovar+jj) != true){
+	//	if (*(fixmean+jj) != true)
+	//  gsl_blas_dsyr(CblasUpper,-qj,(gaussians+jj)->mm,(newgaussians+jj)->VV);
+	//else {
+	gsl_blas_dsyr(CblasUpper,qj,(gaussians+jj)->mm,(newgaussians+jj)->VV);
+	gsl_blas_dsyr2(CblasUpper,-qj,(gaussians+jj)->mm,(newgaussians+jj)->mm,(newgaussians+jj)->VV);
+	//}
+      if (w > 0.){
+	gsl_matrix_add((newgaussians+jj)->VV,ctx->I);
+	gsl_matrix_scale((newgaussians+jj)->VV,1.0/(qj+1.0));
+      }
+      else gsl_matrix_scale((newgaussians+jj)->VV,1.0/qj);
+      gsl_matrix_memcpy((gaussians+jj)->VV,(newgaussians+jj)->VV);
+      }
+    }
+  }
+  //gettimeofday(&time5,NULL);
+
+  //normalize the amplitudes
+  if ( sumfixedamps == 0. && noweight ){
+    for (kk=0; kk != K; ++kk){
+      if ( noweight ) (gaussians++)->alpha /= (double) N;
+    }
+  }
+  else {
+    ampnorm= 0;
+    for (kk=0; kk != K; ++kk){
+      if (*(fixamp++) == false) ampnorm += gaussians->alpha;
+      ++gaussians;
+    }
+    fixamp -= K;
+    gaussians -= K;
+    for (kk=0; kk != K; ++kk){
+      if (*(fixamp++) == false){
+	gaussians->alpha /= ampnorm;
+	gaussians->alpha *= (1. - sumfixedamps);
+      }
+      ++gaussians;
+    }
+    fixamp -= K;
+    gaussians -= K;
+  }
+  free(allfixed);
+
+  return;
+}
@@ -0,0 +1,119 @@
+/*
+  NAME:
+     proj_EM_partial
+  PURPOSE:
+     partial proj_EM after a split and merge move, updating only the
+     gaussians j, k, and l: the summed alpha N of the other, fixed
+     gaussians is cached for every data point from the posterior
+     probabilities before the move, such that every E-step only evaluates
+     the three gaussians that changed; data points whose posterior
+     probability for j, k, and l together is less than skip are left out
+  CALLING SEQUENCE:
+     proj_EM_partial(struct xdcontext * ctx, struct datapoint * data,
+     int N, struct gaussian * gaussians, int K, gsl_matrix * qij,
+     double * lognorm, int j, int k, int l, double skip,
+     double * avgloglikedata, double tol, long long int maxiter, double w,
+     bool keeplog, FILE *logfile, FILE *tmplogfile, bool noproj,
+     bool diagerrs, bool noweight)
+  INPUT:
+     ctx          - state of this fit
+     data         - the data
+     N            - number of data points
+     gaussians    - model gaussians, after the split and merge move
+     K            - number of gaussians
+     qij          - [N,K] log posterior probabilities before the move
+     lognorm      - [N] log of the summed alpha N before the move
+     j,k,l        - the gaussians that were merged (j,k) and split (l);
+                    l may equal j or k
+     skip         - leave out data points with a smaller posterior
+                    probability for j, k, and l (0: use all data points)
+     tol          - convergence limit
+     maxiter      - maximum number of iterations
+     w            - regularization parameter
+     keeplog      - keep a log in a logfile?
+     logfile      - pointer to the logfile
+     tmplogfile   - pointer to a tmplogfile
+     noproj       - don't perform any projections
+     diagerrs     - the data->SS errors-squared are diagonal
+     noweight     - don't use data-weights
+  OUTPUT:
+     updated gaussians j, k, and l
+     avgloglikedata - average log likelihood of the data (of the data
+                      points that were not left out)
+     ctx->niter, ctx->converged - as in proj_EM
+  REVISION HISTORY:
+     2026-10-18 - Written
+*/
+#include <stdio.h>
+#include <stdlib.h>
+#include <math.h>
+#include <gsl/gsl_matrix.h>
+#include <proj_gauss_mixtures.h>
+
+void proj_EM_partial(struct xdcontext * ctx, struct datapoint * data, int N,
+		     struct gaussian * gaussians, int K, gsl_matrix * qij,
+		     double * lognorm, int j, int k, int l, double skip,
+		     double * avgloglikedata, double tol,
+		     long long int maxiter, double w, bool keeplog,
+		     FILE *logfile, FILE *tmplogfile, bool noproj,
+		     bool diagerrs, bool noweight){
+  int ii, kk, nsub = 0;
+  int partial[3] = {j,k,l};
+  int npartial = ( l == j || l == k ) ? 2 : 3;
+  double fixedamp = 0., maxq, sumq, freeq, logw;
+  struct gaussian subgaussians[3];
+  bool subfixamp[3] = {false,false,false};
+  bool subfixmean[3] = {false,false,false};
+  bool subfixcovar[3] = {false,false,false};
+  struct datapoint * subdata = (struct datapoint *) malloc(N * sizeof (struct datapoint) );
+  double * fixedlognorm = (double *) malloc(N * sizeof (double) );
+  for (kk = 0; kk != K; ++kk)
+    if ( kk != j && kk != k && kk != l ) fixedamp += (gaussians+kk)->alpha;
+  //log of the summed alpha N of the fixed gaussians, log(sum exp(qij)) + lognorm
+  for (ii = 0; ii != N; ++ii){
+    logw = noweight ? 0. : (data+ii)->logweight;
+    maxq = -INFINITY;
+    for (kk = 0; kk != K; ++kk)
+      if ( kk != j && kk != k && kk != l && gsl_matrix_get(qij,ii,kk) > maxq )
+	maxq = gsl_matrix_get(qij,ii,kk);
+    sumq = 0.;
+    freeq = 0.;
+    for (kk = 0; kk != K; ++kk)
+      if ( kk != j && kk != k && kk != l )
+	sumq += exp(gsl_matrix_get(qij,ii,kk)-maxq);
+      else
+	freeq += exp(gsl_matrix_get(qij,ii,kk)-logw);
+    if ( skip > 0. && freeq < skip ) continue;
+    *(subdata+nsub) = *(data+ii);
+    fixedlognorm[nsub] = bovy_isfin(maxq) ? maxq + log(sumq) - logw + lognorm[ii]
+      : -INFINITY;
+    ++nsub;
+  }
+  //The model consisting of j, k, and l only
+  for (kk = 0; kk != npartial; ++kk)
+    subgaussians[kk] = *(gaussians+partial[kk]);
+  struct xdcontext subctx = *ctx;
+  gsl_matrix_view subqij;
+  subctx.lognorm = NULL;
+  subctx.fixedlognorm = fixedlognorm;
+  subctx.fixedamp = fixedamp;
+  subctx.snmtrial = 0;//the likelihood of the sub-model is not comparable
+  if ( nsub > 0 ){
+    subqij = gsl_matrix_submatrix(ctx->qij,0,0,
+				  ctx->denseqij ? nsub : ctx->nthreads,
+				  npartial);
+    subctx.qij = &(subqij.matrix);
+    proj_EM(&subctx,subdata,nsub,subgaussians,npartial,subfixamp,subfixmean,
+	    subfixcovar,avgloglikedata,tol,maxiter,false,w,keeplog,logfile,
+	    tmplogfile,noproj,diagerrs,noweight);
+  }
+  for (kk = 0; kk != npartial; ++kk)
+    (gaussians+partial[kk])->alpha = subgaussians[kk].alpha;
+  ctx->halflogtwopi = subctx.halflogtwopi;
+  ctx->niter = subctx.niter;
+  ctx->converged = subctx.converged;
+  free(subdata);
+  free(fixedlognorm);
+
+  return;
+}
@@ -0,0 +1,210 @@
+/*
+  NAME:
+     proj_EM_squarem
+  PURPOSE:
+     goes through proj_EM, accelerated with SQUAREM (Varadhan & Roland
+     2008): every cycle takes two EM steps from theta0, extrapolates
+     theta0 - 2 a r + a^2 v with r = theta1-theta0, v = theta2-2theta1+theta0
+     and a = -|r|/|v|, and takes an EM step from the extrapolated
+     parameters; a is halved towards -1 (which is plain EM) while an
+     extrapolated amplitude is not positive or a covariance is not
+     positive definite, and the plain EM step theta2 is used if the
+     likelihood of the extrapolated parameters is less than that of theta1
+  CALLING SEQUENCE:
+     proj_EM_squarem(struct xdcontext * ctx, struct datapoint * data,
+     int N, struct gaussian * gaussians, int K, bool * fixamp,
+     bool * fixmean, bool * fixcovar, double * avgloglikedata, double tol,
+     long long int maxiter, double w, bool keeplog, FILE *logfile,
+     FILE *tmplogfile, bool noproj, bool diagerrs, bool noweight)
+  INPUT:
+     same as proj_EM (without likeonly)
+  OUTPUT:
+     avgloglikedata - average log likelihood of the data
+     ctx->niter     - increased by the number of EM steps (E-steps)
+     ctx->converged - whether two consecutive plain EM steps increased the
+                      log likelihood by less than tol
+  REVISION HISTORY:
+     2026-10-18 - Written
+     2026-10-18 Stop early if a split and merge move is hopeless
+*/
+#include <stdio.h>
+#include <stdlib.h>
+#include <math.h>
+#include <gsl/gsl_matrix.h>
+#include <gsl/gsl_vector.h>
+#include <proj_gauss_mixtures.h>
+
+#define SQUAREMMAXBACKTRACK 10 /* maximum number of times the step is halved */
+
+static void copy_gaussians(struct gaussian * to, struct gaussian * from,
+			   int K){
+  int jj;
+  for (jj = 0; jj != K; ++jj){
+    (to+jj)->alpha = (from+jj)->alpha;
+    gsl_vector_memcpy((to+jj)->mm,(from+jj)->mm);
+    gsl_matrix_memcpy((to+jj)->VV,(from+jj)->VV);
+  }
+  return;
+}
+
+/* theta = theta0 - 2 a r + a^2 v, returns false if it is not a valid model */
+static bool extrapolate(struct gaussian * gaussians, struct gaussian * g0,
+			struct gaussian * g1, struct gaussian * g2, int K,
+			double a, gsl_matrix * work){
+  int jj, dd1, dd2, d = (gaussians->mm)->size;
+  double lndet, x0, x1, x2;
+  for (jj = 0; jj != K; ++jj){
+    x0 = (g0+jj)->alpha;
+    x1 = (g1+jj)->alpha;
+    x2 = (g2+jj)->alpha;
+    (gaussians+jj)->alpha = x0 - 2. * a * (x1-x0) + a * a * (x2-2.*x1+x0);
+    if ( (gaussians+jj)->alpha <= 0. && x2 > 0. ) return false;
+    for (dd1 = 0; dd1 != d; ++dd1){
+      x0 = gsl_vector_get((g0+jj)->mm,dd1);
+      x1 = gsl_vector_get((g1+jj)->mm,dd1);
+      x2 = gsl_vector_get((g2+jj)->mm,dd1);
+      gsl_vector_set((gaussians+jj)->mm,dd1,
+		     x0 - 2. * a * (x1-x0) + a * a * (x2-2.*x1+x0));
+      for (dd2 = dd1; dd2 != d; ++dd2){
+	x0 = gsl_matrix_get((g0+jj)->VV,dd1,dd2);
+	x1 = gsl_matrix_get((g1+jj)->VV,dd1,dd2);
+	x2 = gsl_matrix_get((g2+jj)->VV,dd1,dd2);
+	x0 = x0 - 2. * a * (x1-x0) + a * a * (x2-2.*x1+x0);
+	gsl_matrix_set((gaussians+jj)->VV,dd1,dd2,x0);
+	gsl_matrix_set(work,dd1,dd2,x0);
+	gsl_matrix_set(work,dd2,dd1,x0);
+      }
+    }
+    //only the upper triangle of VV is used
+    if ( bovy_cholesky(work,&lndet) ) return false;
+  }
+  return true;
+}
+
+void proj_EM_squarem(struct xdcontext * ctx, struct datapoint * data, int N,
+		     struct gaussian * gaussians, int K, bool * fixamp,
+		     bool * fixmean, bool * fixcovar, double * avgloglikedata,
+		     double tol, long long int maxiter, double w,
+		     bool keeplog, FILE *logfile, FILE *tmplogfile,
+		     bool noproj, bool diagerrs, bool noweight){
+  double diff = 2. * tol, loglike0, loglike1, a, rr, vv, x0, x1, x2;
+  double cycleloglike[3] = {0.,0.,0.}; /* log likelihoods after the last three cycles */
+  long long int niter = 0, ncycle = 0;
+  int jj, dd1, dd2, nback;
+  int d = (gaussians->mm)->size;
+  bool feasible;
+  struct gaussian * g = (struct gaussian *) malloc(3 * K * sizeof (struct gaussian) );
+  struct gaussian * g0 = g, * g1 = g+K, * g2 = g+2*K;
+  gsl_matrix * work = gsl_matrix_alloc(d,d);
+  for (jj = 0; jj != 3*K; ++jj){
+    (g+jj)->mm = gsl_vector_alloc(d);
+    (g+jj)->VV = gsl_matrix_alloc(d,d);
+  }
+  ctx->halflogtwopi  = 0.5 * log(8. * atan(1.0));
+  while ( niter < maxiter ){
+    //give up on a split and merge move that will not improve
+    if ( ncycle > 0 ){
+      cycleloglike[0] = cycleloglike[1];
+      cycleloglike[1] = cycleloglike[2];
+      cycleloglike[2] = *avgloglikedata;
+    }
+    if ( ncycle > 2 && snm_hopeless(ctx,niter,cycleloglike[0],cycleloglike[1],
+				    cycleloglike[2]) )
+      break;
+    ++ncycle;
+    //Two plain EM steps
+    copy_gaussians(g0,gaussians,K);
+    proj_EM_step(ctx,data,N,gaussians,K,fixamp,fixmean,fixcovar,&loglike0,
+		 false,w,noproj,diagerrs,noweight);
+    ++niter;
+    *avgloglikedata = loglike0;
+    if (keeplog){
+      fprintf(logfile,"%f\n",loglike0);
+      fprintf(tmplogfile,"%f\n",loglike0);
+    }
+    if ( niter == maxiter ) break;
+    copy_gaussians(g1,gaussians,K);
+    proj_EM_step(ctx,data,N,gaussians,K,fixamp,fixmean,fixcovar,&loglike1,
+		 false,w,noproj,diagerrs,noweight);
+    ++niter;
+    *avgloglikedata = loglike1;
+    if (keeplog){
+      fprintf(logfile,"%f\n",loglike1);
+      fprintf(tmplogfile,"%f\n",loglike1);
+    }
+    diff = loglike1 - loglike0;
+    if (diff < 0)
+      printf("Warning: log likelihood decreased by %g\n",diff);
+    if ( diff <= tol || niter == maxiter ) break;
+    copy_gaussians(g2,gaussians,K);
+    //Step length
+    rr = 0.;
+    vv = 0.;
+    for (jj = 0; jj != K; ++jj){
+      x0 = (g0+jj)->alpha;
+      x1 = (g1+jj)->alpha;
+      x2 = (g2+jj)->alpha;
+      rr += (x1-x0) * (x1-x0);
+      vv += (x2-2.*x1+x0) * (x2-2.*x1+x0);
+      for (dd1 = 0; dd1 != d; ++dd1){
+	x0 = gsl_vector_get((g0+jj)->mm,dd1);
+	x1 = gsl_vector_get((g1+jj)->mm,dd1);
+	x2 = gsl_vector_get((g2+jj)->mm,dd1);
+	rr += (x1-x0) * (x1-x0);
+	vv += (x2-2.*x1+x0) * (x2-2.*x1+x0);
+	for (dd2 = dd1; dd2 != d; ++dd2){
+	  x0 = gsl_matrix_get((g0+jj)->VV,dd1,dd2);
+	  x1 = gsl_matrix_get((g1+jj)->VV,dd1,dd2);
+	  x2 = gsl_matrix_get((g2+jj)->VV,dd1,dd2);
+	  rr += (x1-x0) * (x1-x0);
+	  vv += (x2-2.*x1+x0) * (x2-2.*x1+x0);
+	}
+      }
+    }
+    if ( vv <= 0. ) continue;
+    a = -sqrt(rr/vv);
+    if ( a >= -1. ) continue;//a = -1 is theta2, the plain EM step
+    //Extrapolate, backtracking towards the plain EM step if this is not a
+    //valid model
+    feasible = extrapolate(gaussians,g0,g1,g2,K,a,work);
+    for (nback = 0; ! feasible && nback != SQUAREMMAXBACKTRACK; ++nback){
+      a = 0.5 * (a - 1.);
+      feasible = extrapolate(gaussians,g0,g1,g2,K,a,work);
+    }
+    if ( ! feasible ) {
+      copy_gaussians(gaussians,g2,K);
+      continue;
+    }
+    //EM step from the extrapolated parameters, unless their likelihood is
+    //less than that of theta1
+    proj_EM_step(ctx,data,N,gaussians,K,fixamp,fixmean,fixcovar,&loglike0,
+		 false,w,noproj,diagerrs,noweight);
+    ++niter;
+    if ( loglike0 < loglike1 ) {
+      copy_gaussians(gaussians,g2,K);
+      *avgloglikedata = loglike1;
+    }
+    else {
+      *avgloglikedata = loglike0;
+      if (keeplog){
+	fprintf(logfile,"%f\n",loglike0);
+	fprintf(tmplogfile,"%f\n",loglike0);
+      }
+    }
+  }
+  if (keeplog){
+    fflush(logfile);
+    fflush(tmplogfile);
+  }
+  ctx->niter += niter;
+  ctx->converged = diff <= tol;
+
+  for (jj = 0; jj != 3*K; ++jj){
+    gsl_vector_free((g+jj)->mm);
+    gsl_matrix_free((g+jj)->VV);
+  }
+  free(g);
+  gsl_matrix_free(work);
+
+  return;
+}
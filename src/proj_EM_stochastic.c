@@ -0,0 +1,163 @@
+/*
+  NAME:
+     proj_EM_stochastic
+  PURPOSE:
+     stochastic (mini-batch) version of proj_EM: every step runs the
+     E-step on a random mini-batch of the data and moves running averages
+     of the sufficient statistics towards those of the mini-batch with a
+     decreasing step size (1+t)^-stepexp; the model is updated from the
+     running averages by the usual M-step
+  CALLING SEQUENCE:
+     proj_EM_stochastic(struct xdcontext * ctx, struct datapoint * data,
+     int N, struct gaussian * gaussians, int K, bool * fixamp,
+     bool * fixmean, bool * fixcovar, double * avgloglikedata, double tol,
+     double w, struct xdoptions * options, bool keeplog, FILE *logfile,
+     bool noproj, bool diagerrs, bool noweight)
+  INPUT:
+     ctx          - state of this fit
+     data         - the data
+     N            - number of data points
+     gaussians    - model gaussians
+     K            - number of gaussians
+     fixamp       - fix the amplitude?
+     fixmean      - fix the mean?
+     fixcovar     - fix the covariance?
+     tol          - stop when the smoothed log likelihood changes by less
+                    than this over an epoch (N/batchsize steps)
+     w            - regularization parameter
+     options      - batchsize, stepexp, and nepoch (maximum number of
+                    epochs) of the stochastic EM
+     keeplog      - keep a log in a logfile?
+     logfile      - pointer to the logfile
+     noproj       - don't perform any projections
+     diagerrs     - the data->SS errors-squared are diagonal
+     noweight     - don't use data-weights
+  OUTPUT:
+     avgloglikedata - smoothed average log likelihood of the mini-batches
+     options->nsteps - number of steps taken
+     options->stochconverged - whether the smoothed log likelihood
+                               converged to within tol
+     options->steploglike, options->smoothloglike - average log likelihood
+                    of the mini-batch and smoothed average log likelihood
+                    at every step (if not NULL)
+  REVISION HISTORY:
+     2026-10-18 - Written
+     2026-10-18 Time the E- and M-step in ctx->stats
+*/
+#include <stdio.h>
+#include <stdlib.h>
+#include <math.h>
+#include <gsl/gsl_matrix.h>
+#include <gsl/gsl_vector.h>
+#include <gsl/gsl_rng.h>
+#include <proj_gauss_mixtures.h>
+
+void proj_EM_stochastic(struct xdcontext * ctx, struct datapoint * data,
+			int N, struct gaussian * gaussians, int K,
+			bool * fixamp, bool * fixmean, bool * fixcovar,
+			double * avgloglikedata, double tol, double w,
+			struct xdoptions * options, bool keeplog,
+			FILE *logfile, bool noproj, bool diagerrs,
+			bool noweight){
+  int nbatch = ( options->batchsize < N ) ? options->batchsize : N;
+  long long int stepsperepoch = (N + nbatch - 1) / nbatch;
+  long long int maxsteps = stepsperepoch * options->nepoch;
+  int d = (gaussians->mm)->size;
+  int nblocks = ctx->nblocks;
+  struct gaussian * newgaussians = ctx->newgaussians;
+  struct datapoint * batch = (struct datapoint *) malloc(nbatch * sizeof (struct datapoint) );
+  struct gaussian * stats = (struct gaussian *) malloc(K * sizeof (struct gaussian) );
+  double sumloglike, eta, scale = (double) N / nbatch;
+  double smoothloglike = 0., oldsmoothloglike = 0., t0 = 0.;
+  long long int tt;
+  int ii, jj, ll, dd1, dd2;
+  for (jj = 0; jj != K; ++jj){
+    (stats+jj)->mm = gsl_vector_calloc(d);
+    (stats+jj)->VV = gsl_matrix_calloc(d,d);
+  }
+  ctx->halflogtwopi = 0.5 * log(8. * atan(1.0));
+  options->stochconverged = false;
+  for (tt = 0; tt != maxsteps; ++tt){
+    //Draw a mini-batch (with replacement)
+    for (ii = 0; ii != nbatch; ++ii)
+      *(batch+ii) = *(data+gsl_rng_uniform_int(ctx->randgen,N));
+    //E-step on the mini-batch
+    for (jj = 0; jj != K*nblocks; ++jj){
+      (newgaussians+jj)->alpha = 0.0;
+      gsl_vector_set_zero((newgaussians+jj)->mm);
+      gsl_matrix_set_zero((newgaussians+jj)->VV);
+    }
+    sumloglike = 0.;
+    if ( ctx->stats != NULL ) t0 = xd_wtime();
+    proj_EM_estep(ctx,batch,nbatch,gaussians,K,&sumloglike,noproj,diagerrs,
+		  noweight);
+    if ( ctx->stats != NULL ) ctx->stats->testep += xd_wtime() - t0;
+    //Move the running averages of the sufficient statistics (scaled to
+    //the full data) towards those of the mini-batch, and hand them to
+    //the M-step as if they were accumulated in the first block
+    eta = pow(1. + tt,-options->stepexp);
+    for (jj = 0; jj != K; ++jj){
+      for (ll = 1; ll != nblocks; ++ll){
+	(newgaussians+jj)->alpha += (newgaussians+ll*K+jj)->alpha;
+	gsl_vector_add((newgaussians+jj)->mm,(newgaussians+ll*K+jj)->mm);
+	gsl_matrix_add((newgaussians+jj)->VV,(newgaussians+ll*K+jj)->VV);
+	(newgaussians+ll*K+jj)->alpha = 0.0;
+	gsl_vector_set_zero((newgaussians+ll*K+jj)->mm);
+	gsl_matrix_set_zero((newgaussians+ll*K+jj)->VV);
+      }
+      (stats+jj)->alpha = (1. - eta) * (stats+jj)->alpha
+	+ eta * scale * (newgaussians+jj)->alpha;
+      for (dd1 = 0; dd1 != d; ++dd1){
+	(stats+jj)->mm->data[dd1] = (1. - eta) * (stats+jj)->mm->data[dd1]
+	  + eta * scale * (newgaussians+jj)->mm->data[dd1];
+	for (dd2 = 0; dd2 != d; ++dd2)
+	  (stats+jj)->VV->data[dd1*d+dd2] = (1. - eta) * (stats+jj)->VV->data[dd1*d+dd2]
+	    + eta * scale * (newgaussians+jj)->VV->data[dd1*d+dd2];
+      }
+      (newgaussians+jj)->alpha = (stats+jj)->alpha;
+      gsl_vector_memcpy((newgaussians+jj)->mm,(stats+jj)->mm);
+      gsl_matrix_memcpy((newgaussians+jj)->VV,(stats+jj)->VV);
+    }
+    //M-step
+    if ( ctx->stats != NULL ) t0 = xd_wtime();
+    proj_EM_mstep(ctx,gaussians,K,fixamp,fixmean,fixcovar,w,N,noweight);
+    if ( ctx->stats != NULL ) ctx->stats->tmstep += xd_wtime() - t0;
+    //Diagnostics
+    smoothloglike = (1. - eta) * smoothloglike + eta * sumloglike / nbatch;
+    if ( options->steploglike != NULL )
+      options->steploglike[tt] = sumloglike / nbatch;
+    if ( options->smoothloglike != NULL )
+      options->smoothloglike[tt] = smoothloglike;
+    //Check convergence at the end of every epoch
+    if ( (tt+1) % stepsperepoch == 0 ){
+      if (keeplog){
+	fprintf(logfile,"%f\n",smoothloglike);
+	fflush(logfile);
+      }
+      if ( tt+1 > stepsperepoch
+	   && fabs(smoothloglike - oldsmoothloglike) <= tol ){
+	options->stochconverged = true;
+	++tt;
+	break;
+      }
+      oldsmoothloglike = smoothloglike;
+    }
+  }
+  options->nsteps = tt;
+  *avgloglikedata = smoothloglike;
+
+  //post-processing: only the upper right of VV was computed, copy this to the lower left of VV
+  for (jj = 0; jj != K; ++jj)
+    for (dd1 = 0; dd1 != d; ++dd1)
+      for (dd2 = dd1+1; dd2 != d ; ++dd2)
+	gsl_matrix_set((gaussians+jj)->VV,dd2,dd1,
+		       gsl_matrix_get((gaussians+jj)->VV,dd1,dd2));
+  for (jj = 0; jj != K; ++jj){
+    gsl_vector_free((stats+jj)->mm);
+    gsl_matrix_free((stats+jj)->VV);
+  }
+  free(stats);
+  free(batch);
+
+  return;
+}
@@ -10,7 +10,8 @@
      bool * fixcovar, double * avgloglikedata, double tol,
      long long int maxiter, bool likeonly, double w, int splitnmerge, 
      bool keeplog, FILE *logfile, FILE *convlogfile, bool noproj, 
-     bool diagerrs,noweight)
+     bool diagerrs,noweight, long long int * niter, bool * converged,
+     struct xdstream * stream, struct xdoptions * options)
   INPUT:
      data        - the data
      N           - number of datapoints
@@ -30,13 +31,44 @@
      noproj      - don't perform any projections
      diagerrs    - the data->SS errors-squared are diagonal
      noweight    - don't use data-weights
+     stream      - if not NULL, stream the data through the E-step in
+                   chunks from here instead of using data (no split and
+                   merge in this case)
+     options     - further options (stochastic EM, SQUAREM acceleration,
+                   see struct xdoptions), or NULL; if options->stats is
+                   not NULL, the statistics of the fit are collected in it;
+                   if options->snmworkers > 1, the split and merge moves
+                   are evaluated concurrently (see splitnmerge_parallel);
+                   options->snmskip is the skip of proj_EM_partial;
+                   if options->snmtrial > 0, the full EM of a split and
+                   merge move stops after that many iterations if it is
+                   hopeless (see snm_hopeless)
   OUTPUT:
      updated model gaussians
      avgloglikedata - average log likelihood of the data
+     niter          - total number of EM iterations, including those of
+                      rejected split and merge attempts
+     converged      - whether the EM run that produced the final model
+                      converged to within tol (rather than hitting maxiter)
   REVISION HISTORY:
      2008-08-21 Written Bovy
      2010-03-01 Added noproj option - Bovy
      2010-04-01 Added noweight option - Bovy
+     2026-10-18 Allocate the per-thread E-step workspaces once
+     2026-10-18 Allocate the per-point log likelihoods
+     2026-10-18 Keep all state in the context of this fit, such that
+                fits can run concurrently
+     2026-10-18 Return the number of iterations and convergence
+     2026-10-18 Optionally stream the data in chunks, such that only a
+                chunk needs to be in memory
+     2026-10-18 Only allocate the full qij when it is needed
+     2026-10-18 Optionally start with stochastic EM on mini-batches
+     2026-10-18 Optionally accelerate proj_EM with SQUAREM
+     2026-10-18 Optionally collect the statistics of the fit in memory
+     2026-10-18 Optionally evaluate split and merge moves concurrently
+     2026-10-18 The partial EM of split and merge only evaluates the
+                three gaussians that changed
+     2026-10-18 Optionally abandon hopeless split and merge moves early
 */
 #ifdef _OPENMP
 #include <omp.h>
@@ -55,7 +87,14 @@ void proj_gauss_mixtures(struct datapoint * data, int N,
 			 long long int maxiter, bool likeonly, double w, 
 			 int splitnmerge, bool keeplog, FILE *logfile, 
 			 FILE *convlogfile, bool noproj, bool diagerrs,
-			 bool noweight){
+			 bool noweight, long long int * niter, bool * converged,
+			 struct xdstream * stream, struct xdoptions * options){
+  struct xdstats * stats = ( options != NULL ) ? options->stats : NULL;
+  double tstart = 0., t0 = 0.;
+  int snmworkers = ( options != NULL ) ? options->snmworkers : 1;
+  double snmskip = ( options != NULL ) ? options->snmskip : 0.;
+  long long int snmtrial = ( options != NULL ) ? options->snmtrial : 0;
+  if ( stats != NULL ) tstart = xd_wtime();
   //Allocate some memory
   struct gaussian * startgaussians;
   startgaussians = gaussians;
@@ -78,42 +117,91 @@ void proj_gauss_mixtures(struct datapoint * data, int N,
   fixcovar -= K;
   fixcovar_tmp -= K;
   //allocate the newalpha, newmm and newVV matrices
+  //(only one thread when called from within a parallel region that
+  //does not allow further nesting)
+  int nthreads;
 #ifdef _OPENMP
-  nthreads = omp_get_max_threads();
+  if ( omp_get_active_level() >= omp_get_max_active_levels() )
+    nthreads = 1;
+  else
+    nthreads = omp_get_max_threads();
 #else
   nthreads = 1;
 #endif
-  newgaussians = (struct gaussian *) malloc(K * nthreads * sizeof (struct gaussian) );
-  startnewgaussians = newgaussians;
+  //The M-step accumulators belong to fixed blocks of the data rather
+  //than to the threads, such that they are summed in the same order
+  //for any number of threads
+  int nblocks = NACCBLOCKS;
+  struct gaussian * newgaussians = (struct gaussian *) malloc(K * nblocks * sizeof (struct gaussian) );
+  struct gaussian * startnewgaussians = newgaussians;
   int ll;
-  for (kk=0; kk != K*nthreads; ++kk){
+  for (kk=0; kk != K*nblocks; ++kk){
     newgaussians->alpha = 0.0;
     newgaussians->mm = gsl_vector_calloc (d);
     newgaussians->VV = gsl_matrix_calloc (d,d);
     ++newgaussians;
   }
   newgaussians= startnewgaussians;
-  double oldavgloglikedata;
+  double oldavgloglikedata, sumloglike;
   //allocate the q_ij matrix
-  qij = gsl_matrix_alloc(N,K);
-  double * qstarij = (double *) malloc(N * sizeof (double) );
-  I = gsl_matrix_alloc(d,d);
+  //only split and merge and the partition coefficient in the logfile need
+  //qij for all data points, otherwise every thread only needs a row;
+  //when streaming, the log likelihoods are only needed for a chunk
+  bool dosnm = ! likeonly && splitnmerge != 0 && K >= 3 && stream == NULL;
+  bool denseqij = dosnm || (keeplog && stream == NULL);
+  gsl_matrix * qij = gsl_matrix_alloc(denseqij ? N : nthreads,K);
+  int nrows = ( stream == NULL || stream->chunksize > N ) ? N : stream->chunksize;
+  double * loglikei = (double *) malloc(nrows * sizeof (double) );
+  gsl_matrix * I = gsl_matrix_alloc(d,d);
   gsl_matrix_set_identity(I);//Unit matrix
   gsl_matrix_scale(I,w);//scaled to w
   //Also take care of the bbij's and the BBij's
-  bs = (struct modelbs *) malloc(nthreads * K * sizeof (struct modelbs) );
+  struct modelbs * bs = (struct modelbs *) malloc(nthreads * K * sizeof (struct modelbs) );
   for (kk = 0; kk != nthreads*K; ++kk){
     bs->bbij = gsl_vector_alloc (d);
     bs->BBij = gsl_matrix_alloc (d,d);
     ++bs;
   }
   bs -= nthreads*K;
+  //Per-thread E-step workspaces, sized to the largest data dimension and
+  //shared by all EM steps, including those during split and merge
+  int ii, dmax= 0;
+  if ( stream != NULL ) dmax= stream->dy;
+  else
+    for (ii = 0; ii != N; ++ii)
+      if ( (int) ((data+ii)->SS)->size1 > dmax ) dmax= ((data+ii)->SS)->size1;
+  struct estepwork * ws = alloc_estepwork(nthreads,d,dmax);
+  //Collect everything that is shared between the steps of this fit
+  struct xdcontext ctx;
+  ctx.nthreads = nthreads;
+  ctx.nblocks = nblocks;
+  ctx.halflogtwopi = 0.5 * log(8. * atan(1.0));
+  ctx.newgaussians = newgaussians;
+  ctx.qij = qij;
+  ctx.denseqij = denseqij;
+  ctx.loglikei = loglikei;
+  ctx.I = I;
+  ctx.bs = bs;
+  ctx.ws = ws;
+  ctx.randgen = gsl_rng_alloc(gsl_rng_mt19937);
+  ctx.niter = 0;
+  ctx.converged = false;
+  ctx.stream = stream;
+  ctx.accelerate = options != NULL && options->accelerate;
+  ctx.stats = stats;
+  ctx.lognorm = dosnm ? (double *) malloc(N * sizeof (double) ) : NULL;
+  ctx.fixedlognorm = NULL;
+  ctx.fixedamp = 0.;
+  ctx.snmtrial = 0;
+  ctx.snmtarget = 0.;
   //splitnmerge
   int maxsnm = K*(K-1)*(K-2)/2;
   int * snmhierarchy = (int *) malloc(maxsnm*3* sizeof (int) );
   int j,k,l;
   struct gaussian * oldgaussians = (struct gaussian *) malloc(K * sizeof (struct gaussian) );
-  gsl_matrix * oldqij = gsl_matrix_alloc(N,K);
+  gsl_matrix * oldqij = dosnm ? gsl_matrix_alloc(N,K) : NULL;
+  double * lognorm = ctx.lognorm;
+  double * oldlognorm = dosnm ? (double *) malloc(N * sizeof (double) ) : NULL;
   for (kk=0; kk != K; ++kk){
     oldgaussians->mm = gsl_vector_calloc (d);
     oldgaussians->VV = gsl_matrix_calloc (d,d);
@@ -122,22 +210,38 @@ void proj_gauss_mixtures(struct datapoint * data, int N,
   oldgaussians -= K;
 
   //create temporary file to hold convergence info
-  FILE *tmpconvfile;
-  char * tmpfilename= tmpnam(NULL);;
+  FILE *tmpconvfile= NULL;
   if (keeplog)
-    tmpconvfile= fopen(tmpfilename,"w+");
+    tmpconvfile= tmpfile();
 
 
+  //stochastic proj_EM on mini-batches, optionally followed by the full
+  //proj_EM (always when doing split and merge, which needs the full qij)
+  bool stochastic = options != NULL && options->batchsize > 0
+    && ! likeonly && stream == NULL;
+  if (stochastic){
+    if (keeplog)
+      fprintf(logfile,"#Stochastic proj_EM\n");
+    proj_EM_stochastic(&ctx,data,N,gaussians,K,fixamp_tmp,fixmean_tmp,
+		       fixcovar_tmp,avgloglikedata,tol,w,options,keeplog,
+		       logfile,noproj,diagerrs,noweight);
+    *converged = options->stochconverged;
+    if (keeplog)
+      fprintf(logfile,"\n");
+  }
   //proj_EM
-  if (keeplog)
-    fprintf(logfile,"#Initial proj_EM\n");
-  //printf("Where's the segmentation fault?\n");
-  proj_EM(data,N,gaussians,K,fixamp_tmp,fixmean_tmp,fixcovar_tmp,
-	  avgloglikedata,tol,maxiter,likeonly,w,
-	  keeplog,logfile,convlogfile,noproj,diagerrs,noweight);
-  if (keeplog){
-    fprintf(logfile,"\n");
-    fprintf(convlogfile,"\n");
+  if ( ! stochastic || options->polish || dosnm ){
+    if (keeplog)
+      fprintf(logfile,"#Initial proj_EM\n");
+    //printf("Where's the segmentation fault?\n");
+    proj_EM(&ctx,data,N,gaussians,K,fixamp_tmp,fixmean_tmp,fixcovar_tmp,
+	    avgloglikedata,tol,maxiter,likeonly,w,
+	    keeplog,logfile,convlogfile,noproj,diagerrs,noweight);
+    *converged = ctx.converged;
+    if (keeplog){
+      fprintf(logfile,"\n");
+      fprintf(convlogfile,"\n");
+    }
   }
   //reset fix* vectors
   for (kk = 0; kk != K; ++kk){
@@ -153,16 +257,22 @@ void proj_gauss_mixtures(struct datapoint * data, int N,
   fixcovar_tmp -= K;
 
   //Run splitnmerge
-  randgen = gsl_rng_alloc(gsl_rng_mt19937);
   bool weretrying = true;
-  if (likeonly || splitnmerge == 0 || K < 3)
+  if ( ! dosnm )
     ;
   else {
+    if ( stats != NULL ) t0 = xd_wtime();
     while (weretrying){
       weretrying = false; /* this is set back to true if an improvement is found */
       //store avgloglike from normal EM and model parameters
       oldavgloglikedata = *avgloglikedata;
+      //posterior probabilities of the current model (proj_EM ends with an
+      //M-step), from which the partial EMs cache the fixed gaussians
+      sumloglike = 0.;
+      proj_EM_estep(&ctx,data,N,gaussians,K,&sumloglike,noproj,diagerrs,
+		    noweight);
       gsl_matrix_memcpy(oldqij,qij);
+      for (ii = 0; ii != N; ++ii) oldlognorm[ii] = lognorm[ii];
       for (kk=0; kk != K; ++kk){
 	oldgaussians->alpha = gaussians->alpha;
 	gsl_vector_memcpy(oldgaussians->mm,gaussians->mm);
@@ -172,8 +282,23 @@ void proj_gauss_mixtures(struct datapoint * data, int N,
       }
       gaussians -= K;
       oldgaussians -= K;
+      //the full EMs of the moves can be abandoned if they cannot beat this
+      ctx.snmtrial = snmtrial;
+      ctx.snmtarget = oldavgloglikedata;
       //Then calculate the splitnmerge hierarchy
-      calc_splitnmerge(data,N,gaussians,K,qij,snmhierarchy);
+      calc_splitnmerge(&ctx,data,N,gaussians,K,qij,snmhierarchy);
+      //Either evaluate the moves concurrently, or go through them one by one
+      if ( snmworkers > 1 ){
+	weretrying = splitnmerge_parallel(&ctx,data,N,gaussians,K,fixamp,
+					  fixmean,fixcovar,oldqij,oldlognorm,
+					  snmhierarchy,
+					  (splitnmerge > 0 && splitnmerge < maxsnm) ? splitnmerge : maxsnm,
+					  avgloglikedata,tol,maxiter,w,
+					  snmworkers,options->snmbest,snmskip,keeplog,
+					  logfile,noproj,diagerrs,noweight);
+	if (weretrying) *converged = ctx.converged;
+	continue;
+      }
       //Then go through this hierarchy
       kk=0;
       while (kk != splitnmerge && kk != maxsnm){
@@ -181,40 +306,19 @@ void proj_gauss_mixtures(struct datapoint * data, int N,
 	j = *(snmhierarchy++);
 	k = *(snmhierarchy++);
 	l = *(snmhierarchy++);
-	splitnmergegauss(gaussians,K,oldqij,j,k,l);
-	//partial EM
-	//Prepare fixed vectors for partial EM
-	for (ll = 0; ll != K; ++ll){
-	  *(fixamp_tmp++) = (ll != j && ll != k && ll != l);
-	  *(fixmean_tmp++) = (ll != j && ll != k && ll != l);
-	  *(fixcovar_tmp++) = (ll != j && ll != k && ll != l);
-	}
-	fixamp_tmp -= K;
-	fixmean_tmp -= K;
-	fixcovar_tmp -= K;
+	splitnmergegauss(&ctx,gaussians,K,oldqij,j,k,l);
+	//partial EM of j, k, and l only
 	if (keeplog)
 	  fprintf(logfile,"#Merging %i and %i, splitting %i\n",j,k,l);
-	proj_EM(data,N,gaussians,K,fixamp_tmp,fixmean_tmp,fixcovar_tmp,
-		avgloglikedata,tol,maxiter,likeonly,w,keeplog,logfile,
-		tmpconvfile,noproj,diagerrs,noweight);
-	//reset fix* vectors
-	for (ll = 0; ll != K; ++ll){
-	    *(fixamp_tmp++) = *(fixamp++);
-	    *(fixmean_tmp++) = *(fixmean++);
-	    *(fixcovar_tmp++) = *(fixcovar++);
-	}
-	fixamp -= K;
-	fixamp_tmp -= K;
-	fixmean -= K;
-	fixmean_tmp -= K;
-	fixcovar -= K;
-	fixcovar_tmp -= K;
+	proj_EM_partial(&ctx,data,N,gaussians,K,oldqij,oldlognorm,j,k,l,
+			snmskip,avgloglikedata,tol,maxiter,w,keeplog,logfile,
+			tmpconvfile,noproj,diagerrs,noweight);
 	//Full EM
 	if (keeplog){
 	  fprintf(logfile,"#full EM:\n");
 	  fprintf(tmpconvfile,"\n");
 	}
-	proj_EM(data,N,gaussians,K,fixamp_tmp,fixmean_tmp,fixcovar_tmp,
+	proj_EM(&ctx,data,N,gaussians,K,fixamp_tmp,fixmean_tmp,fixcovar_tmp,
 		avgloglikedata,tol,maxiter,likeonly,w,keeplog,logfile,
 		tmpconvfile,noproj,diagerrs,noweight);
 	if (keeplog){
@@ -234,7 +338,10 @@ void proj_gauss_mixtures(struct datapoint * data, int N,
 	  fixcovar -= K;
 	  fixcovar_tmp -= K;
 	//Better?
+	if ( stats != NULL )
+	  xdstats_snm(stats,j,k,l,*avgloglikedata > oldavgloglikedata);
 	if (*avgloglikedata > oldavgloglikedata){
+	  *converged = ctx.converged;
 	  if (keeplog){
 	    fprintf(logfile,"#accepted\n");
 	    //Copy tmpfile into convfile
@@ -243,7 +350,7 @@ void proj_gauss_mixtures(struct datapoint * data, int N,
 	      fputc(fgetc(tmpconvfile),convlogfile);
 	    fseek(convlogfile,-1,SEEK_CUR);
 	    fclose(tmpconvfile);
-	    tmpconvfile= fopen(tmpfilename,"w+");
+	    tmpconvfile= tmpfile();
 	  }
 	  weretrying = true;
 	  ++kk;
@@ -253,7 +360,7 @@ void proj_gauss_mixtures(struct datapoint * data, int N,
 	  if (keeplog){
 	    fprintf(logfile,"#didn't improve likelihood\n");
 	    fclose(tmpconvfile);
-	    tmpconvfile= fopen(tmpfilename,"w+");
+	    tmpconvfile= tmpfile();
 	  }
 	  //revert back to the older solution
 	  *avgloglikedata = oldavgloglikedata;
@@ -272,19 +379,25 @@ void proj_gauss_mixtures(struct datapoint * data, int N,
       }
       snmhierarchy -= 3*kk;
     }
+    ctx.snmtrial = 0;
+    if ( stats != NULL ) stats->tsnm += xd_wtime() - t0;
   }
 
   if (keeplog){
     fclose(tmpconvfile);
     fprintf(convlogfile,"\n");
   }
+  *niter = ctx.niter;
+  if ( options != NULL ){
+    options->niter = ctx.niter;
+    options->converged = *converged;
+  }
 
 
   //Compute some criteria to set the number of Gaussians and print these to the logfile
-  int ii;
   int npc,np;
   double pc,aic,mdl;
-  if (keeplog){
+  if (keeplog && denseqij){
     //Partition coefficient
     pc=0.;
     for (ii=0; ii != N; ++ii)
@@ -292,6 +405,8 @@ void proj_gauss_mixtures(struct datapoint * data, int N,
 	pc += pow(exp(gsl_matrix_get(qij,ii,kk)),2);
     pc /= N;
     fprintf(logfile,"Partition coefficient \t=\t%f\n",pc);
+  }
+  if (keeplog){
     //Akaike's information criterion
     npc = 1 + d + d * (d - 1) / 2;
     np = K * npc;
@@ -308,6 +423,8 @@ void proj_gauss_mixtures(struct datapoint * data, int N,
   //Free memory
   gsl_matrix_free(I);
   gsl_matrix_free(qij);
+  if ( stream != NULL ) free_stream(stream);
+  free(loglikei);
   for (kk = 0; kk != nthreads*K; ++kk){
     gsl_vector_free(bs->bbij);
     gsl_matrix_free(bs->BBij);
@@ -315,16 +432,21 @@ void proj_gauss_mixtures(struct datapoint * data, int N,
   }
   bs -= nthreads*K;
   free(bs);
-  for (kk=0; kk != K*nthreads; ++kk){
+  free_estepwork(ws,nthreads);
+  for (kk=0; kk != K*nblocks; ++kk){
     gsl_vector_free(newgaussians->mm);
     gsl_matrix_free(newgaussians->VV);
     ++newgaussians;
   }
   newgaussians= startnewgaussians;
   free(newgaussians);
-  gsl_rng_free(randgen);
+  gsl_rng_free(ctx.randgen);
 
-  gsl_matrix_free(oldqij);
+  if ( dosnm ) {
+    gsl_matrix_free(oldqij);
+    free(lognorm);
+    free(oldlognorm);
+  }
   for (kk=0; kk != K; ++kk){
     gsl_vector_free(oldgaussians->mm);
     gsl_matrix_free(oldgaussians->VV);
@@ -332,11 +454,11 @@ void proj_gauss_mixtures(struct datapoint * data, int N,
   }
   oldgaussians -= K;
   free(oldgaussians);
-  free(qstarij);
   free(snmhierarchy);
   free(fixamp_tmp);
   free(fixmean_tmp);
   free(fixcovar_tmp);
+  if ( stats != NULL ) stats->ttotal += xd_wtime() - tstart;
 
   return;
 }
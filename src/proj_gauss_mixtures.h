@@ -3,6 +3,7 @@
 
 
 /* include */
+#include <stdio.h>
 #include <stdbool.h>
 #include <float.h>
 #include <gsl/gsl_matrix.h>
@@ -12,10 +13,9 @@
 
 /* variable declarations and definitions */
 
-double halflogtwopi; /* constant used in calculation */
-
-int nthreads;
-int tid;
+#define LOWDIMMAX 4 /* maximum dimension for which the closed-form E-step is used */
+#define CHOLJITTER 1.e-10 /* relative jitter added to the diagonal of a matrix that is numerically not positive definite */
+#define NACCBLOCKS 64 /* number of fixed blocks of the data with their own M-step accumulators, such that the fit does not depend on the number of threads */
 
 struct gaussian{
   double alpha;
@@ -30,22 +30,86 @@ struct datapoint{
   double logweight;
 };
 
-struct gaussian * newgaussians, * startnewgaussians;
-gsl_matrix * qij;
-gsl_permutation * p;
-gsl_vector * wminusRm, * TinvwminusRm;
-gsl_matrix * Tij,* Tij_inv, * VRT, * VRTTinv, * Rtrans, * I;
+struct dataviews{ /* views of a data point over the caller's buffers */
+  gsl_vector_view ww;
+  gsl_matrix_view SS;
+  gsl_matrix_view RR;
+};
+
 struct modelbs{
   gsl_vector *bbij;
   gsl_matrix *BBij;
 };
 
-struct modelbs * bs;
+struct estepwork{ /* per-thread E-step scratch space, sized to the max. data dimension */
+  gsl_permutation *p;
+  gsl_vector *wminusRm, *TinvwminusRm;
+  gsl_matrix *Tij, *Tij_inv, *VRT, *VRTTinv, *Rtrans;
+};
 
-FILE *logfile,*convlogfile;
+struct xdstream{ /* data that are streamed through the E-step in chunks */
+  double *ydata, *ycovar, *projection, *logweights; /* the caller's buffers */
+  long long int ystrides[2], cstrides[2], pstrides[2], wstride; /* see view_data */
+  int dy, d, chunksize;
+  bool noproj, diagerrs, noweight;
+  bool linweights; /* the logweights are the weights themselves (see struct xdoptions) */
+  struct datapoint * data; /* [chunksize] the current chunk */
+  struct dataviews * views;
+};
 
-gsl_rng * randgen; /* global random number generator */
+struct xdstats{ /* statistics of a fit, the arrays grow as needed (free with free_xdstats) */
+  double * loglike; /* [nloglike] average log likelihood after every E-step of proj_EM */
+  long long int nloglike, sizeloglike;
+  long long int * emiter; /* [nem] number of iterations of every proj_EM call */
+  long long int nem, sizeem;
+  int * snmmoves; /* [nsnm,4] j, k, l, accepted of every split and merge move that was tried */
+  long long int nsnm, sizesnm;
+  double testep, tmstep, tsnm, ttotal; /* wall-clock time (s) in the E-step, M-step, split and merge, and in total */
+};
+
+struct xdoptions{ /* options beyond those of the IDL interface, and outputs */
+  int batchsize; /* > 0: start with stochastic EM on mini-batches of this size */
+  double stepexp; /* step size of the stochastic EM at step t is (1+t)^-stepexp */
+  int nepoch; /* maximum number of epochs (N/batchsize steps) of the stochastic EM */
+  bool polish; /* run the full EM after the stochastic EM? */
+  bool accelerate; /* accelerate proj_EM with SQUAREM? */
+  double * steploglike; /* [nepoch*ceil(N/batchsize)] mini-batch log likelihoods, or NULL */
+  double * smoothloglike; /* [nepoch*ceil(N/batchsize)] smoothed log likelihoods, or NULL */
+  long long int nsteps; /* output: number of stochastic EM steps */
+  bool stochconverged; /* output: did the stochastic EM converge? */
+  long long int niter; /* output: total number of EM iterations */
+  bool converged; /* output: did the EM that produced the final model converge? */
+  struct xdstats * stats; /* output: statistics of the fit, or NULL to not collect them */
+  int snmworkers; /* > 1: evaluate this many split and merge moves concurrently */
+  bool snmbest; /* accept the best rather than the first improving move of those evaluated concurrently */
+  double snmskip; /* leave data points with a smaller posterior probability for the moved gaussians out of the partial EM */
+  long long int snmtrial; /* > 0: abandon the full EM of a split and merge move after this many iterations if it cannot improve the likelihood (see snm_hopeless) */
+  bool linweights; /* the logweights are the weights themselves, their logs are taken as the data points are viewed */
+};
 
+struct xdcontext{ /* all state of a single fit, such that fits can run concurrently */
+  int nthreads; /* number of threads the per-thread arrays are allocated for */
+  int nblocks; /* number of fixed blocks of the data with their own M-step accumulators */
+  double halflogtwopi; /* constant used in calculation */
+  struct gaussian * newgaussians; /* [nblocks*K] M-step accumulators */
+  gsl_matrix * qij; /* [N,K] log posterior probabilities, [nthreads,K] scratch rows if not denseqij */
+  bool denseqij; /* keep qij for all data points (for split and merge)? */
+  double * loglikei; /* [N] log likelihood of each data point */
+  gsl_matrix * I; /* regularization matrix w x unit matrix */
+  struct modelbs * bs; /* [nthreads*K] bij and bij bij^T + Bij */
+  struct estepwork * ws; /* [nthreads] E-step workspaces */
+  gsl_rng * randgen; /* random number generator for split and merge */
+  long long int niter; /* total number of EM iterations */
+  bool converged; /* did the last proj_EM reach tol (rather than maxiter)? */
+  struct xdstream * stream; /* data streamed in chunks, NULL if data is in memory */
+  bool accelerate; /* accelerate proj_EM with SQUAREM? */
+  struct xdstats * stats; /* statistics to collect, or NULL */
+  double * lognorm; /* [N] log of the summed alpha N of every data point, kept by the E-step if not NULL */
+  double * fixedlognorm; /* [N] log of the summed alpha N of the components outside of the model (partial EM), or NULL */
+  double fixedamp; /* summed amplitude of the components outside of the model */
+  long long int snmtrial; /* > 0: proj_EM stops after this many iterations if snm_hopeless */
+  double snmtarget; /* log likelihood that a split and merge move has to exceed */
+};
 
 
 
@@ -56,13 +120,41 @@ static inline bool bovy_isfin(double x){ /* true if x is finite */
 void minmax(gsl_matrix * q, int row, bool isrow, double * min, double * max);
 double logsum(gsl_matrix * q, int row, bool isrow);
 double normalize_row(gsl_matrix * q, int row,bool isrow,bool noweight, double weight);
-void bovy_randvec(gsl_vector * eps, int d, double length); /* returns random vector */
+double pairwise_sum(double * x, int n);/* fixed-order pairwise sum */
+void bovy_randvec(gsl_vector * eps, int d, double length, gsl_rng * randgen); /* returns random vector */
 double bovy_det(gsl_matrix * A);/* determinant of matrix A */
-void calc_splitnmerge(struct datapoint * data,int N,struct gaussian * gaussians, int K, gsl_matrix * qij, int * snmhierarchy);
-void splitnmergegauss(struct gaussian * gaussians,int K, gsl_matrix * qij, int j, int k, int l);
-void proj_EM_step(struct datapoint * data, int N, struct gaussian * gaussians, int K,bool * fixamp, bool * fixmean, bool * fixcovar, double * avgloglikedata, bool likeonly, double w,bool noproj, bool diagerrs, bool noweight);
-void proj_EM(struct datapoint * data, int N, struct gaussian * gaussians, int K,bool * fixamp, bool * fixmean, bool * fixcovar, double * avgloglikedata, double tol,long long int maxiter, bool likeonly, double w,bool keeplog, FILE *logfile,FILE *tmplogfile, bool noproj, bool diagerrs, bool noweight);
-void proj_gauss_mixtures(struct datapoint * data, int N, struct gaussian * gaussians, int K,bool * fixamp, bool * fixmean, bool * fixcovar, double * avgloglikedata, double tol,long long int maxiter, bool likeonly, double w, int splitnmerge, bool keeplog, FILE *logfile,FILE *convlogfile, bool noproj, bool diagerrs, bool noweight);
+int bovy_cholesky(gsl_matrix * A, double * lndet);/* in-place Cholesky decomposition of A */
+int lowdim_estep(int d, gsl_vector * ww, gsl_matrix * SS, bool diagerrs, gsl_vector * mm, gsl_matrix * VV, double * lndet, double * exponent, gsl_vector * bbij, gsl_matrix * BBij);
+struct estepwork * alloc_estepwork(int nws, int d, int dmax);
+void free_estepwork(struct estepwork * ws, int nws);
+double xd_wtime(void);
+void xdstats_loglike(struct xdstats * stats, double loglike);
+void xdstats_em(struct xdstats * stats, long long int niter);
+void xdstats_snm(struct xdstats * stats, int j, int k, int l, bool accepted);
+void free_xdstats(struct xdstats * stats);
+bool snm_hopeless(struct xdcontext * ctx, long long int niter, double loglike0, double loglike1, double loglike2);
+void calc_splitnmerge(struct xdcontext * ctx, struct datapoint * data,int N,struct gaussian * gaussians, int K, gsl_matrix * qij, int * snmhierarchy);
+bool splitnmerge_parallel(struct xdcontext * ctx, struct datapoint * data, int N, struct gaussian * gaussians, int K, bool * fixamp, bool * fixmean, bool * fixcovar, gsl_matrix * qij, double * lognorm, int * snmhierarchy, int nsnm, double * avgloglikedata, double tol, long long int maxiter, double w, int nworkers, bool best, double skip, bool keeplog, FILE *logfile, bool noproj, bool diagerrs, bool noweight);
+void splitnmergegauss(struct xdcontext * ctx, struct gaussian * gaussians,int K, gsl_matrix * qij, int j, int k, int l);
+void proj_EM_estep(struct xdcontext * ctx, struct datapoint * data, int N, struct gaussian * gaussians, int K, double * sumloglike, bool noproj, bool diagerrs, bool noweight);
+void proj_EM_mstep(struct xdcontext * ctx, struct gaussian * gaussians, int K, bool * fixamp, bool * fixmean, bool * fixcovar, double w, int N, bool noweight);
+void proj_EM_step(struct xdcontext * ctx, struct datapoint * data, int N, struct gaussian * gaussians, int K,bool * fixamp, bool * fixmean, bool * fixcovar, double * avgloglikedata, bool likeonly, double w,bool noproj, bool diagerrs, bool noweight);
+void proj_EM_stochastic(struct xdcontext * ctx, struct datapoint * data, int N, struct gaussian * gaussians, int K, bool * fixamp, bool * fixmean, bool * fixcovar, double * avgloglikedata, double tol, double w, struct xdoptions * options, bool keeplog, FILE *logfile, bool noproj, bool diagerrs, bool noweight);
+void proj_EM_squarem(struct xdcontext * ctx, struct datapoint * data, int N, struct gaussian * gaussians, int K, bool * fixamp, bool * fixmean, bool * fixcovar, double * avgloglikedata, double tol, long long int maxiter, double w, bool keeplog, FILE *logfile, FILE *tmplogfile, bool noproj, bool diagerrs, bool noweight);
+void proj_EM_partial(struct xdcontext * ctx, struct datapoint * data, int N, struct gaussian * gaussians, int K, gsl_matrix * qij, double * lognorm, int j, int k, int l, double skip, double * avgloglikedata, double tol, long long int maxiter, double w, bool keeplog, FILE *logfile, FILE *tmplogfile, bool noproj, bool diagerrs, bool noweight);
+void proj_EM(struct xdcontext * ctx, struct datapoint * data, int N, struct gaussian * gaussians, int K,bool * fixamp, bool * fixmean, bool * fixcovar, double * avgloglikedata, double tol,long long int maxiter, bool likeonly, double w,bool keeplog, FILE *logfile,FILE *tmplogfile, bool noproj, bool diagerrs, bool noweight);
+void proj_gauss_mixtures(struct datapoint * data, int N, struct gaussian * gaussians, int K,bool * fixamp, bool * fixmean, bool * fixcovar, double * avgloglikedata, double tol,long long int maxiter, bool likeonly, double w, int splitnmerge, bool keeplog, FILE *logfile,FILE *convlogfile, bool noproj, bool diagerrs, bool noweight, long long int * niter, bool * converged, struct xdstream * stream, struct xdoptions * options);
 void calc_qstarij(double * qstarij, gsl_matrix * qij, int partial_indx[3]);
+struct datapoint * view_data(double * ydata, double * ycovar, double * projection, double * logweights, int N, int dy, int d, long long int * ystrides, long long int * cstrides, long long int * pstrides, long long int wstride, bool noproj, bool diagerrs, bool noweight, struct dataviews ** views);
+struct datapoint * stream_data(struct xdstream * stream, int start, int n);
+void free_stream(struct xdstream * stream);
+void prefetch_data(struct xdstream * stream, int start, int n);
+int proj_gauss_mixtures_strided(double * ydata, long long int * ystrides, double * ycovar, long long int * cstrides, double * projection, long long int * pstrides, double * logweights, long long int wstride, int N, int dy, double * amp, double * xmean, double * xcovar, int d, int K, bool * fixamp, bool * fixmean, bool * fixcovar, double * avgloglikedata, double tol, long long int maxiter, bool likeonly, double w, char * logname, int splitnmerge, char * convlogname, bool noproj, bool diagerrs, bool noweight, int chunksize, struct xdoptions * options);
+int batch_proj_gauss_mixtures(int P, double * ydata, double * ycovar, double * projection, double * logweights, int * ndata, int dy, double * amp, double * xmean, double * xcovar, int d, int * ngauss, char * fixamp, char * fixmean, char * fixcovar, double * avgloglikedata, double tol, long long int maxiter, char likeonly, double w, int splitnmerge, char noprojection, char diagerrors, char noweights, long long int * niter, char * converged);
+int multistart_proj_gauss_mixtures(int R, double * ydata, long long int * ystrides, double * ycovar, long long int * cstrides, double * projection, long long int * pstrides, double * logweights, long long int wstride, int N, int dy, double * amp, double * xmean, double * xcovar, int d, int K, char * fixamp, char * fixmean, char * fixcovar, double * avgloglikedata, double tol, long long int maxiter, double w, int splitnmerge, char noprojection, char diagerrors, char noweights, long long int pruneiter, double prunetol, long long int * niter, char * converged, char * pruned);
+int resample_proj_gauss_mixtures(int R, char bootstrap, int * group, unsigned long int seed, double * ydata, long long int * ystrides, double * ycovar, long long int * cstrides, double * projection, long long int * pstrides, double * logweights, long long int wstride, int N, int dy, double * amp, double * xmean, double * xcovar, int d, int K, char * fixamp, char * fixmean, char * fixcovar, double * avgloglikedata, double tol, long long int maxiter, double w, int splitnmerge, char noprojection, char diagerrors, char noweights, long long int * niter, char * converged);
+int crossvalidate_proj_gauss_mixtures(int nfold, int * fold, int nw, double * ws, double * ydata, long long int * ystrides, double * ycovar, long long int * cstrides, double * projection, long long int * pstrides, double * logweights, long long int wstride, int N, int dy, double * amp, double * xmean, double * xcovar, int d, int K, char * fixamp, char * fixmean, char * fixcovar, double * trainloglike, double * testloglike, double tol, long long int maxiter, int splitnmerge, char noprojection, char diagerrors, char noweights, long long int * niter, char * converged);
+int kmeans_init(double * ydata, double * ycovar, int N, int d, int K, char diagerrors, int niter, int nsub, unsigned long int seed, double * amp, double * xmean, double * xcovar);
+int calc_loglike(double * ydata, double * ycovar, double * projection, int N, int dy, double * amp, double * xmean, double * xcovar, int d, int K, double * loglike, double * logpost, double * xpostmean, double * xpostcovar, char noprojection, char diagerrors);
 
 #endif /* proj_gauss_mixtures.h */
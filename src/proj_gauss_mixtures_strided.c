@@ -0,0 +1,270 @@
+/*
+  NAME:
+     proj_gauss_mixtures_strided
+  PURPOSE:
+     run the projected gaussian mixtures algorithm directly on the
+     caller's (strided) arrays, without copying the data (called from
+     python and from proj_gauss_mixtures_IDL)
+  CALLING SEQUENCE:
+     proj_gauss_mixtures_strided(double * ydata, long long int * ystrides,
+     double * ycovar, long long int * cstrides, double * projection,
+     long long int * pstrides, double * logweights, long long int wstride,
+     int N, int dy, double * amp, double * xmean, double * xcovar, int d,
+     int K, bool * fixamp, bool * fixmean, bool * fixcovar,
+     double * avgloglikedata, double tol, long long int maxiter,
+     bool likeonly, double w, char * logname, int splitnmerge,
+     char * convlogname, bool noproj, bool diagerrs, bool noweight,
+     int chunksize, struct xdoptions * options)
+  INPUT:
+     ydata       - [N,dy] data
+     ystrides    - [2] strides (in doubles) of ydata
+     ycovar      - [N,dy,dy] or [N,dy] (diagerrs) error covariances
+     cstrides    - [2] strides of ycovar between data points and rows
+     projection  - [N,dy,d] projection matrices
+     pstrides    - [2] strides of projection between data points and rows
+     logweights  - [N] log weights (the weights themselves if
+                   options->linweights)
+     wstride     - stride of logweights
+     N           - number of data points
+     dy          - dimension of the data
+     amp         - [K] initial amplitudes
+     xmean       - [K,d] initial means
+     xcovar      - [K,d,d] initial covariances
+     d           - dimension of the gaussians
+     K           - number of gaussians
+     fix*        - [K] fix the amplitude, mean, covariance?
+     tol         - proj_EM convergence limit
+     maxiter     - maximum number of iterations in each proj_EM
+     likeonly    - only compute the likelihood?
+     w           - regularization parameter
+     logname     - name of the logfile (NULL for no logfiles)
+     splitnmerge - split 'n' merge depth
+     convlogname - name of the convergence logfile
+     noproj      - don't perform any projections
+     diagerrs    - the ycovar errors-squared are diagonal
+     noweight    - don't use data-weights
+     chunksize   - if > 0, stream the data through the E-step in chunks of
+                   this many data points (e.g., for memory-mapped data that
+                   do not fit in memory); no split and merge in this case
+     options     - further options and outputs (see struct xdoptions), or
+                   NULL
+  OUTPUT:
+     updated amp, xmean, xcovar and average loglikelihood
+     returns 0 on success, -1 if a logfile could not be opened
+  REVISION HISTORY:
+     2026-10-18 - Written, from proj_gauss_mixtures_IDL
+     2026-10-18 Added chunksize option to stream the data
+     2026-10-18 Added options (stochastic EM)
+     2026-10-18 Added SQUAREM acceleration option
+     2026-10-18 Take the log of the weights as the data points are viewed
+                if options->linweights, such that streamed weights are
+                never copied as a whole
+*/
+#include <stdio.h>
+#include <stdlib.h>
+#include <math.h>
+#include <stdbool.h>
+#include <time.h>
+#include <gsl/gsl_matrix.h>
+#include <gsl/gsl_vector.h>
+#include <proj_gauss_mixtures.h>
+
+int proj_gauss_mixtures_strided(double * ydata, long long int * ystrides,
+				double * ycovar, long long int * cstrides,
+				double * projection,
+				long long int * pstrides,
+				double * logweights, long long int wstride,
+				int N, int dy, double * amp, double * xmean,
+				double * xcovar, int d, int K,
+				bool * fixamp, bool * fixmean,
+				bool * fixcovar, double * avgloglikedata,
+				double tol, long long int maxiter,
+				bool likeonly, double w, char * logname,
+				int splitnmerge, char * convlogname,
+				bool noproj, bool diagerrs, bool noweight,
+				int chunksize, struct xdoptions * options){
+  bool keeplog = (logname != NULL) && ! likeonly;
+  FILE *logfile= NULL, *convlogfile= NULL;
+  long long int niter;
+  bool converged;
+  if (keeplog) {
+    logfile = fopen(logname,"a");
+    if (logfile == NULL) return -1;
+    convlogfile = fopen(convlogname,"w");
+    if (convlogfile == NULL) return -1;
+  }
+
+
+  if (keeplog){
+    time_t now;
+    time(&now);
+    fprintf(logfile,"#----------------------------------\n");
+    fprintf(logfile,"#\n#%s\n",asctime(localtime(&now)));
+    fprintf(logfile,"#----------------------------------\n");
+    fflush(logfile);
+  }
+  
+  //Set up views of the data over the given buffers, without copying,
+  //either all at once or chunk-by-chunk during the E-step
+  struct dataviews * views= NULL;
+  struct datapoint * data= NULL;
+  struct xdstream stream, * thisstream= NULL;
+  bool linweights= options != NULL && options->linweights && ! noweight;
+  int ii;
+  if ( chunksize > 0 ) {
+    stream.ydata= ydata;
+    stream.ycovar= ycovar;
+    stream.projection= projection;
+    stream.logweights= logweights;
+    stream.ystrides[0]= ystrides[0];
+    stream.ystrides[1]= ystrides[1];
+    stream.cstrides[0]= cstrides[0];
+    stream.cstrides[1]= cstrides[1];
+    stream.pstrides[0]= pstrides[0];
+    stream.pstrides[1]= pstrides[1];
+    stream.wstride= wstride;
+    stream.dy= dy;
+    stream.d= d;
+    stream.chunksize= chunksize;
+    stream.noproj= noproj;
+    stream.diagerrs= diagerrs;
+    stream.noweight= noweight;
+    stream.linweights= linweights;
+    stream.data= NULL;
+    stream.views= NULL;
+    thisstream= &stream;
+  }
+  else {
+    data= view_data(ydata,ycovar,projection,logweights,N,dy,d,ystrides,
+		    cstrides,pstrides,wstride,noproj,diagerrs,noweight,
+		    &views);
+    if ( linweights )
+      for (ii = 0; ii != N; ++ii)
+	(data+ii)->logweight= log((data+ii)->logweight);
+  }
+  struct gaussian * gaussians = (struct gaussian *) malloc (K * sizeof (struct gaussian) );
+  int jj,dd1,dd2;
+  for (jj = 0; jj != K; ++jj){
+    gaussians->mm = gsl_vector_alloc(d);
+    gaussians->VV = gsl_matrix_alloc(d,d);
+    gaussians->alpha = *(amp++);
+    for (dd1 = 0; dd1 != d; ++dd1)
+      gsl_vector_set(gaussians->mm,dd1,*(xmean++));
+    for (dd1 = 0; dd1 != d; ++dd1)
+      for (dd2 = 0; dd2 != d; ++dd2)
+	gsl_matrix_set(gaussians->VV,dd1,dd2,*(xcovar++));
+    ++gaussians;
+  }
+  gaussians -= K;
+  amp -= K;
+  xmean -= K*d;
+  xcovar -= K*d*d;
+
+
+  //Print the initial model parameters to the logfile
+  int kk;
+  if (keeplog){
+    fprintf(logfile,"#\n#Using %i Gaussians and w = %f\n\n",K,w);
+    fprintf(logfile,"#\n#Initial model parameters used:\n\n");
+    for (kk=0; kk != K; ++kk){
+      fprintf(logfile,"#Gaussian ");
+      fprintf(logfile,"%i",kk);
+      fprintf(logfile,"\n");
+      fprintf(logfile,"#amp\t=\t");
+      fprintf(logfile,"%f",(*gaussians).alpha);
+      fprintf(logfile,"\n");
+      fprintf(logfile,"#mean\t=\t");
+      for (dd1=0; dd1 != d; ++dd1){
+	fprintf(logfile,"%f",gsl_vector_get(gaussians->mm,dd1));
+	if (dd1 < d-1) fprintf(logfile,"\t");
+      }
+      fprintf(logfile,"\n");
+      fprintf(logfile,"#covar\t=\t");
+      for (dd1=0; dd1 != d; ++dd1)
+	fprintf(logfile,"%f\t",gsl_matrix_get(gaussians->VV,dd1,dd1));
+      for (dd1=0; dd1 != d-1; ++dd1)
+	for (dd2=dd1+1; dd2 != d; ++dd2){
+	  fprintf(logfile,"%f\t",gsl_matrix_get(gaussians->VV,dd1,dd2));
+	}
+      ++gaussians;
+      fprintf(logfile,"\n#\n");
+    }
+    gaussians -= K;
+    fflush(logfile);
+  }
+
+
+
+  //Then run projected_gauss_mixtures
+  proj_gauss_mixtures(data,N,gaussians,K,fixamp,fixmean,fixcovar,
+		      avgloglikedata,tol,maxiter,likeonly,w,
+		      splitnmerge,keeplog,logfile,convlogfile,noproj,diagerrs,
+		      noweight,&niter,&converged,thisstream,options);
+
+
+  //Print the final model parameters to the logfile
+  if (keeplog){
+    fprintf(logfile,"\n#Final model parameters obtained:\n\n");
+    for (kk=0; kk != K; ++kk){
+      fprintf(logfile,"#Gaussian ");
+      fprintf(logfile,"%i",kk);
+      fprintf(logfile,"\n");
+      fprintf(logfile,"#amp\t=\t");
+      fprintf(logfile,"%f",(*gaussians).alpha);
+      fprintf(logfile,"\n");
+      fprintf(logfile,"#mean\t=\t");
+      for (dd1=0; dd1 != d; ++dd1){
+	fprintf(logfile,"%f",gsl_vector_get(gaussians->mm,dd1));
+	if (dd1 < d-1) fprintf(logfile,"\t");
+      }
+      fprintf(logfile,"\n");
+      fprintf(logfile,"#covar\t=\t");
+      for (dd1=0; dd1 != d; ++dd1)
+	fprintf(logfile,"%f\t",gsl_matrix_get(gaussians->VV,dd1,dd1));
+      for (dd1=0; dd1 != d-1; ++dd1)
+	for (dd2=dd1+1; dd2 != d; ++dd2){
+	  fprintf(logfile,"%f\t",gsl_matrix_get(gaussians->VV,dd1,dd2));
+	}
+      ++gaussians;
+      fprintf(logfile,"\n#\n");
+    }
+    gaussians -= K;
+    fflush(logfile);
+  }
+
+
+
+  //Then update the arrays given to us
+  for (jj = 0; jj != K; ++jj){
+    *(amp++) = gaussians->alpha;
+    for (dd1 = 0; dd1 != d; ++dd1)
+      *(xmean++) = gsl_vector_get(gaussians->mm,dd1);
+    for (dd1 = 0; dd1 != d; ++dd1)
+      for (dd2 = 0; dd2 != d; ++dd2)
+	*(xcovar++) = gsl_matrix_get(gaussians->VV,dd1,dd2);
+    ++gaussians;
+  }
+  gaussians -= K;
+  amp -= K;
+  xmean -= K*d;
+  xcovar -= K*d*d;
+  
+  //And free any memory we allocated
+  free(data);
+  free(views);
+  
+  for (jj = 0; jj != K; ++jj){
+    gsl_vector_free(gaussians->mm);
+    gsl_matrix_free(gaussians->VV);
+    ++gaussians;
+  }
+  gaussians -= K;
+  free(gaussians);
+
+  if (keeplog){
+    fclose(logfile);
+    fclose(convlogfile);
+  }
+
+  return 0;
+}
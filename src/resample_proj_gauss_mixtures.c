@@ -0,0 +1,137 @@
+/*
+  NAME:
+     resample_proj_gauss_mixtures
+  PURPOSE:
+     run the projected gaussian mixtures algorithm on resamples of the
+     data (e.g., jackknife or bootstrap), running the resamples in
+     parallel; a resample is a list of indices into the data, its data
+     points refer to the same views of the data, such that the data are
+     never copied (called from python)
+  CALLING SEQUENCE:
+     resample_proj_gauss_mixtures(int R, char bootstrap, int * group,
+     unsigned long int seed, double * ydata, long long int * ystrides,
+     double * ycovar, long long int * cstrides, double * projection,
+     long long int * pstrides, double * logweights, long long int wstride,
+     int N, int dy, double * amp, double * xmean, double * xcovar, int d,
+     int K, char * fixamp, char * fixmean, char * fixcovar,
+     double * avgloglikedata, double tol, long long int maxiter, double w,
+     int splitnmerge, char noprojection, char diagerrors, char noweights,
+     long long int * niter, char * converged)
+  INPUT:
+     R            - number of resamples
+     bootstrap    - if true, every resample draws N data points with
+                    replacement; otherwise resample r is the jackknife
+                    resample that leaves out the data points in group r
+     group        - [N] jackknife group of every data point (0 to R-1)
+     seed         - the random numbers of bootstrap resample r are seeded
+                    with seed+r
+     ydata, ystrides, ycovar, cstrides, projection, pstrides, logweights,
+     wstride      - the data, see view_data
+     N            - number of data points
+     dy           - dimension of the data
+     amp          - [R,K] initial amplitudes for every resample
+     xmean        - [R,K,d] initial means
+     xcovar       - [R,K,d,d] initial covariances
+     d            - dimension of the gaussians
+     K            - number of gaussians
+     fix*         - [K] fix the amplitude, mean, covariance?
+     tol          - proj_EM convergence limit
+     maxiter      - maximum number of iterations in each proj_EM
+     w            - regularization parameter
+     splitnmerge  - split 'n' merge depth
+     noprojection - don't perform any projections
+     diagerrors   - the ycovar errors-squared are diagonal
+     noweights    - don't use data-weights
+  OUTPUT:
+     amp, xmean, xcovar - updated model gaussians of every resample
+     avgloglikedata     - [R] average log likelihood of every resample
+     niter              - [R] total number of EM iterations of every resample
+     converged          - [R] whether every resample converged to within tol
+  REVISION HISTORY:
+     2026-10-18 - Written
+*/
+#include <stdlib.h>
+#include <stdbool.h>
+#include <gsl/gsl_matrix.h>
+#include <gsl/gsl_vector.h>
+#include <gsl/gsl_rng.h>
+#include <proj_gauss_mixtures.h>
+
+int resample_proj_gauss_mixtures(int R, char bootstrap, int * group,
+				 unsigned long int seed, double * ydata, long long int * ystrides,
+				 double * ycovar, long long int * cstrides,
+				 double * projection, long long int * pstrides,
+				 double * logweights, long long int wstride,
+				 int N, int dy, double * amp, double * xmean,
+				 double * xcovar, int d, int K, char * fixamp,
+				 char * fixmean, char * fixcovar,
+				 double * avgloglikedata, double tol,
+				 long long int maxiter, double w,
+				 int splitnmerge, char noprojection,
+				 char diagerrors, char noweights,
+				 long long int * niter, char * converged){
+  bool noproj= (bool) noprojection;
+  bool noweight= (bool) noweights;
+  bool diagerrs= (bool) diagerrors;
+  int rr;
+  //Views of the data, shared by all resamples
+  struct dataviews * views;
+  struct datapoint * data = view_data(ydata,ycovar,projection,logweights,N,
+				      dy,d,ystrides,cstrides,pstrides,wstride,
+				      noproj,diagerrs,noweight,&views);
+  //Each resample is fit by a single thread
+#pragma omp parallel for schedule(dynamic,1)
+  for (rr = 0; rr < R; ++rr){
+    long long int off= (long long int) rr * K, thisniter;
+    bool thisconverged;
+    int ii, jj, dd1, dd2, n= 0;
+    //The data points of this resample
+    struct datapoint * subdata = (struct datapoint *) malloc (N * sizeof (struct datapoint) );
+    if ( bootstrap ){
+      gsl_rng * randgen = gsl_rng_alloc(gsl_rng_mt19937);
+      gsl_rng_set(randgen,seed+rr);
+      for (n = 0; n != N; ++n)
+	*(subdata+n)= *(data+gsl_rng_uniform_int(randgen,N));
+      gsl_rng_free(randgen);
+    }
+    else
+      for (ii = 0; ii != N; ++ii)
+	if ( group[ii] != rr ) *(subdata+n++)= *(data+ii);
+    struct gaussian * gaussians = (struct gaussian *) malloc (K * sizeof (struct gaussian) );
+    for (jj = 0; jj != K; ++jj){
+      (gaussians+jj)->mm = gsl_vector_alloc(d);
+      (gaussians+jj)->VV = gsl_matrix_alloc(d,d);
+      (gaussians+jj)->alpha = amp[off+jj];
+      for (dd1 = 0; dd1 != d; ++dd1)
+	gsl_vector_set((gaussians+jj)->mm,dd1,xmean[(off+jj)*d+dd1]);
+      for (dd1 = 0; dd1 != d; ++dd1)
+	for (dd2 = 0; dd2 != d; ++dd2)
+	  gsl_matrix_set((gaussians+jj)->VV,dd1,dd2,
+			 xcovar[(off+jj)*d*d+dd1*d+dd2]);
+    }
+    proj_gauss_mixtures(subdata,n,gaussians,K,(bool *) fixamp,
+			(bool *) fixmean,(bool *) fixcovar,avgloglikedata+rr,
+			tol,maxiter,false,w,splitnmerge,false,NULL,NULL,
+			noproj,diagerrs,noweight,&thisniter,&thisconverged,
+			NULL,NULL);
+    niter[rr]= thisniter;
+    converged[rr]= (char) thisconverged;
+    for (jj = 0; jj != K; ++jj){
+      amp[off+jj]= (gaussians+jj)->alpha;
+      for (dd1 = 0; dd1 != d; ++dd1)
+	xmean[(off+jj)*d+dd1]= gsl_vector_get((gaussians+jj)->mm,dd1);
+      for (dd1 = 0; dd1 != d; ++dd1)
+	for (dd2 = 0; dd2 != d; ++dd2)
+	  xcovar[(off+jj)*d*d+dd1*d+dd2]=
+	    gsl_matrix_get((gaussians+jj)->VV,dd1,dd2);
+      gsl_vector_free((gaussians+jj)->mm);
+      gsl_matrix_free((gaussians+jj)->VV);
+    }
+    free(gaussians);
+    free(subdata);
+  }
+  free(data);
+  free(views);
+
+  return 0;
+}
@@ -0,0 +1,38 @@
+/*
+  NAME:
+     snm_hopeless
+  PURPOSE:
+     decides whether the EM of a split and merge move can be abandoned
+     because it will not exceed the log likelihood before the move: after
+     ctx->snmtrial iterations, the log likelihood is extrapolated from its
+     last three values with Aitken's delta-squared process (EM converges
+     linearly); the move is hopeless if both the current and the
+     extrapolated log likelihood do not exceed ctx->snmtarget
+  CALLING SEQUENCE:
+     snm_hopeless(struct xdcontext * ctx, long long int niter,
+     double loglike0, double loglike1, double loglike2)
+  INPUT:
+     ctx      - state of this fit (snmtrial and snmtarget)
+     niter    - number of iterations so far
+     loglike0, loglike1, loglike2 - last three log likelihoods, in order
+  OUTPUT:
+     returns true if the EM can be abandoned
+  REVISION HISTORY:
+     2026-10-18 - Written
+*/
+#include <stdbool.h>
+#include <proj_gauss_mixtures.h>
+
+bool snm_hopeless(struct xdcontext * ctx, long long int niter,
+		  double loglike0, double loglike1, double loglike2){
+  double diff1 = loglike1 - loglike0, diff2 = loglike2 - loglike1;
+  if ( ctx->snmtrial <= 0 || niter < ctx->snmtrial
+       || loglike2 > ctx->snmtarget )
+    return false;
+  //Not improving any more
+  if ( diff2 <= 0. ) return true;
+  //The steps are not shrinking, no linear convergence yet
+  if ( diff2 >= diff1 ) return false;
+  //loglike2 + diff2 (r + r^2 + ...), with r = diff2/diff1
+  return loglike2 + diff2 * diff2 / (diff1 - diff2) <= ctx->snmtarget;
+}
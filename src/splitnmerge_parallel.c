@@ -0,0 +1,241 @@
+/*
+  NAME:
+     splitnmerge_parallel
+  PURPOSE:
+     evaluate the split and merge moves of the hierarchy concurrently:
+     batches of nworkers moves are each split and merged, and run through
+     the partial and the full proj_EM on their own copy of the model, in
+     their own context; the first move in hierarchy order that improves
+     the likelihood is accepted, or the best move of the first batch that
+     contains an improvement; the random numbers of a move only depend on
+     its position in the hierarchy, such that accepting the first
+     improvement gives the same result for any number of workers
+  CALLING SEQUENCE:
+     splitnmerge_parallel(struct xdcontext * ctx, struct datapoint * data,
+     int N, struct gaussian * gaussians, int K, bool * fixamp,
+     bool * fixmean, bool * fixcovar, gsl_matrix * qij, double * lognorm,
+     int * snmhierarchy, int nsnm, double * avgloglikedata, double tol,
+     long long int maxiter, double w, int nworkers, bool best,
+     double skip, bool keeplog, FILE *logfile, bool noproj, bool diagerrs,
+     bool noweight)
+  INPUT:
+     ctx          - state of this fit
+     data         - the data
+     N            - number of data points
+     gaussians    - model gaussians, before split and merge
+     K            - number of gaussians
+     fixamp       - fix the amplitude?
+     fixmean      - fix the mean?
+     fixcovar     - fix the covariance?
+     qij          - log posterior probabilities of the model
+     lognorm      - log of the summed alpha N of the model
+     snmhierarchy - [nsnm,3] split and merge moves (j,k,l) to try
+     nsnm         - number of moves to try
+     avgloglikedata - average log likelihood of the model
+     tol          - proj_EM convergence limit
+     maxiter      - maximum number of iterations in each proj_EM
+     w            - regularization parameter
+     nworkers     - number of moves to evaluate concurrently
+     best         - accept the best improvement in a batch rather than the
+                    first in hierarchy order
+     skip         - skip of proj_EM_partial
+     keeplog      - keep a log in a logfile? (the moves and whether they
+                    were accepted, not the log likelihood of every step)
+     logfile      - pointer to the logfile
+     noproj       - don't perform any projections
+     diagerrs     - the data->SS errors-squared are diagonal
+     noweight     - don't use data-weights
+  OUTPUT:
+     returns whether a move was accepted, in which case gaussians,
+     avgloglikedata and ctx->converged are those of the new model
+     ctx->niter   - increased by the iterations of all evaluated moves
+     ctx->stats   - the evaluated moves, their log likelihoods, and their
+                    E- and M-step times (summed over the workers) are
+                    added (if not NULL)
+  REVISION HISTORY:
+     2026-10-18 - Written
+     2026-10-18 Use proj_EM_partial for the partial EM
+     2026-10-18 Add the E- and M-step times of the workers to ctx->stats
+*/
+#include <stdio.h>
+#include <stdlib.h>
+#include <stdbool.h>
+#include <gsl/gsl_matrix.h>
+#include <gsl/gsl_vector.h>
+#include <gsl/gsl_rng.h>
+#include <proj_gauss_mixtures.h>
+
+struct snmworker{ /* a move evaluated on its own copy of the model */
+  struct xdcontext ctx;
+  struct gaussian * gaussians;
+  bool *fixamp, *fixmean, *fixcovar;
+  double avgloglikedata;
+  long long int niter[2]; /* iterations of the partial and the full EM */
+  bool converged;
+  struct xdstats stats;
+};
+
+static void alloc_worker(struct snmworker * wk, struct xdcontext * ctx,
+			 int N, int K, int d, int dmax){
+  int kk;
+  wk->ctx = *ctx;
+  wk->ctx.nthreads = 1;
+  wk->ctx.newgaussians = (struct gaussian *) malloc(K * ctx->nblocks * sizeof (struct gaussian) );
+  wk->ctx.bs = (struct modelbs *) malloc(K * sizeof (struct modelbs) );
+  wk->gaussians = (struct gaussian *) malloc(K * sizeof (struct gaussian) );
+  for (kk = 0; kk != K*ctx->nblocks; ++kk){
+    (wk->ctx.newgaussians+kk)->mm = gsl_vector_calloc(d);
+    (wk->ctx.newgaussians+kk)->VV = gsl_matrix_calloc(d,d);
+  }
+  for (kk = 0; kk != K; ++kk){
+    (wk->ctx.bs+kk)->bbij = gsl_vector_alloc(d);
+    (wk->ctx.bs+kk)->BBij = gsl_matrix_alloc(d,d);
+    (wk->gaussians+kk)->mm = gsl_vector_alloc(d);
+    (wk->gaussians+kk)->VV = gsl_matrix_alloc(d,d);
+  }
+  wk->ctx.qij = gsl_matrix_alloc(1,K);
+  wk->ctx.denseqij = false;
+  wk->ctx.loglikei = (double *) malloc(N * sizeof (double) );
+  wk->ctx.ws = alloc_estepwork(1,d,dmax);
+  wk->ctx.randgen = gsl_rng_alloc(gsl_rng_mt19937);
+  wk->ctx.stream = NULL;
+  wk->ctx.lognorm = NULL;
+  wk->fixamp = (bool *) malloc(K * sizeof (bool) );
+  wk->fixmean = (bool *) malloc(K * sizeof (bool) );
+  wk->fixcovar = (bool *) malloc(K * sizeof (bool) );
+  return;
+}
+
+static void free_worker(struct snmworker * wk, int K){
+  int kk;
+  for (kk = 0; kk != K*wk->ctx.nblocks; ++kk){
+    gsl_vector_free((wk->ctx.newgaussians+kk)->mm);
+    gsl_matrix_free((wk->ctx.newgaussians+kk)->VV);
+  }
+  for (kk = 0; kk != K; ++kk){
+    gsl_vector_free((wk->ctx.bs+kk)->bbij);
+    gsl_matrix_free((wk->ctx.bs+kk)->BBij);
+    gsl_vector_free((wk->gaussians+kk)->mm);
+    gsl_matrix_free((wk->gaussians+kk)->VV);
+  }
+  free(wk->ctx.newgaussians);
+  free(wk->ctx.bs);
+  free(wk->gaussians);
+  gsl_matrix_free(wk->ctx.qij);
+  free(wk->ctx.loglikei);
+  free_estepwork(wk->ctx.ws,1);
+  gsl_rng_free(wk->ctx.randgen);
+  free(wk->fixamp);
+  free(wk->fixmean);
+  free(wk->fixcovar);
+  return;
+}
+
+bool splitnmerge_parallel(struct xdcontext * ctx, struct datapoint * data,
+			  int N, struct gaussian * gaussians, int K,
+			  bool * fixamp, bool * fixmean, bool * fixcovar,
+			  gsl_matrix * qij, double * lognorm,
+			  int * snmhierarchy, int nsnm,
+			  double * avgloglikedata, double tol,
+			  long long int maxiter, double w, int nworkers,
+			  bool best, double skip, bool keeplog, FILE *logfile,
+			  bool noproj, bool diagerrs, bool noweight){
+  int d = (gaussians->mm)->size;
+  int ii, kk, ll, cc, start, n, dmax = 0, accepted = -1;
+  //Random numbers of the move at position kk are seeded by seed+kk
+  unsigned long int seed = gsl_rng_get(ctx->randgen);
+  if ( nworkers > nsnm ) nworkers = nsnm;
+  for (ii = 0; ii != N; ++ii)
+    if ( (int) ((data+ii)->SS)->size1 > dmax ) dmax= ((data+ii)->SS)->size1;
+  struct snmworker * wk = (struct snmworker *) malloc(nworkers * sizeof (struct snmworker) );
+  for (cc = 0; cc != nworkers; ++cc)
+    alloc_worker(wk+cc,ctx,N,K,d,dmax);
+
+  for (start = 0; start < nsnm && accepted < 0; start += n){
+    n = (nsnm-start < nworkers) ? nsnm-start : nworkers;
+#pragma omp parallel for schedule(dynamic,1) num_threads(n) private(kk,ll)
+    for (cc = 0; cc < n; ++cc){
+      struct snmworker * thiswk = wk+cc;
+      int j = snmhierarchy[3*(start+cc)];
+      int k = snmhierarchy[3*(start+cc)+1];
+      int l = snmhierarchy[3*(start+cc)+2];
+      thiswk->ctx.niter = 0;
+      thiswk->ctx.stats = NULL;
+      if ( ctx->stats != NULL ){
+	thiswk->stats = (struct xdstats) {0};
+	thiswk->ctx.stats = &(thiswk->stats);
+      }
+      gsl_rng_set(thiswk->ctx.randgen,seed+start+cc);
+      for (kk = 0; kk != K; ++kk){
+	(thiswk->gaussians+kk)->alpha = (gaussians+kk)->alpha;
+	gsl_vector_memcpy((thiswk->gaussians+kk)->mm,(gaussians+kk)->mm);
+	gsl_matrix_memcpy((thiswk->gaussians+kk)->VV,(gaussians+kk)->VV);
+      }
+      splitnmergegauss(&(thiswk->ctx),thiswk->gaussians,K,qij,j,k,l);
+      //partial EM of j, k, and l only
+      proj_EM_partial(&(thiswk->ctx),data,N,thiswk->gaussians,K,qij,lognorm,
+		      j,k,l,skip,&(thiswk->avgloglikedata),tol,maxiter,w,
+		      false,NULL,NULL,noproj,diagerrs,noweight);
+      thiswk->niter[0] = thiswk->ctx.niter;
+      //full EM
+      for (ll = 0; ll != K; ++ll){
+	thiswk->fixamp[ll] = fixamp[ll];
+	thiswk->fixmean[ll] = fixmean[ll];
+	thiswk->fixcovar[ll] = fixcovar[ll];
+      }
+      proj_EM(&(thiswk->ctx),data,N,thiswk->gaussians,K,thiswk->fixamp,
+	      thiswk->fixmean,thiswk->fixcovar,&(thiswk->avgloglikedata),tol,
+	      maxiter,false,w,false,NULL,NULL,noproj,diagerrs,noweight);
+      thiswk->niter[1] = thiswk->ctx.niter - thiswk->niter[0];
+      thiswk->converged = thiswk->ctx.converged;
+    }
+    //Accept the first (or best) improvement
+    for (cc = 0; cc != n; ++cc)
+      if ( (wk+cc)->avgloglikedata > *avgloglikedata
+	   && ( accepted < 0
+		|| ( best && (wk+cc)->avgloglikedata
+		     > (wk+accepted)->avgloglikedata ) ) ){
+	accepted = cc;
+	if ( ! best ) break;
+      }
+    //Book-keeping, in hierarchy order
+    for (cc = 0; cc != n; ++cc){
+      ctx->niter += (wk+cc)->niter[0] + (wk+cc)->niter[1];
+      if (keeplog){
+	fprintf(logfile,"#Merging %i and %i, splitting %i\n",
+		snmhierarchy[3*(start+cc)],snmhierarchy[3*(start+cc)+1],
+		snmhierarchy[3*(start+cc)+2]);
+	fprintf(logfile,"%f\n",(wk+cc)->avgloglikedata);
+	fprintf(logfile, (cc == accepted) ? "#accepted\n"
+		: "#didn't improve likelihood\n");
+      }
+      if ( ctx->stats != NULL ){
+	xdstats_snm(ctx->stats,snmhierarchy[3*(start+cc)],
+		    snmhierarchy[3*(start+cc)+1],snmhierarchy[3*(start+cc)+2],
+		    cc == accepted);
+	xdstats_em(ctx->stats,(wk+cc)->niter[0]);
+	xdstats_em(ctx->stats,(wk+cc)->niter[1]);
+	for (ll = 0; ll != (wk+cc)->stats.nloglike; ++ll)
+	  xdstats_loglike(ctx->stats,(wk+cc)->stats.loglike[ll]);
+	ctx->stats->testep += (wk+cc)->stats.testep;
+	ctx->stats->tmstep += (wk+cc)->stats.tmstep;
+	free_xdstats(&((wk+cc)->stats));
+      }
+    }
+  }
+
+  if ( accepted >= 0 ){
+    for (kk = 0; kk != K; ++kk){
+      (gaussians+kk)->alpha = ((wk+accepted)->gaussians+kk)->alpha;
+      gsl_vector_memcpy((gaussians+kk)->mm,((wk+accepted)->gaussians+kk)->mm);
+      gsl_matrix_memcpy((gaussians+kk)->VV,((wk+accepted)->gaussians+kk)->VV);
+    }
+    *avgloglikedata = (wk+accepted)->avgloglikedata;
+    ctx->converged = (wk+accepted)->converged;
+  }
+  for (cc = 0; cc != nworkers; ++cc)
+    free_worker(wk+cc,K);
+  free(wk);
+
+  return accepted >= 0;
+}
@@ -4,9 +4,10 @@
   PURPOSE:
      split one gaussian and merge two other gaussians
   CALLING SEQUENCE:
-     splitnmergegauss(struct gaussian * gaussians,int K, gsl_matrix * qij, 
-     int j, int k, int l)
+     splitnmergegauss(struct xdcontext * ctx, struct gaussian * gaussians,
+     int K, gsl_matrix * qij, int j, int k, int l)
   INPUT:
+     ctx         - state of this fit (for the random number generator)
      gaussians   - model gaussians
      K           - number of gaussians
      qij         - matrix of log(posterior likelihoods)
@@ -16,6 +17,7 @@
      updated gaussians
   REVISION HISTORY:
      2008-09-21 - Written Bovy
+     2026-10-18 Use the random number generator of the fit's context
 */
 #include <math.h>
 #include <gsl/gsl_matrix.h>
@@ -23,8 +25,8 @@
 #include <gsl/gsl_linalg.h>
 #include <proj_gauss_mixtures.h>
 
-void splitnmergegauss(struct gaussian * gaussians,int K, 
-		      gsl_matrix * qij, int j, int k, int l){
+void splitnmergegauss(struct xdcontext * ctx, struct gaussian * gaussians,
+		      int K, gsl_matrix * qij, int j, int k, int l){
   //get the gaussians to be split 'n' merged
   int d = (gaussians->VV)->size1;//dim of mm
   //int partial_indx[]= {-1,-1,-1};/* dummy argument for logsum */
@@ -91,9 +93,9 @@ void splitnmergegauss(struct gaussian * gaussians,int K,
   gsl_matrix_memcpy(gaussiank.VV,unitm);
   gsl_matrix_memcpy(gaussianl.VV,unitm);
   gsl_vector_memcpy(gaussiank.mm,gaussianl.mm);
-  bovy_randvec(eps,d,sqrt(detVVjl));
+  bovy_randvec(eps,d,sqrt(detVVjl),ctx->randgen);
   gsl_vector_add(gaussiank.mm,eps);
-  bovy_randvec(eps,d,sqrt(detVVjl));
+  bovy_randvec(eps,d,sqrt(detVVjl),ctx->randgen);
   gsl_vector_add(gaussianl.mm,eps);
   
   //copy everything back into the right gaussians
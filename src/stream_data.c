@@ -0,0 +1,90 @@
+/*
+  NAME:
+     stream_data, free_stream, prefetch_data
+  PURPOSE:
+     set up views of a chunk of the data, when the data are streamed
+     through the E-step (e.g., from memory-mapped files that do not fit in
+     memory); prefetch_data asks the operating system to start reading a
+     chunk of the data, such that this overlaps with the processing of the
+     previous chunk
+  CALLING SEQUENCE:
+     stream_data(struct xdstream * stream, int start, int n)
+     free_stream(struct xdstream * stream)
+     prefetch_data(struct xdstream * stream, int start, int n)
+  INPUT:
+     stream - the streamed data
+     start  - index of the first data point of the chunk
+     n      - number of data points in the chunk
+  OUTPUT:
+     stream_data returns the data points of the chunk, which remain valid
+     until the next call (free_stream frees the last chunk); if
+     stream->linweights, their logweight is the log of the given weight
+  REVISION HISTORY:
+     2026-10-18 - Written
+     2026-10-18 Take the log of the weights chunk-by-chunk (linweights)
+*/
+#include <stdlib.h>
+#include <math.h>
+#include <stdbool.h>
+#include <stdint.h>
+#if defined(__unix__) || defined(__APPLE__)
+#include <unistd.h>
+#include <sys/mman.h>
+#endif
+#include <gsl/gsl_matrix.h>
+#include <gsl/gsl_vector.h>
+#include <proj_gauss_mixtures.h>
+
+struct datapoint * stream_data(struct xdstream * stream, int start, int n){
+  int ii;
+  free_stream(stream);
+  stream->data= view_data(stream->ydata+start*stream->ystrides[0],
+			  stream->ycovar+start*stream->cstrides[0],
+			  stream->noproj ? stream->projection
+			  : stream->projection+start*stream->pstrides[0],
+			  stream->noweight ? stream->logweights
+			  : stream->logweights+start*stream->wstride,
+			  n,stream->dy,stream->d,stream->ystrides,
+			  stream->cstrides,stream->pstrides,stream->wstride,
+			  stream->noproj,stream->diagerrs,stream->noweight,
+			  &(stream->views));
+  if ( stream->linweights && ! stream->noweight )
+    for (ii = 0; ii != n; ++ii)
+      (stream->data+ii)->logweight= log((stream->data+ii)->logweight);
+  return stream->data;
+}
+
+void free_stream(struct xdstream * stream){
+  free(stream->data);
+  free(stream->views);
+  stream->data= NULL;
+  stream->views= NULL;
+  return;
+}
+
+/* ask for the rows [start,start+n) of a strided array to be read */
+static void prefetch_rows(double * x, long long int stride, int start, int n,
+			  long long int rowlen){
+#if defined(POSIX_MADV_WILLNEED)
+  uintptr_t pagesize= (uintptr_t) sysconf(_SC_PAGESIZE);
+  uintptr_t first= (uintptr_t) (x+start*stride);
+  uintptr_t last= (uintptr_t) (x+(start+n-1)*stride+rowlen);
+  first-= first % pagesize;
+  posix_madvise((void *) first,last-first,POSIX_MADV_WILLNEED);
+#endif
+  return;
+}
+
+void prefetch_data(struct xdstream * stream, int start, int n){
+  int dy= stream->dy;
+  prefetch_rows(stream->ydata,stream->ystrides[0],start,n,
+		(dy-1)*stream->ystrides[1]+1);
+  prefetch_rows(stream->ycovar,stream->cstrides[0],start,n,
+		(dy-1)*stream->cstrides[1]+(stream->diagerrs ? 1 : dy));
+  if ( ! stream->noproj )
+    prefetch_rows(stream->projection,stream->pstrides[0],start,n,
+		  (dy-1)*stream->pstrides[1]+stream->d);
+  if ( ! stream->noweight )
+    prefetch_rows(stream->logweights,stream->wstride,start,n,1);
+  return;
+}
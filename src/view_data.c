@@ -0,0 +1,79 @@
+/*
+  NAME:
+     view_data
+  PURPOSE:
+     set up the data points as gsl views straight over the caller's
+     buffers, rather than copying every data point into freshly allocated
+     gsl vectors and matrices; the buffers are never written to
+  CALLING SEQUENCE:
+     view_data(double * ydata, double * ycovar, double * projection,
+     double * logweights, int N, int dy, int d, long long int * ystrides,
+     long long int * cstrides, long long int * pstrides,
+     long long int wstride, bool noproj, bool diagerrs, bool noweight,
+     struct dataviews ** views)
+  INPUT:
+     ydata      - [N,dy] data
+     ycovar     - [N,dy,dy] or [N,dy] (diagerrs) error covariances
+     projection - [N,dy,d] projection matrices
+     logweights - [N] log weights
+     N          - number of data points
+     dy         - dimension of the data
+     d          - dimension of the gaussians
+     ystrides   - [2] strides (in doubles) between data points and between
+                  the elements of a data point in ydata
+     cstrides   - [2] strides between data points and between the rows of
+                  a covariance in ycovar (the elements of a row have to be
+                  contiguous, unless diagerrs)
+     pstrides   - [2] strides between data points and between the rows of
+                  a projection matrix (the elements of a row have to be
+                  contiguous)
+     wstride    - stride between the logweights
+     noproj     - don't perform any projections
+     diagerrs   - the ycovar errors-squared are diagonal
+     noweight   - don't use data-weights
+  OUTPUT:
+     views      - the views the data points refer to, free this (and the
+                  returned data) when done
+     returns the data points
+  REVISION HISTORY:
+     2026-10-18 - Written
+*/
+#include <stdlib.h>
+#include <stdbool.h>
+#include <gsl/gsl_matrix.h>
+#include <gsl/gsl_vector.h>
+#include <proj_gauss_mixtures.h>
+
+struct datapoint * view_data(double * ydata, double * ycovar,
+			     double * projection, double * logweights,
+			     int N, int dy, int d, long long int * ystrides,
+			     long long int * cstrides, long long int * pstrides,
+			     long long int wstride, bool noproj, bool diagerrs,
+			     bool noweight, struct dataviews ** views){
+  struct datapoint * data = (struct datapoint *) malloc( N * sizeof (struct datapoint) );
+  struct dataviews * thisviews;
+  int ii;
+  *views = (struct dataviews *) malloc( N * sizeof (struct dataviews) );
+  for (ii = 0; ii != N; ++ii){
+    thisviews= *views+ii;
+    thisviews->ww= gsl_vector_view_array_with_stride(ydata+ii*ystrides[0],
+						     ystrides[1],dy);
+    (data+ii)->ww= &(thisviews->ww.vector);
+    if ( diagerrs )
+      thisviews->SS= gsl_matrix_view_array_with_tda(ycovar+ii*cstrides[0],
+						    dy,1,cstrides[1]);
+    else
+      thisviews->SS= gsl_matrix_view_array_with_tda(ycovar+ii*cstrides[0],
+						    dy,dy,cstrides[1]);
+    (data+ii)->SS= &(thisviews->SS.matrix);
+    if ( ! noproj ) {
+      thisviews->RR= gsl_matrix_view_array_with_tda(projection+ii*pstrides[0],
+						    dy,d,pstrides[1]);
+      (data+ii)->RR= &(thisviews->RR.matrix);
+    }
+    else (data+ii)->RR= NULL;
+    if ( ! noweight ) (data+ii)->logweight= logweights[ii*wstride];
+    else (data+ii)->logweight= 0.;
+  }
+  return data;
+}
@@ -0,0 +1,81 @@
+/*
+  NAME:
+     xd_wtime, xdstats_loglike, xdstats_em, xdstats_snm, free_xdstats
+  PURPOSE:
+     collect the statistics of a fit in memory: the log likelihood after
+     every E-step, the number of iterations of every proj_EM call, and the
+     split and merge moves that were tried; the arrays grow as needed
+  CALLING SEQUENCE:
+     xd_wtime()
+     xdstats_loglike(struct xdstats * stats, double loglike)
+     xdstats_em(struct xdstats * stats, long long int niter)
+     xdstats_snm(struct xdstats * stats, int j, int k, int l, bool accepted)
+     free_xdstats(struct xdstats * stats)
+  INPUT:
+     stats    - statistics of the fit
+     loglike  - average log likelihood of the data
+     niter    - number of iterations of a proj_EM call
+     j,k,l    - merge j and k, split l
+     accepted - was the split and merge move accepted?
+  OUTPUT:
+     xd_wtime returns the wall-clock time in seconds
+     the statistics are appended to stats; free_xdstats frees the arrays
+     (but not stats itself)
+  REVISION HISTORY:
+     2026-10-18 - Written
+*/
+#include <stdlib.h>
+#include <stdbool.h>
+#include <sys/time.h>
+#include <proj_gauss_mixtures.h>
+
+/* make room for n+1 elements of size elsize */
+static void * grow(void * x, size_t elsize, long long int n, long long int * size){
+  if ( n < *size ) return x;
+  *size = ( *size == 0 ) ? 64 : 2 * *size;
+  return realloc(x,*size * elsize);
+}
+
+double xd_wtime(void){
+  struct timeval tv;
+  gettimeofday(&tv,NULL);
+  return (double) tv.tv_sec + 1.e-6 * tv.tv_usec;
+}
+
+void xdstats_loglike(struct xdstats * stats, double loglike){
+  stats->loglike = (double *) grow(stats->loglike,sizeof (double),
+				   stats->nloglike,&(stats->sizeloglike));
+  stats->loglike[stats->nloglike++] = loglike;
+  return;
+}
+
+void xdstats_em(struct xdstats * stats, long long int niter){
+  stats->emiter = (long long int *) grow(stats->emiter,sizeof (long long int),
+					 stats->nem,&(stats->sizeem));
+  stats->emiter[stats->nem++] = niter;
+  return;
+}
+
+void xdstats_snm(struct xdstats * stats, int j, int k, int l, bool accepted){
+  stats->snmmoves = (int *) grow(stats->snmmoves,4 * sizeof (int),
+				 stats->nsnm,&(stats->sizesnm));
+  stats->snmmoves[4*stats->nsnm] = j;
+  stats->snmmoves[4*stats->nsnm+1] = k;
+  stats->snmmoves[4*stats->nsnm+2] = l;
+  stats->snmmoves[4*stats->nsnm+3] = (int) accepted;
+  ++(stats->nsnm);
+  return;
+}
+
+void free_xdstats(struct xdstats * stats){
+  free(stats->loglike);
+  free(stats->emiter);
+  free(stats->snmmoves);
+  stats->loglike = NULL;
+  stats->emiter = NULL;
+  stats->snmmoves = NULL;
+  stats->nloglike = stats->sizeloglike = 0;
+  stats->nem = stats->sizeem = 0;
+  stats->nsnm = stats->sizesnm = 0;
+  return;
+}
@@ -0,0 +1,81 @@
+# test_batch.py: test fitting many problems at once
+import numpy
+from extreme_deconvolution import extreme_deconvolution, \
+    batch_extreme_deconvolution
+
+_rng= numpy.random.RandomState(4)
+
+def _problem(ndata,ngauss):
+    assign= _rng.choice(ngauss,size=ndata)
+    ydata= _rng.normal(size=(ndata,2))\
+        +5.*numpy.arange(ngauss)[assign][:,None]
+    ycovar= _rng.uniform(size=(ndata,2))/2.
+    xamp= numpy.ones(ngauss)/float(ngauss)
+    xmean= _rng.normal(size=(ngauss,2))\
+        +5.*numpy.arange(ngauss)[:,None]
+    xcovar= numpy.array([numpy.eye(2) for kk in range(ngauss)])
+    return [ydata,ycovar,xamp,xmean,xcovar]
+
+def test_batch_same_as_single():
+    # Each problem in the batch should give the same result as fitting it
+    # on its own
+    problems= [_problem(ndata,ngauss)
+               for ndata,ngauss in zip([501,1001,301,2001],[2,3,1,3])]
+    single= []
+    for problem in problems:
+        ydata,ycovar,xamp,xmean,xcovar= [numpy.copy(p) for p in problem]
+        l= extreme_deconvolution(ydata,ycovar,xamp,xmean,xcovar)
+        single.append((l,xamp,xmean,xcovar))
+    xamp= [numpy.copy(p[2]) for p in problems]
+    xmean= [numpy.copy(p[3]) for p in problems]
+    xcovar= [numpy.copy(p[4]) for p in problems]
+    l, niter, converged=\
+        batch_extreme_deconvolution([p[0] for p in problems],
+                                    [p[1] for p in problems],
+                                    xamp,xmean,xcovar)
+    assert numpy.all(converged), 'batch fits did not converge'
+    assert numpy.all(niter > 0), 'batch fits did not report iterations'
+    for pp in range(len(problems)):
+        assert numpy.fabs(l[pp]-single[pp][0]) < 10.**-10., 'batch log likelihood does not agree with single fit'
+        assert numpy.all(numpy.fabs(xamp[pp]-single[pp][1]) < 10.**-8.), 'batch amplitudes do not agree with single fit'
+        assert numpy.all(numpy.fabs(xmean[pp]-single[pp][2]) < 10.**-8.), 'batch means do not agree with single fit'
+        assert numpy.all(numpy.fabs(xcovar[pp]-single[pp][3]) < 10.**-8.), 'batch covariances do not agree with single fit'
+    return None
+
+def test_batch_concatenated_maxiter():
+    # Concatenated, offset-indexed inputs; with maxiter the fits should
+    # report that they did not converge
+    problems= [_problem(ndata,2) for ndata in [401,601,801]]
+    ydata= numpy.concatenate([p[0] for p in problems])
+    ycovar= numpy.concatenate([p[1] for p in problems])
+    xamp= numpy.concatenate([p[2] for p in problems])
+    xmean= numpy.concatenate([p[3] for p in problems])
+    xcovar= numpy.concatenate([p[4] for p in problems])
+    l, niter, converged=\
+        batch_extreme_deconvolution(ydata,ycovar,xamp,xmean,xcovar,
+                                    ndata=[401,601,801],ngauss=[2,2,2],
+                                    tol=1.e-300,maxiter=3)
+    assert numpy.all(niter == 3), 'batch fits did not stop at maxiter'
+    assert not numpy.any(converged), 'batch fits stopped at maxiter reported as converged'
+    for pp in range(3):
+        tamp, tmean, tcovar= [numpy.copy(p) for p in problems[pp][2:]]
+        tl= extreme_deconvolution(problems[pp][0],problems[pp][1],
+                                  tamp,tmean,tcovar,tol=1.e-300,maxiter=3)
+        assert numpy.fabs(l[pp]-tl) < 10.**-10., 'batch log likelihood does not agree with single fit'
+        assert numpy.all(numpy.fabs(xmean[2*pp:2*pp+2]-tmean) < 10.**-8.), 'batch means do not agree with single fit'
+    return None
+
+def test_batch_large_maxiter():
+    # maxiter beyond the range of an int should not overflow into a
+    # negative limit that skips the fit
+    problem= _problem(501,2)
+    ydata,ycovar,xamp,xmean,xcovar= [numpy.copy(p) for p in problem]
+    l= extreme_deconvolution(ydata,ycovar,xamp,xmean,xcovar)
+    bxamp,bxmean,bxcovar= [[numpy.copy(p)] for p in problem[2:]]
+    bl, niter, converged=\
+        batch_extreme_deconvolution([problem[0]],[problem[1]],
+                                    bxamp,bxmean,bxcovar,maxiter=2**31)
+    assert converged[0], 'batch fit with a large maxiter did not converge'
+    assert niter[0] > 0, 'batch fit with a large maxiter did not run'
+    assert numpy.fabs(bl[0]-l) < 10.**-10., 'batch fit with a large maxiter does not agree with single fit'
+    return None
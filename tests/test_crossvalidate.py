@@ -0,0 +1,102 @@
+# test_crossvalidate.py: test the cross-validation over the regularization
+import numpy
+import pytest
+from extreme_deconvolution import extreme_deconvolution, score_samples, \
+    crossvalidate_extreme_deconvolution
+
+def test_crossvalidate_same_as_single():
+    # Every fold should give the same fits and held-out likelihoods as
+    # fitting the data outside of the fold for every w in turn
+    rng= numpy.random.RandomState(8)
+    ndata= 1001
+    xmean= numpy.array([[0.,0.],[4.,0.]])
+    ycovar= rng.uniform(size=(ndata,2,2))*0.1
+    ycovar= numpy.einsum('ijk,ilk->ijl',ycovar,ycovar)+0.05*numpy.eye(2)
+    ydata= xmean[rng.choice(2,size=ndata)]+rng.normal(size=(ndata,2))
+    xamp, xcovar= numpy.ones(2)/2., numpy.tile(numpy.eye(2),(2,1,1))
+    nfold= 4
+    out= crossvalidate_extreme_deconvolution(ydata,ycovar,xamp,xmean,xcovar,
+                                             w=[1.,0.,0.1],nfold=nfold,
+                                             seed=2)
+    assert numpy.all(out['w'] == numpy.array([0.,0.1,1.])), 'crossvalidate_extreme_deconvolution does not sort the regularization parameters'
+    assert out['xcovar'].shape == (nfold,3,2,2,2), 'crossvalidate_extreme_deconvolution does not return the fits to all folds'
+    assert numpy.all(out['converged']), 'Folds did not converge'
+    fold= numpy.zeros(ndata,dtype=int)
+    fold[numpy.random.RandomState(2).permutation(ndata)]= \
+        numpy.arange(ndata) % nfold
+    for ff in range(nfold):
+        a, m, c= numpy.copy(xamp), numpy.copy(xmean), numpy.copy(xcovar)
+        for ii,w in enumerate(out['w']):
+            l= extreme_deconvolution(ydata[fold != ff],ycovar[fold != ff],
+                                     a,m,c,w=w)
+            assert numpy.fabs(l-out['train'][ff,ii]) < 10.**-8., 'Fold does not give the same likelihood as a single fit'
+            assert numpy.all(numpy.fabs(c-out['xcovar'][ff,ii]) < 10.**-6.), 'Fold does not give the same covariances as a single fit'
+            heldout= numpy.mean(score_samples(ydata[fold == ff],
+                                              ycovar[fold == ff],a,m,c))
+            assert numpy.fabs(heldout-out['heldout'][ff,ii]) < 10.**-8., 'Held-out likelihood is not that of score_samples'
+    assert numpy.fabs(out['avgheldout'][0]-numpy.sum(out['heldout'][:,0]*numpy.bincount(fold))/ndata) < 10.**-12., 'Average held-out likelihood is not the average over all data points'
+    with pytest.raises(ValueError):
+        crossvalidate_extreme_deconvolution(ydata,ycovar,xamp,xmean,xcovar,
+                                            nfold=1)
+    return None
+
+def test_crossvalidate_shared_errors():
+    # Held-out likelihoods with errors and projections that are shared by
+    # all data points (scored with cached factorizations) should be the
+    # same as with a copy for every data point
+    rng= numpy.random.RandomState(9)
+    ndata= 600
+    ydata= rng.normal(size=(ndata,3))
+    ydata[:300]+= 3.
+    xamp= numpy.ones(2)/2.
+    xmean= numpy.array([[2.,2.,2.],[0.,0.,0.]])
+    xcovar= numpy.tile(numpy.eye(3),(2,1,1))
+    for diag in [True,False]:
+        ycovar= 0.2*numpy.ones(3) if diag else 0.2*numpy.eye(3)
+        ycovar= numpy.broadcast_to(ycovar,(ndata,)+ycovar.shape)
+        proj= numpy.broadcast_to(numpy.eye(3),(ndata,3,3))
+        shared= crossvalidate_extreme_deconvolution(ydata,ycovar,xamp,xmean,
+                                                    xcovar,w=[0.,0.5],
+                                                    nfold=3,seed=4,
+                                                    projection=proj)
+        copied= crossvalidate_extreme_deconvolution(ydata,
+                                                    numpy.array(ycovar),
+                                                    xamp,xmean,xcovar,
+                                                    w=[0.,0.5],nfold=3,
+                                                    seed=4,
+                                                    projection=numpy.array(proj))
+        assert numpy.all(numpy.fabs(shared['heldout']-copied['heldout']) < 10.**-10.), 'Held-out likelihood with shared errors is not the same as with copied errors'
+    return None
+
+def test_crossvalidate_weights():
+    # With weights, the held-out likelihood should measure the same
+    # (weighted) quantity as the training likelihood
+    rng= numpy.random.RandomState(10)
+    ndata= 801
+    xmean= numpy.array([[0.,0.],[4.,0.]])
+    ycovar= rng.uniform(size=(ndata,2))*0.2+0.05
+    ydata= xmean[rng.choice(2,size=ndata)]+rng.normal(size=(ndata,2))
+    weight= rng.uniform(size=ndata)+0.5
+    xamp, xcovar= numpy.ones(2)/2., numpy.tile(numpy.eye(2),(2,1,1))
+    nfold= 3
+    out= crossvalidate_extreme_deconvolution(ydata,ycovar,xamp,xmean,xcovar,
+                                             w=[0.,0.5],nfold=nfold,seed=3,
+                                             weight=weight)
+    fold= numpy.zeros(ndata,dtype=int)
+    fold[numpy.random.RandomState(3).permutation(ndata)]= \
+        numpy.arange(ndata) % nfold
+    for ff in range(nfold):
+        for ii in range(2):
+            a, m, c= [numpy.copy(out[key][ff,ii])
+                      for key in ['xamp','xmean','xcovar']]
+            train= extreme_deconvolution(ydata[fold != ff],ycovar[fold != ff],
+                                         a,m,c,weight=weight[fold != ff],
+                                         likeonly=True)
+            # the training likelihood is that of the last EM iteration
+            assert numpy.fabs(train-out['train'][ff,ii]) < 10.**-5., 'Training likelihood is not the weighted likelihood of the fit'
+            heldout= extreme_deconvolution(ydata[fold == ff],
+                                           ycovar[fold == ff],a,m,c,
+                                           weight=weight[fold == ff],
+                                           likeonly=True)
+            assert numpy.fabs(heldout-out['heldout'][ff,ii]) < 10.**-8., 'Held-out likelihood is not weighted as the training likelihood'
+    return None
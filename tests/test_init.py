@@ -0,0 +1,63 @@
+# test_init.py: test the k-means initial conditions for extreme deconvolution
+import numpy
+import pytest
+from extreme_deconvolution import extreme_deconvolution, kmeans_init
+
+def _sample_five(ndata,seed):
+    rng= numpy.random.RandomState(seed)
+    xmean= numpy.array([[0.,0.],[3.,0.],[0.,3.],[3.,3.],[6.,0.]])
+    ycovar= rng.uniform(size=(ndata,2))*0.1
+    ydata= xmean[rng.choice(5,size=ndata)]\
+        +rng.normal(size=(ndata,2))*0.4\
+        +rng.normal(size=(ndata,2))*numpy.sqrt(ycovar)
+    return (ydata,ycovar,xmean)
+
+def test_kmeans_init_twod():
+    # k-means should find the five well-separated clusters, with their
+    # deconvolved covariances, such that EM converges quickly
+    ydata, ycovar, xmean= _sample_five(5001,1)
+    xamp, initmean, xcovar= kmeans_init(ydata,ycovar,5,seed=3)
+    assert numpy.fabs(numpy.sum(xamp)-1.) < 10.**-10., 'k-means amplitudes do not sum to one'
+    for mm in xmean:
+        assert numpy.amin(numpy.sum((initmean-mm)**2.,axis=1)) < 0.01, 'k-means does not find the clusters'
+    for cc in xcovar:
+        assert numpy.all(numpy.fabs(cc-0.16*numpy.eye(2)) < 0.03), 'k-means covariances are not deconvolved'
+    # Full error covariances give the same
+    fullycovar= numpy.array([numpy.diag(c) for c in ycovar])
+    out= kmeans_init(ydata,fullycovar,5,seed=3)
+    assert numpy.all(numpy.fabs(out[2]-xcovar) < 10.**-10.), 'k-means does not give the same result for full and diagonal error covariances'
+    res= extreme_deconvolution(ydata,ycovar,xamp,initmean,xcovar,
+                               fullresult=True)
+    assert res.niter < 20, 'EM from the k-means initial conditions does not converge quickly'
+    return None
+
+def test_kmeans_init_subsample():
+    # A subsample should find the same clusters, and the same seed should
+    # give the same result
+    ydata, ycovar, xmean= _sample_five(5001,2)
+    out1= kmeans_init(ydata,ycovar,5,subsample=500,seed=4)
+    out2= kmeans_init(ydata,ycovar,5,subsample=500,seed=4)
+    for o1,o2 in zip(out1,out2):
+        assert numpy.all(o1 == o2), 'k-means with the same seed does not give the same result'
+    for mm in xmean:
+        assert numpy.amin(numpy.sum((out1[1]-mm)**2.,axis=1)) < 0.05, 'k-means on a subsample does not find the clusters'
+    for cc in out1[2]:
+        assert numpy.all(numpy.linalg.eigvalsh(cc) > 0.), 'k-means covariances are not positive definite'
+    with pytest.raises(ValueError):
+        kmeans_init(ydata,ycovar,5,subsample=3)
+    return None
+
+def test_kmeans_init_duplicates():
+    # With fewer distinct data points than gaussians, the empty cluster
+    # should stay within the data rather than move to the origin
+    ydata= numpy.array(10*[[5.,5.]]+10*[[7.,7.]])
+    ycovar= numpy.zeros((20,2))
+    for seed in range(5):
+        xamp, xmean, xcovar= kmeans_init(ydata,ycovar,3,seed=seed)
+        assert numpy.all((xmean >= 5.) & (xmean <= 7.)), 'k-means moves an empty cluster outside of the data'
+        for mm in [[5.,5.],[7.,7.]]:
+            assert numpy.amin(numpy.sum((xmean-mm)**2.,axis=1)) < 10.**-10., 'k-means does not find the distinct data points'
+        assert numpy.all(xamp > 0.), 'k-means gives an empty cluster no amplitude'
+        for cc in xcovar:
+            assert numpy.all(numpy.linalg.eigvalsh(cc) > 0.), 'k-means covariances are not positive definite'
+    return None
@@ -0,0 +1,74 @@
+# test_model.py: test the persisted model with cached factorizations
+import os
+import tempfile
+import numpy
+import pytest
+from extreme_deconvolution import score_samples, membership_prob, sample, \
+    XDModel
+
+def _model():
+    rng= numpy.random.RandomState(4)
+    xamp= numpy.array([0.2,0.3,0.5])
+    xmean= rng.normal(size=(3,4))
+    tmp= rng.normal(size=(3,4,4))
+    xcovar= numpy.einsum('kij,klj->kil',tmp,tmp)+0.1*numpy.eye(4)
+    return (xamp,xmean,xcovar)
+
+def test_model_cache():
+    # The cached factorizations should be those of the covariances, and
+    # scoring error-free data with them should agree with the C kernel
+    xamp,xmean,xcovar= _model()
+    model= XDModel(xamp,xmean,xcovar)
+    assert model.ngauss == 3 and model.dim == 4, 'XDModel does not have the right number of gaussians and dimension'
+    for kk in range(3):
+        assert numpy.all(numpy.fabs(numpy.dot(model.xchol[kk],model.xchol[kk].T)-xcovar[kk]) < 10.**-10.), 'xchol is not the Cholesky factor of xcovar'
+        assert numpy.all(numpy.fabs(numpy.dot(model.xinv[kk],xcovar[kk])-numpy.eye(4)) < 10.**-10.), 'xinv is not the inverse of xcovar'
+        assert numpy.fabs(model.logdet[kk]-numpy.linalg.slogdet(xcovar[kk])[1]) < 10.**-10., 'logdet is not the log determinant of xcovar'
+    ydata= numpy.random.RandomState(5).normal(size=(201,4))
+    nocovar= numpy.zeros((201,4))
+    assert numpy.all(numpy.fabs(model.score_samples(ydata)-score_samples(ydata,nocovar,xamp,xmean,xcovar)) < 10.**-10.), 'Scoring error-free data with the cached factorizations does not agree with score_samples'
+    assert numpy.all(numpy.fabs(model.membership_prob(ydata,log=True)-membership_prob(ydata,nocovar,xamp,xmean,xcovar,log=True)) < 10.**-10.), 'Posterior probabilities with the cached factorizations do not agree with membership_prob'
+    ycovar= 0.1*numpy.ones((201,4))
+    assert numpy.all(model.score_samples(ydata,ycovar) == score_samples(ydata,ycovar,xamp,xmean,xcovar)), 'XDModel.score_samples with errors is not score_samples'
+    assert numpy.all(model.sample(100,seed=1) == sample(xamp,xmean,xcovar,100,seed=1)), 'XDModel.sample is not sample'
+    with pytest.raises(ValueError):
+        model.score_samples(ydata,projection=numpy.zeros((201,4,4)))
+    with pytest.raises(ValueError):
+        XDModel(xamp,xmean,-xcovar)
+    return None
+
+def test_model_save_load():
+    # A saved model should load with the same parameters and
+    # factorizations, memory-mapped or not
+    xamp,xmean,xcovar= _model()
+    model= XDModel(xamp,xmean,xcovar)
+    tmpdir= tempfile.mkdtemp()
+    path= os.path.join(tmpdir,'model.xdm')
+    try:
+        model.save(path)
+        for mmap in [True,False]:
+            loaded= XDModel.load(path,mmap=mmap)
+            for name in ['xamp','xmean','xcovar','xchol','xinv','logdet']:
+                assert numpy.all(getattr(loaded,name) == getattr(model,name)), 'Loaded %s is not the saved one' % name
+            if mmap:
+                assert isinstance(loaded.xinv,numpy.memmap), 'Loaded model is not memory-mapped'
+            del loaded
+        # A truncated file should be detected before reading or mapping it
+        with open(path,'r+b') as savefile:
+            savefile.truncate(os.path.getsize(path)-8)
+        for mmap in [True,False]:
+            with pytest.raises(ValueError,match='truncated'):
+                XDModel.load(path,mmap=mmap)
+        with open(path,'r+b') as savefile:
+            savefile.seek(8)
+            numpy.array([2],dtype='<i8').tofile(savefile)
+        with pytest.raises(ValueError):
+            XDModel.load(path)
+        with open(path,'wb') as savefile:
+            savefile.write(b'not a model')
+        with pytest.raises(ValueError):
+            XDModel.load(path)
+    finally:
+        if os.path.exists(path): os.remove(path)
+        os.rmdir(tmpdir)
+    return None
@@ -0,0 +1,60 @@
+# test_multistart.py: test fitting the same data from several initial conditions
+import numpy
+from extreme_deconvolution import extreme_deconvolution, \
+    multistart_extreme_deconvolution
+
+_rng= numpy.random.RandomState(5)
+
+def _data(ndata):
+    xmean= numpy.array([[0.,0.],[3.,0.],[0.,3.],[3.,3.],[6.,0.]])
+    ycovar= _rng.uniform(size=(ndata,2))*0.1
+    ydata= xmean[_rng.choice(5,size=ndata)]\
+        +_rng.normal(size=(ndata,2))*0.4\
+        +_rng.normal(size=(ndata,2))*numpy.sqrt(ycovar)
+    return (ydata,ycovar)
+
+def _starts(nstart,ngauss):
+    xamp= numpy.ones((nstart,ngauss))/ngauss
+    xmean= _rng.uniform(size=(nstart,ngauss,2))*6.
+    xcovar= numpy.tile(numpy.eye(2),(nstart,ngauss,1,1))
+    return (xamp,xmean,xcovar)
+
+def test_multistart_same_as_single():
+    # Without pruning, every restart should give the same result as
+    # fitting from its initial conditions on its own
+    ydata, ycovar= _data(1001)
+    xamp, xmean, xcovar= _starts(4,3)
+    single= []
+    for ii in range(4):
+        a, m, c= numpy.copy(xamp[ii]), numpy.copy(xmean[ii]), \
+            numpy.copy(xcovar[ii])
+        l= extreme_deconvolution(ydata,ycovar,a,m,c)
+        single.append((l,a,m,c))
+    best, l, niter, converged, pruned= \
+        multistart_extreme_deconvolution(ydata,ycovar,xamp,xmean,xcovar,
+                                         pruneiter=0)
+    assert not numpy.any(pruned), 'Restarts are pruned without pruning'
+    assert numpy.all(converged), 'Restarts did not converge'
+    assert best == numpy.argmax(l), 'The best restart is not the one with the largest likelihood'
+    for ii in range(4):
+        assert numpy.fabs(l[ii]-single[ii][0]) < 10.**-8., 'Multi-start fit does not give the same likelihood as a single fit'
+        assert numpy.all(numpy.fabs(xamp[ii]-single[ii][1]) < 10.**-6.), 'Multi-start fit does not give the same amplitudes as a single fit'
+        assert numpy.all(numpy.fabs(xmean[ii]-single[ii][2]) < 10.**-6.), 'Multi-start fit does not give the same means as a single fit'
+        assert numpy.all(numpy.fabs(xcovar[ii]-single[ii][3]) < 10.**-6.), 'Multi-start fit does not give the same covariances as a single fit'
+    return None
+
+def test_multistart_prune():
+    # A restart that starts far from the data should be pruned, and the
+    # best restart should not be
+    ydata, ycovar= _data(1001)
+    xamp, xmean, xcovar= _starts(4,5)
+    xmean[2]+= 100.
+    best, l, niter, converged, pruned= \
+        multistart_extreme_deconvolution(ydata,ycovar,xamp,xmean,xcovar,
+                                         pruneiter=5,prunetol=0.1)
+    assert pruned[2], 'Restart far from the data is not pruned'
+    assert niter[2] == 5, 'Pruned restart did not stop after pruneiter iterations'
+    assert not pruned[best], 'Best restart is pruned'
+    assert converged[best], 'Best restart did not converge'
+    assert numpy.all(l[pruned] < l[best]-0.1), 'Pruned restarts are not worse than the best one'
+    return None
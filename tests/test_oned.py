@@ -289,3 +289,39 @@ def test_single_gauss_1d_varunc_logweights():
     assert numpy.fabs(initcovar-1.) < tol, 'XD does not recover correct variance for single Gaussian w/ uncertainties'
     return None
 
+
+def test_dual_gauss_1d_varunc_fastpath():
+    # Low-dimensional data w/o projection uses closed-form E-step, check
+    # against the general E-step, which is used when projecting
+    ndata= 3001
+    amp_true= 0.3
+    assign= numpy.random.binomial(1,1.-amp_true,ndata)
+    ydata= numpy.zeros((ndata,1))
+    ydata[assign==0,0]= numpy.random.normal(size=numpy.sum(assign==0))-2.
+    ydata[assign==1,0]= numpy.random.normal(size=numpy.sum(assign==1))*2.+1.
+    ycovar= numpy.ones_like(ydata)*\
+        numpy.atleast_2d(numpy.random.uniform(size=ndata)).T
+    ydata+= numpy.atleast_2d(numpy.random.normal(size=ndata)).T\
+        *numpy.sqrt(ycovar)
+    # initialize fit
+    K= 2
+    initamp= numpy.ones(K)/float(K)
+    initmean= numpy.array([[-1.],[0.]])
+    initcovar= numpy.zeros((K,1,1))
+    for kk in range(K):
+        initcovar[kk]= numpy.mean(3.*numpy.var(ydata))
+    pinitamp, pinitmean, pinitcovar=\
+        initamp.copy(), initmean.copy(), initcovar.copy()
+    # Run XD
+    lnl= extreme_deconvolution(ydata,ycovar,initamp,initmean,initcovar,
+                               maxiter=30)
+    plnl= extreme_deconvolution(ydata,ycovar,pinitamp,pinitmean,pinitcovar,
+                                projection=numpy.ones((ndata,1,1)),
+                                maxiter=30)
+    # Test
+    tol= 10.**-8.
+    assert numpy.fabs(lnl-plnl) < tol, 'Closed-form 1D E-step does not agree with the general E-step'
+    assert numpy.all(numpy.fabs(initamp-pinitamp) < tol), 'Closed-form 1D E-step does not agree with the general E-step'
+    assert numpy.all(numpy.fabs(initmean-pinitmean) < tol), 'Closed-form 1D E-step does not agree with the general E-step'
+    assert numpy.all(numpy.fabs(initcovar-pinitcovar) < tol), 'Closed-form 1D E-step does not agree with the general E-step'
+    return None
@@ -0,0 +1,128 @@
+# test_outofcore.py: test streaming memory-mapped data through the E-step
+import os
+import tempfile
+import numpy
+import pytest
+from extreme_deconvolution import extreme_deconvolution
+
+_rng= numpy.random.RandomState(5)
+
+def _problem(ndata):
+    xmean= numpy.array([[0.,0.],[4.,2.]])
+    ydata= _rng.normal(size=(ndata,2))+xmean[_rng.choice(2,size=ndata)]
+    tmp= _rng.normal(size=(ndata,2,2))*0.3
+    ycovar= numpy.einsum('nij,nkj->nik',tmp,tmp)+0.01*numpy.eye(2)
+    projection= numpy.tile(numpy.array([[1.,0.5],[0.,1.]]),(ndata,1,1))
+    weight= _rng.uniform(size=ndata)
+    return (ydata,ycovar,projection,weight)
+
+def _fit(ydata,ycovar,**kwargs):
+    xamp= numpy.ones(2)/2.
+    xmean= numpy.array([[1.,1.],[3.,3.]])
+    xcovar= numpy.tile(numpy.eye(2),(2,1,1))
+    l= extreme_deconvolution(ydata,ycovar,xamp,xmean,xcovar,maxiter=30,
+                             **kwargs)
+    return (l,xamp,xmean,xcovar)
+
+def _check(out,ref):
+    assert numpy.fabs(out[0]-ref[0]) < 10.**-10., 'Streaming the data in chunks gives a different log likelihood'
+    for a,b in zip(out[1:],ref[1:]):
+        assert numpy.all(numpy.fabs(a-b) < 10.**-8.), 'Streaming the data in chunks gives a different fit'
+    return None
+
+def test_chunks_same_as_in_memory():
+    # Chunks that do and do not divide the data evenly, and a single chunk
+    ydata,ycovar,projection,weight= _problem(1001)
+    ref= _fit(ydata,ycovar,projection=projection,weight=weight)
+    for chunksize in [97,143,1001,5000]:
+        _check(_fit(ydata,ycovar,projection=projection,weight=weight,
+                    chunksize=chunksize),ref)
+    # Also w/o projections and weights
+    ref= _fit(ydata,ycovar)
+    _check(_fit(ydata,ycovar,chunksize=100),ref)
+    return None
+
+def test_npy_and_memmap():
+    # Paths to .npy files and memmaps are streamed by default
+    ydata,ycovar,projection,weight= _problem(1201)
+    ref= _fit(ydata,ycovar,projection=projection,weight=weight)
+    tmpdir= tempfile.mkdtemp()
+    try:
+        paths= [os.path.join(tmpdir,'%s.npy' % name)
+                for name in ['ydata','ycovar','projection','weight']]
+        for path,x in zip(paths,[ydata,ycovar,projection,weight]):
+            numpy.save(path,x)
+        _check(_fit(paths[0],paths[1],projection=paths[2],weight=paths[3]),
+               ref)
+        mm= [numpy.load(path,mmap_mode='r') for path in paths]
+        _check(_fit(mm[0],mm[1],projection=mm[2],weight=mm[3],
+                    chunksize=250),ref)
+        del mm
+    finally:
+        for path in paths:
+            if os.path.exists(path): os.remove(path)
+        os.rmdir(tmpdir)
+    return None
+
+def test_chunks_no_splitnmerge():
+    ydata,ycovar,projection,weight= _problem(101)
+    with pytest.raises(ValueError):
+        _fit(ydata,ycovar,chunksize=10,splitnmerge=1)
+    return None
+
+def test_memmap_splitnmerge_in_memory():
+    # Memory-mapped data with split and merge are fit in memory by default
+    # rather than streamed, and give the same fit as in-memory arrays
+    ydata,ycovar,projection,weight= _problem(301)
+    ref= _fit(ydata,ycovar,splitnmerge=1)
+    tmpdir= tempfile.mkdtemp()
+    path= os.path.join(tmpdir,'ydata.npy')
+    try:
+        numpy.save(path,ydata)
+        mm= numpy.load(path,mmap_mode='r')
+        _check(_fit(mm,ycovar,splitnmerge=1),ref)
+        _check(_fit(path,ycovar,maxsnm=True),_fit(ydata,ycovar,maxsnm=True))
+        with pytest.raises(ValueError):
+            _fit(mm,ycovar,chunksize=10,splitnmerge=1)
+        del mm
+    finally:
+        if os.path.exists(path): os.remove(path)
+        os.rmdir(tmpdir)
+    return None
+
+def test_memmap_not_copied():
+    # Streamed memory-mapped weights are not copied as a whole (their log
+    # is taken chunk-by-chunk), and memory-mapped data that are not
+    # float64 are rejected rather than converted as a whole
+    import tracemalloc
+    ydata,ycovar,projection,weight= _problem(20001)
+    ref= _fit(ydata,ycovar,weight=weight)
+    logref= _fit(ydata,ycovar,weight=numpy.log(weight),logweight=True)
+    _check(logref,ref)
+    tmpdir= tempfile.mkdtemp()
+    paths= [os.path.join(tmpdir,'%s.npy' % name)
+            for name in ['ydata','ycovar','weight','ydata32']]
+    try:
+        for path,x in zip(paths,[ydata,ycovar,weight,
+                                 ydata.astype(numpy.float32)]):
+            numpy.save(path,x)
+        mm= [numpy.load(path,mmap_mode='r') for path in paths]
+        tracemalloc.start()
+        try:
+            out= _fit(mm[0],mm[1],weight=mm[2],chunksize=1000)
+            peak= tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        _check(out,ref)
+        assert peak < weight.nbytes // 2, 'Streaming memory-mapped weights copies them'
+        with pytest.raises(ValueError):
+            _fit(mm[3],mm[1],chunksize=1000)
+        # In memory, they are converted
+        _check(_fit(mm[3],ycovar,chunksize=0),
+               _fit(ydata.astype(numpy.float32),ycovar))
+        del mm
+    finally:
+        for path in paths:
+            if os.path.exists(path): os.remove(path)
+        os.rmdir(tmpdir)
+    return None
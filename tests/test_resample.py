@@ -0,0 +1,58 @@
+# test_resample.py: test the jackknife and bootstrap uncertainties
+import numpy
+import pytest
+from extreme_deconvolution import extreme_deconvolution, \
+    resample_extreme_deconvolution
+
+def test_resample_1d_errors():
+    # For a single gaussian, the uncertainties should be close to the
+    # analytic ones, sqrt(V/N) for the mean and sqrt(2/N) V for the variance
+    rng= numpy.random.RandomState(7)
+    ndata= 2001
+    ydata= numpy.atleast_2d(rng.normal(size=ndata)*2.+1.).T
+    ycovar= numpy.ones_like(ydata)
+    ydata+= rng.normal(size=(ndata,1))
+    xamp, xmean, xcovar= numpy.ones(1), numpy.zeros((1,1)), numpy.ones((1,1,1))
+    extreme_deconvolution(ydata,ycovar,xamp,xmean,xcovar)
+    for method in ['jackknife','bootstrap']:
+        out= resample_extreme_deconvolution(ydata,ycovar,xamp,xmean,xcovar,
+                                            method=method,nresample=100,
+                                            seed=1)
+        assert out['xamp'].shape == (100,1) and out['xmean'].shape == (100,1,1) and out['xcovar'].shape == (100,1,1,1), 'resample_extreme_deconvolution does not return the fits to all resamples'
+        assert numpy.all(out['converged']), 'Resamples did not converge'
+        assert numpy.fabs(out['xmeanerr'][0,0]/numpy.sqrt(5./ndata)-1.) < 0.3, '%s uncertainty of the mean is not close to the analytic one' % method
+        assert numpy.fabs(out['xcovarerr'][0,0,0]/(numpy.sqrt(2./ndata)*5.)-1.) < 0.3, '%s uncertainty of the variance is not close to the analytic one' % method
+        assert out['xamperr'][0] < 10.**-8., '%s uncertainty of a single amplitude is not zero' % method
+    return None
+
+def test_jackknife_same_as_single():
+    # Every jackknife resample should give the same result as fitting the
+    # data without its group, from the best fit to all of the data
+    rng= numpy.random.RandomState(8)
+    ndata= 501
+    xmean= numpy.array([[0.,0.],[4.,0.]])
+    ycovar= rng.uniform(size=(ndata,2,2))*0.1
+    ycovar= numpy.einsum('ijk,ilk->ijl',ycovar,ycovar)+0.05*numpy.eye(2)
+    ydata= xmean[rng.choice(2,size=ndata)]+rng.normal(size=(ndata,2))
+    xamp, xcovar= numpy.ones(2)/2., numpy.tile(numpy.eye(2),(2,1,1))
+    extreme_deconvolution(ydata,ycovar,xamp,xmean,xcovar)
+    nresample= 5
+    out= resample_extreme_deconvolution(ydata,ycovar,xamp,xmean,xcovar,
+                                        nresample=nresample,seed=3)
+    group= numpy.zeros(ndata,dtype=int)
+    group[numpy.random.RandomState(3).permutation(ndata)]= \
+        numpy.arange(ndata) % nresample
+    for rr in range(nresample):
+        a, m, c= numpy.copy(xamp), numpy.copy(xmean), numpy.copy(xcovar)
+        l= extreme_deconvolution(ydata[group != rr],ycovar[group != rr],
+                                 a,m,c)
+        assert numpy.fabs(l-out['avgloglikedata'][rr]) < 10.**-8., 'Jackknife resample does not give the same likelihood as a single fit'
+        assert numpy.all(numpy.fabs(m-out['xmean'][rr]) < 10.**-6.), 'Jackknife resample does not give the same means as a single fit'
+        assert numpy.all(numpy.fabs(c-out['xcovar'][rr]) < 10.**-6.), 'Jackknife resample does not give the same covariances as a single fit'
+    nparam= 2*(1+2+3)
+    assert out['cov'].shape == (nparam,nparam), 'Parameter covariance does not have the right shape'
+    assert numpy.all(numpy.fabs(out['xcovarerr']-numpy.swapaxes(out['xcovarerr'],1,2)) == 0.), 'Covariance uncertainties are not symmetric'
+    with pytest.raises(ValueError):
+        resample_extreme_deconvolution(ydata,ycovar,xamp,xmean,xcovar,
+                                       method='cross')
+    return None
@@ -0,0 +1,67 @@
+# test_sample.py: test drawing samples from the mixture
+import numpy
+import pytest
+from extreme_deconvolution import sample
+
+def test_sample_moments():
+    # The labels should follow the amplitudes and the samples of every
+    # gaussian should have its mean and covariance, also for a singular
+    # covariance
+    xamp= numpy.array([0.5,0.3,0.2])
+    xmean= numpy.array([[0.,0.],[5.,0.],[0.,5.]])
+    xcovar= numpy.array([[[1.,0.5],[0.5,1.]],0.5*numpy.eye(2),
+                         [[2.,0.],[0.,0.]]])
+    nsample= 100000
+    x, label= sample(xamp,xmean,xcovar,nsample,seed=1,label=True,
+                     batchsize=30000)
+    assert x.shape == (nsample,2), 'sample does not return nsample samples'
+    assert numpy.all(numpy.fabs(numpy.bincount(label)/float(nsample)-xamp) < 0.01), 'Labels do not follow the amplitudes'
+    for jj in range(3):
+        assert numpy.all(numpy.fabs(numpy.mean(x[label == jj],axis=0)-xmean[jj]) < 0.03), 'Samples do not have the mean of their gaussian'
+        assert numpy.all(numpy.fabs(numpy.cov(x[label == jj].T)-xcovar[jj]) < 0.05), 'Samples do not have the covariance of their gaussian'
+    assert numpy.all(x[label == 2,1] == 5.), 'Samples of a gaussian with vanishing variance are not at its mean'
+    # The same seed should give the same samples
+    assert numpy.all(sample(xamp,xmean,xcovar,nsample,seed=1,
+                            batchsize=30000) == x), 'The same seed does not give the same samples'
+    return None
+
+def test_sample_noisy():
+    # Noisy samples should have covariance R V R^T + S, and errors and
+    # projections that are shared by all samples should give the same
+    # samples as a copy for every sample
+    nsample= 100000
+    xamp, xmean= numpy.ones(1), numpy.array([[1.,-1.]])
+    xcovar= numpy.array([[[1.,0.5],[0.5,1.]]])
+    proj= numpy.array([[1.,1.],[0.,1.],[2.,0.]])
+    for ycovar in [numpy.diag([0.3,0.1,0.2]),numpy.array([0.3,0.1,0.2])]:
+        diag= len(ycovar.shape) == 1
+        shared= numpy.broadcast_to(ycovar,(nsample,)+ycovar.shape)
+        sharedproj= numpy.broadcast_to(proj,(nsample,3,2))
+        x, y= sample(xamp,xmean,xcovar,nsample,ycovar=shared,
+                     projection=sharedproj,seed=2)
+        S= numpy.diag(ycovar) if diag else ycovar
+        assert numpy.all(numpy.fabs(numpy.cov(y.T)-numpy.dot(proj,numpy.dot(xcovar[0],proj.T))-S) < 0.05), 'Noisy samples do not have the convolved covariance'
+        assert numpy.all(numpy.fabs(numpy.mean(y,axis=0)-numpy.dot(proj,xmean[0])) < 0.03), 'Noisy samples do not have the projected mean'
+        xc, yc= sample(xamp,xmean,xcovar,nsample,ycovar=numpy.array(shared),
+                       projection=numpy.array(sharedproj),seed=2)
+        assert numpy.all(xc == x), 'Shared errors do not give the same samples as copied errors'
+        assert numpy.all(numpy.fabs(yc-y) < 10.**-12.), 'Shared errors do not give the same noisy samples as copied errors'
+    # Without projections, the noise is added to the samples
+    x, y= sample(xamp,xmean,xcovar,10,ycovar=numpy.zeros((10,2)),seed=3)
+    assert numpy.all(x == y), 'Noisy samples without noise are not the samples'
+    with pytest.raises(ValueError):
+        sample(xamp,xmean,xcovar,10,projection=numpy.zeros((10,3,2)))
+    with pytest.raises(ValueError):
+        sample(xamp,xmean,xcovar,10,ycovar=numpy.zeros((10,3)))
+    return None
+
+def test_sample_sqrtm():
+    # Covariances that are only positive semi-definite should get their
+    # symmetric square root
+    from extreme_deconvolution.extreme_deconvolution import _sqrtm
+    covar= numpy.array([[[2.,0.],[0.,0.]],[[1.,1.],[1.,1.]],
+                        [[1.,2.],[2.,4.]]])
+    root= _sqrtm(covar)
+    assert numpy.all(numpy.fabs(root-numpy.swapaxes(root,-1,-2)) < 10.**-12.), 'The square root of a singular covariance is not symmetric'
+    assert numpy.all(numpy.fabs(numpy.einsum('nij,nkj->nik',root,root)-covar) < 10.**-12.), 'The square root of a singular covariance does not square to the covariance'
+    return None
@@ -0,0 +1,181 @@
+# test_score.py: test scoring data under a fixed model without running EM
+import numpy
+from extreme_deconvolution import extreme_deconvolution, score_samples, \
+    membership_prob, deconvolve
+
+def _direct_loglike(ydata,ycovar,xamp,xmean,xcovar,projection):
+    # Straightforward numpy implementation of the per-point, per-component
+    # log likelihood
+    ndata, dy= ydata.shape
+    out= numpy.empty((ndata,len(xamp)))
+    for ii in range(ndata):
+        for kk in range(len(xamp)):
+            T= numpy.dot(projection[ii],numpy.dot(xcovar[kk],projection[ii].T))\
+                +ycovar[ii]
+            delta= ydata[ii]-numpy.dot(projection[ii],xmean[kk])
+            out[ii,kk]= numpy.log(xamp[kk])\
+                -0.5*dy*numpy.log(2.*numpy.pi)\
+                -0.5*numpy.linalg.slogdet(T)[1]\
+                -0.5*numpy.dot(delta,numpy.linalg.solve(T,delta))
+    return out
+
+def test_score_samples_likeonly_1d_varunc():
+    # The average of the per-point log likelihoods should be what
+    # likeonly=True returns
+    rng= numpy.random.RandomState(2)
+    ndata= 3001
+    ydata= numpy.atleast_2d(rng.normal(size=ndata)).T
+    ycovar= numpy.ones_like(ydata)*\
+        numpy.atleast_2d(rng.uniform(size=ndata)).T
+    ydata+= numpy.atleast_2d(rng.normal(size=ndata)).T\
+        *numpy.sqrt(ycovar)
+    K= 2
+    xamp= numpy.array([0.4,0.6])
+    xmean= numpy.array([[-0.5],[0.5]])
+    xcovar= numpy.array([[[1.]],[[2.]]])
+    lnl= extreme_deconvolution(ydata,ycovar,xamp.copy(),xmean.copy(),
+                               xcovar.copy(),likeonly=True)
+    scores= score_samples(ydata,ycovar,xamp,xmean,xcovar)
+    assert scores.shape == (ndata,), 'score_samples does not return one log likelihood per data point'
+    assert numpy.fabs(numpy.mean(scores)-lnl) < 10.**-10., 'score_samples does not agree with likeonly'
+    return None
+
+def test_score_samples_direct_2d_offdiagunc_proj():
+    # Compare to a direct computation, with projection and full covariances
+    rng= numpy.random.RandomState(3)
+    ndata= 101
+    ydata= rng.normal(size=(ndata,2))
+    ycovar= numpy.empty((ndata,2,2))
+    projection= rng.normal(size=(ndata,2,3))
+    for ii in range(ndata):
+        tmp= rng.normal(size=(2,2))
+        ycovar[ii]= numpy.dot(tmp,tmp.T)+0.1*numpy.eye(2)
+    K= 3
+    xamp= numpy.array([0.2,0.3,0.5])
+    xmean= rng.normal(size=(K,3))
+    xcovar= numpy.empty((K,3,3))
+    for kk in range(K):
+        tmp= rng.normal(size=(3,3))
+        xcovar[kk]= numpy.dot(tmp,tmp.T)+0.1*numpy.eye(3)
+    direct= _direct_loglike(ydata,ycovar,xamp,xmean,xcovar,projection)
+    directlnl= numpy.log(numpy.sum(numpy.exp(direct),axis=1))
+    scores= score_samples(ydata,ycovar,xamp,xmean,xcovar,
+                          projection=projection)
+    assert numpy.all(numpy.fabs(scores-directlnl) < 10.**-8.), 'score_samples does not agree with direct computation'
+    logpost= membership_prob(ydata,ycovar,xamp,xmean,xcovar,
+                             projection=projection,log=True)
+    assert numpy.all(numpy.fabs(logpost-(direct-directlnl[:,None])) < 10.**-8.), 'membership_prob does not agree with direct computation'
+    return None
+
+def test_deconvolve_direct():
+    # The posterior means and covariances should agree with a direct
+    # computation, with and without projections
+    rng= numpy.random.RandomState(4)
+    ndata= 101
+    K= 3
+    xamp= numpy.array([0.2,0.3,0.5])
+    xmean= rng.normal(size=(K,3))*2.
+    xcovar= numpy.empty((K,3,3))
+    for kk in range(K):
+        tmp= rng.normal(size=(3,3))
+        xcovar[kk]= numpy.dot(tmp,tmp.T)+0.1*numpy.eye(3)
+    for dy,proj in [(2,True),(3,False)]:
+        ydata= rng.normal(size=(ndata,dy))
+        ycovar= numpy.empty((ndata,dy,dy))
+        for ii in range(ndata):
+            tmp= rng.normal(size=(dy,dy))
+            ycovar[ii]= numpy.dot(tmp,tmp.T)+0.1*numpy.eye(dy)
+        if proj:
+            projection= rng.normal(size=(ndata,dy,3))
+        else:
+            projection= numpy.tile(numpy.eye(3),(ndata,1,1))
+        post= membership_prob(ydata,ycovar,xamp,xmean,xcovar,
+                              projection=projection if proj else None)
+        mean, covar= deconvolve(ydata,ycovar,xamp,xmean,xcovar,
+                                projection=projection if proj else None)
+        assert mean.shape == (ndata,3) and covar.shape == (ndata,3,3), 'deconvolve does not return [ndata,dx] and [ndata,dx,dx] arrays'
+        for ii in range(ndata):
+            dmean= numpy.zeros(3)
+            dsecond= numpy.zeros((3,3))
+            for kk in range(K):
+                R= projection[ii]
+                T= numpy.dot(R,numpy.dot(xcovar[kk],R.T))+ycovar[ii]
+                G= numpy.dot(numpy.dot(xcovar[kk],R.T),numpy.linalg.inv(T))
+                b= xmean[kk]+numpy.dot(G,ydata[ii]-numpy.dot(R,xmean[kk]))
+                B= xcovar[kk]-numpy.dot(G,numpy.dot(R,xcovar[kk]))
+                dmean+= post[ii,kk]*b
+                dsecond+= post[ii,kk]*(B+numpy.outer(b,b))
+            assert numpy.all(numpy.fabs(mean[ii]-dmean) < 10.**-8.), 'deconvolve posterior means do not agree with direct computation'
+            assert numpy.all(numpy.fabs(covar[ii]-dsecond+numpy.outer(dmean,dmean)) < 10.**-8.), 'deconvolve posterior covariances do not agree with direct computation'
+    return None
+
+def test_deconvolve_condition():
+    # Conditioning a single gaussian on error-free dimensions should give
+    # the conditional gaussian of the other dimensions
+    rng= numpy.random.RandomState(5)
+    ndata= 11
+    tmp= rng.normal(size=(3,3))
+    xcovar= numpy.array([numpy.dot(tmp,tmp.T)+0.1*numpy.eye(3)])
+    xmean= rng.normal(size=(1,3))
+    ydata= rng.normal(size=(ndata,3))
+    ycovar= numpy.zeros((ndata,3))
+    ycovar[:,1]= 1.
+    mean, covar= deconvolve(ydata,ycovar,numpy.ones(1),xmean,xcovar,
+                            condition=[0,2])
+    known, unknown= [0,2], [1]
+    G= numpy.dot(xcovar[0][numpy.ix_(unknown,known)],
+                 numpy.linalg.inv(xcovar[0][numpy.ix_(known,known)]))
+    cmean= xmean[0,unknown]\
+        +numpy.dot(ydata[:,known]-xmean[0,known],G.T)
+    ccovar= xcovar[0][numpy.ix_(unknown,unknown)]\
+        -numpy.dot(G,xcovar[0][numpy.ix_(known,unknown)])
+    assert numpy.all(numpy.fabs(mean[:,unknown]-cmean) < 10.**-8.), 'deconvolve does not give the conditional mean'
+    assert numpy.all(numpy.fabs(mean[:,known]-ydata[:,known]) < 10.**-8.), 'deconvolve does not reproduce the error-free dimensions'
+    assert numpy.all(numpy.fabs(covar[:,1,1]-ccovar[0,0]) < 10.**-8.), 'deconvolve does not give the conditional variance'
+    assert numpy.all(numpy.fabs(covar[:,0,0]) < 10.**-8.), 'deconvolve does not give zero variance for the error-free dimensions'
+    # A boolean mask is the same as indices
+    mmean, mcovar= deconvolve(ydata,ycovar,numpy.ones(1),xmean,xcovar,
+                              condition=numpy.array([True,False,True]))
+    assert numpy.all(mmean == mean) and numpy.all(mcovar == covar), 'deconvolve with a boolean mask is not the same as with indices'
+    return None
+
+def test_membership_prob_2d_diagunc():
+    # Posterior probabilities should sum to one and pick out the right
+    # component for well-separated components
+    rng= numpy.random.RandomState(6)
+    ndata= 3001
+    assign= rng.binomial(1,0.5,ndata)
+    ydata= rng.normal(size=(ndata,2))\
+        +10.*numpy.atleast_2d(assign).T
+    ycovar= numpy.ones_like(ydata)\
+        *rng.uniform(size=(ndata,2))/2.
+    xamp= numpy.ones(2)/2.
+    xmean= numpy.array([[0.,0.],[10.,10.]])
+    xcovar= numpy.array([numpy.eye(2),numpy.eye(2)])
+    post= membership_prob(ydata,ycovar,xamp,xmean,xcovar)
+    assert post.shape == (ndata,2), 'membership_prob does not return [ndata,ngauss] array'
+    assert numpy.all(numpy.fabs(numpy.sum(post,axis=1)-1.) < 10.**-10.), 'membership probabilities do not sum to one'
+    assert numpy.all(numpy.argmax(post,axis=1) == assign), 'membership_prob does not assign well-separated points correctly'
+    return None
+
+def test_likeonly_threads_deterministic():
+    # The log likelihood should not depend on the number of threads
+    import os, sys, subprocess
+    code= """import numpy
+from extreme_deconvolution import extreme_deconvolution
+rng= numpy.random.RandomState(1)
+ydata= rng.normal(size=(10001,2))
+ycovar= rng.uniform(size=(10001,2))
+xamp= numpy.ones(3)/3.
+xmean= rng.normal(size=(3,2))
+xcovar= numpy.array([numpy.eye(2) for kk in range(3)])
+print(repr(extreme_deconvolution(ydata,ycovar,xamp,xmean,xcovar,
+                                 likeonly=True)))
+"""
+    out= []
+    for nthreads in ['1','3']:
+        env= dict(os.environ,OMP_NUM_THREADS=nthreads)
+        out.append(subprocess.check_output([sys.executable,'-c',code],
+                                           env=env))
+    assert out[0] == out[1], 'log likelihood depends on the number of threads'
+    return None
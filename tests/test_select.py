@@ -0,0 +1,33 @@
+# test_select.py: test choosing the number of gaussians
+import numpy
+import pytest
+from extreme_deconvolution import extreme_deconvolution, select_ngauss
+
+_rng= numpy.random.RandomState(6)
+
+def _data(ndata):
+    xmean= numpy.array([[0.,0.],[3.,0.],[0.,3.],[3.,3.],[6.,0.]])
+    ycovar= _rng.uniform(size=(ndata,2))*0.1
+    ydata= xmean[_rng.choice(5,size=ndata)]\
+        +_rng.normal(size=(ndata,2))*0.4\
+        +_rng.normal(size=(ndata,2))*numpy.sqrt(ycovar)
+    return (ydata,ycovar)
+
+def test_select_ngauss():
+    # All criteria should prefer the five gaussians the data were drawn from
+    ydata, ycovar= _data(3001)
+    heldout= _data(1001)
+    out= select_ngauss(ydata,ycovar,range(2,9),heldout=heldout,seed=1)
+    assert numpy.all(out['ngauss'] == numpy.arange(2,9)), 'select_ngauss does not return the numbers of gaussians'
+    for crit in ['aic','bic','mdl']:
+        assert out['ngauss'][numpy.argmin(out[crit])] == 5, '%s does not select the right number of gaussians' % crit
+    assert out['ngauss'][numpy.argmax(out['heldout'])] == 5, 'Held-out likelihood does not select the right number of gaussians'
+    for ii,K in enumerate(out['ngauss']):
+        assert out['xamp'][ii].shape == (K,) and out['xmean'][ii].shape == (K,2) and out['xcovar'][ii].shape == (K,2,2), 'select_ngauss does not return models with the right number of gaussians'
+    # The returned models are the fits
+    l= extreme_deconvolution(ydata,ycovar,out['xamp'][3],out['xmean'][3],
+                             out['xcovar'][3],likeonly=True)
+    assert numpy.fabs(l-out['avgloglikedata'][3]) < 10.**-5., 'select_ngauss does not return the best-fit models'
+    with pytest.raises(ValueError):
+        select_ngauss(ydata,ycovar,[3,2])
+    return None
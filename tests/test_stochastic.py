@@ -0,0 +1,53 @@
+# test_stochastic.py: test stochastic (mini-batch) EM
+import numpy
+from extreme_deconvolution import extreme_deconvolution
+
+_rng= numpy.random.RandomState(6)
+
+def _problem(ndata):
+    xmean= numpy.array([[0.,0.],[5.,0.],[0.,5.]])
+    assign= _rng.choice(3,size=ndata,p=[0.5,0.3,0.2])
+    ycovar= _rng.uniform(size=(ndata,2))/2.
+    ydata= _rng.normal(size=(ndata,2))+xmean[assign]\
+        +_rng.normal(size=(ndata,2))*numpy.sqrt(ycovar)
+    initamp= numpy.ones(3)/3.
+    initmean= xmean+_rng.normal(size=(3,2))
+    initcovar= numpy.tile(3.*numpy.eye(2),(3,1,1))
+    return (ydata,ycovar,initamp,initmean,initcovar)
+
+def test_stochastic_close_to_full():
+    ydata,ycovar,initamp,initmean,initcovar= _problem(20001)
+    amp,mean,covar= initamp.copy(), initmean.copy(), initcovar.copy()
+    l= extreme_deconvolution(ydata,ycovar,amp,mean,covar)
+    samp,smean,scovar= initamp.copy(), initmean.copy(), initcovar.copy()
+    diag= extreme_deconvolution(ydata,ycovar,samp,smean,scovar,
+                                minibatch=500,nepoch=5,polish=False,
+                                fullresult=True)
+    sl= diag.avgloglikedata
+    # Stochastic EM only, should be close to the full EM
+    assert diag.niter == 0, 'stochastic EM w/o polish should not run the full EM'
+    assert 0 < diag.nsteps <= 5*41, 'stochastic EM took an unexpected number of steps'
+    for key in ['stepsize','minibatch_loglike','smoothed_loglike']:
+        assert len(getattr(diag,key)) == diag.nsteps, 'stochastic EM diagnostics have the wrong length'
+    assert numpy.all(numpy.diff(diag.stepsize) < 0.), 'stochastic EM step sizes should decrease'
+    assert numpy.fabs(sl-l) < 0.01, 'stochastic EM log likelihood not close to that of the full EM'
+    assert numpy.all(numpy.fabs(samp-amp) < 0.01), 'stochastic EM amplitudes not close to those of the full EM'
+    assert numpy.all(numpy.fabs(smean-mean) < 0.05), 'stochastic EM means not close to those of the full EM'
+    assert numpy.all(numpy.fabs(scovar-covar) < 0.1), 'stochastic EM covariances not close to those of the full EM'
+    # Polishing with the full EM should converge to the full EM result,
+    # in fewer iterations
+    diagfull= extreme_deconvolution(ydata,ycovar,initamp.copy(),
+                                    initmean.copy(),initcovar.copy(),
+                                    fullresult=True)
+    l= diagfull.avgloglikedata
+    assert diagfull.nsteps is None and diagfull.minibatch_loglike is None, 'full EM should not have stochastic EM diagnostics'
+    pdiag= extreme_deconvolution(ydata,ycovar,samp,smean,scovar,minibatch=500,
+                                 nepoch=2,fullresult=True)
+    pl= pdiag.avgloglikedata
+    assert numpy.fabs(pl-l) < 10.**-5., 'polished stochastic EM does not agree with the full EM'
+    assert numpy.all(numpy.fabs(samp-amp) < 10.**-3.), 'polished stochastic EM does not agree with the full EM'
+    assert numpy.all(numpy.fabs(smean-mean) < 10.**-2.), 'polished stochastic EM does not agree with the full EM'
+    assert pdiag.converged, 'polished stochastic EM did not converge'
+    assert pdiag.niter < diagfull.niter, 'polished stochastic EM should take fewer full EM iterations'
+    assert len(pdiag.minibatch_loglike) == pdiag.nsteps, 'polished stochastic EM diagnostics have the wrong length'
+    return None
@@ -0,0 +1,59 @@
+# test_threads.py: test that fits can run concurrently in several threads
+import numpy
+from extreme_deconvolution import extreme_deconvolution
+
+def _problem(ndata,seed):
+    rng= numpy.random.RandomState(seed)
+    assign= rng.choice(3,size=ndata)
+    ydata= rng.normal(size=(ndata,2))+4.*numpy.array([[0.,0.],[1.,1.],
+                                                      [2.,0.]])[assign]
+    ycovar= rng.uniform(size=(ndata,2))/2.
+    xamp= numpy.ones(3)/3.
+    xmean= rng.normal(size=(3,2))+2.
+    xcovar= numpy.array([numpy.eye(2) for kk in range(3)])
+    return (ydata,ycovar,xamp,xmean,xcovar)
+
+def _fit(problem):
+    ydata,ycovar,xamp,xmean,xcovar= [numpy.copy(p) for p in problem]
+    l= extreme_deconvolution(ydata,ycovar,xamp,xmean,xcovar,splitnmerge=2)
+    return (l,xamp,xmean,xcovar)
+
+def test_concurrent_fits():
+    # Fits run from a thread pool should give the same results as when
+    # they are run one after the other
+    try:
+        from concurrent.futures import ThreadPoolExecutor
+    except ImportError: #pragma: no cover
+        return None # python 2 without the futures backport
+    problems= [_problem(2001,seed) for seed in range(6)]
+    serial= [_fit(problem) for problem in problems]
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        concurrent= list(executor.map(_fit,problems))
+    for s,c in zip(serial,concurrent):
+        assert s[0] == c[0], 'concurrent fit does not give the same log likelihood as a serial fit'
+        for ss,cc in zip(s[1:],c[1:]):
+            assert numpy.all(ss == cc), 'concurrent fit does not give the same parameters as a serial fit'
+    return None
+
+def test_threads_deterministic():
+    # The fitted model should not depend on the number of threads that
+    # the E-step runs in
+    import os, sys, subprocess
+    code= """import numpy
+from extreme_deconvolution import extreme_deconvolution
+rng= numpy.random.RandomState(1)
+ydata= rng.normal(size=(20001,2))
+ycovar= rng.uniform(size=(20001,2))
+xamp= numpy.ones(3)/3.
+xmean= rng.normal(size=(3,2))
+xcovar= numpy.array([numpy.eye(2) for kk in range(3)])
+l= extreme_deconvolution(ydata,ycovar,xamp,xmean,xcovar,maxiter=50)
+print(repr((l,xamp.tolist(),xmean.tolist(),xcovar.tolist())))
+"""
+    out= []
+    for nthreads in ['1','3']:
+        env= dict(os.environ,OMP_NUM_THREADS=nthreads)
+        out.append(subprocess.check_output([sys.executable,'-c',code],
+                                           env=env))
+    assert out[0] == out[1], 'fitted model depends on the number of threads'
+    return None
@@ -145,3 +145,270 @@ def test_single_gauss_2d_offdiagunc_proj():
     assert numpy.fabs(initcovar[0,0,1]-0.) < tol, 'XD does not recover correct variance for single Gaussian in 2D w/o uncertainties'
     return None
 
+
+def _fastpath_vs_general(ndata,dim,K):
+    # Low-dimensional data w/o projection uses closed-form E-step, check
+    # against the general E-step, which is used when projecting
+    xmean= numpy.random.normal(size=(K,dim))*3.
+    assign= numpy.random.choice(K,size=ndata)
+    ydata= numpy.random.normal(size=(ndata,dim))+xmean[assign]
+    tmp= numpy.random.normal(size=(ndata,dim,dim))*0.3
+    ycovar= numpy.einsum('nij,nkj->nik',tmp,tmp)+0.01*numpy.eye(dim)
+    # initialize fit
+    initamp= numpy.ones(K)/float(K)
+    initmean= xmean+numpy.random.normal(size=(K,dim))
+    initcovar= numpy.tile(4.*numpy.eye(dim),(K,1,1))
+    pinitamp, pinitmean, pinitcovar=\
+        initamp.copy(), initmean.copy(), initcovar.copy()
+    # Run XD
+    lnl= extreme_deconvolution(ydata,ycovar,initamp,initmean,initcovar,
+                               maxiter=30)
+    plnl= extreme_deconvolution(ydata,ycovar,pinitamp,pinitmean,pinitcovar,
+                                projection=numpy.tile(numpy.eye(dim),
+                                                      (ndata,1,1)),
+                                maxiter=30)
+    # Test
+    tol= 10.**-8.
+    assert numpy.fabs(lnl-plnl) < tol, 'Closed-form %iD E-step does not agree with the general E-step' % dim
+    assert numpy.all(numpy.fabs(initamp-pinitamp) < tol), 'Closed-form %iD E-step does not agree with the general E-step' % dim
+    assert numpy.all(numpy.fabs(initmean-pinitmean) < tol), 'Closed-form %iD E-step does not agree with the general E-step' % dim
+    assert numpy.all(numpy.fabs(initcovar-pinitcovar) < tol), 'Closed-form %iD E-step does not agree with the general E-step' % dim
+    return None
+
+def test_dual_gauss_2d_offdiagunc_fastpath():
+    return _fastpath_vs_general(3001,2,2)
+
+def test_dual_gauss_3d_4d_offdiagunc_fastpath():
+    _fastpath_vs_general(2001,3,2)
+    _fastpath_vs_general(2001,4,3)
+    return None
+
+def test_dual_gauss_2d_views():
+    # The data are used in place, check that read-only, Fortran-ordered,
+    # sliced, and broadcast inputs give the same fit as C-contiguous ones
+    rng= numpy.random.RandomState(8)
+    ndata= 1001
+    xmean= numpy.array([[0.,0.],[3.,2.]])
+    ydata= rng.normal(size=(ndata,2))+xmean[rng.choice(2,size=ndata)]
+    tmp= rng.normal(size=(ndata,2,2))*0.3
+    ycovar= numpy.einsum('nij,nkj->nik',tmp,tmp)+0.01*numpy.eye(2)
+    weight= rng.uniform(size=ndata)
+    projection= numpy.array([[1.,0.5],[0.,1.]])
+    def fit(ydata,ycovar,weight,projection):
+        amp= numpy.ones(2)/2.
+        mean= xmean+1.
+        covar= numpy.tile(numpy.eye(2),(2,1,1))
+        lnl= extreme_deconvolution(ydata,ycovar,amp,mean,covar,
+                                   weight=weight,projection=projection,
+                                   maxiter=20)
+        return (lnl,amp,mean,covar)
+    ref= fit(ydata,ycovar,weight,numpy.tile(projection,(ndata,1,1)))
+    # Read-only, Fortran-ordered, and broadcast projection
+    rydata= numpy.asfortranarray(ydata)
+    rycovar= numpy.asfortranarray(ycovar)
+    rydata.flags.writeable= False
+    rycovar.flags.writeable= False
+    rprojection= numpy.broadcast_to(projection,(ndata,2,2))
+    # Sliced out of larger arrays
+    big= numpy.zeros((2*ndata,5))
+    big[::2,1:5:2]= ydata
+    bigcovar= numpy.zeros((ndata,3,4))
+    bigcovar[:,:2,1:3]= ycovar
+    bigweight= numpy.zeros(3*ndata)
+    bigweight[::3]= weight
+    for args in [(rydata,rycovar,weight,rprojection),
+                 (big[::2,1:5:2],bigcovar[:,:2,1:3],bigweight[::3],
+                  rprojection)]:
+        out= fit(*args)
+        assert out[0] == ref[0], 'XD on views of the data does not agree with XD on C-contiguous data'
+        for a,b in zip(out[1:],ref[1:]):
+            assert numpy.all(a == b), 'XD on views of the data does not agree with XD on C-contiguous data'
+    return None
+
+def test_triple_gauss_2d_largeunc_accelerate():
+    # With large uncertainties EM converges slowly; SQUAREM should reach
+    # the same optimum in fewer iterations
+    rng= numpy.random.RandomState(9)
+    ndata= 1001
+    xmean= numpy.array([[0.,0.],[2.,0.],[0.,2.]])
+    ycovar= rng.uniform(1.,4.,size=(ndata,2))
+    ydata= xmean[rng.choice(3,size=ndata)]\
+        +rng.normal(size=(ndata,2))*0.3\
+        +rng.normal(size=(ndata,2))*numpy.sqrt(ycovar)
+    out= []
+    for accelerate in [False,True]:
+        initamp= numpy.ones(3)/3.
+        initmean= xmean+numpy.array([[0.3,0.2],[-0.2,0.3],[0.1,-0.3]])
+        initcovar= numpy.tile(numpy.eye(2),(3,1,1))
+        result= extreme_deconvolution(ydata,ycovar,initamp,initmean,
+                                      initcovar,tol=1.e-7,
+                                      accelerate=accelerate,fullresult=True)
+        assert result.converged, 'XD did not converge'
+        out.append((result.avgloglikedata,result.niter,initamp,initmean,
+                    initcovar))
+    assert out[1][0] > out[0][0]-10.**-6., 'Accelerated XD reaches a lower likelihood than XD'
+    assert out[1][1] < out[0][1]/2, 'Accelerated XD does not take fewer iterations than XD'
+    for a,b in zip(out[0][2:],out[1][2:]):
+        assert numpy.all(numpy.fabs(a-b) < 0.05), 'Accelerated XD does not agree with XD'
+    return None
+
+def test_triple_gauss_2d_fullresult():
+    # The full result should describe the fit: the iterations of every EM
+    # call, the log likelihood of every E-step, and the split and merge moves
+    rng= numpy.random.RandomState(10)
+    ndata= 1001
+    xmean= numpy.array([[0.,0.],[2.,0.],[0.,2.]])
+    ycovar= rng.uniform(size=(ndata,2))*0.1
+    ydata= xmean[rng.choice(3,size=ndata)]\
+        +rng.normal(size=(ndata,2))*0.3\
+        +rng.normal(size=(ndata,2))*numpy.sqrt(ycovar)
+    out= []
+    for fullresult in [False,True]:
+        initamp= numpy.ones(3)/3.
+        initmean= numpy.array([[1.,1.],[1.,0.8],[0.8,1.]])
+        initcovar= numpy.tile(numpy.eye(2),(3,1,1))
+        out.append((extreme_deconvolution(ydata,ycovar,initamp,initmean,
+                                          initcovar,splitnmerge=2,
+                                          fullresult=fullresult),
+                    initamp,initmean,initcovar))
+    res= out[1][0]
+    assert res.avgloglikedata == out[0][0], 'avgloglikedata of the full result does not agree with that returned otherwise'
+    for a,b in zip(out[0][1:],out[1][1:]):
+        assert numpy.all(a == b), 'XD with fullresult does not agree with XD'
+    assert len(res.emiter) == 1+2*len(res.snmmoves), 'Every split and merge move should run a partial and a full EM'
+    assert numpy.sum(res.emiter) == res.niter, 'Iterations of the EM calls do not add up to niter'
+    assert len(res.loglike) == res.niter, 'There should be a log likelihood for every E-step'
+    # Within the initial EM the log likelihood increases and ends at its maximum
+    initial= res.loglike[:res.emiter[0]]
+    assert numpy.all(numpy.diff(initial) > -10.**-10.), 'Log likelihood decreases during EM'
+    assert res.naccepted+res.nrejected == len(res.snmmoves) > 0, 'No split and merge moves were recorded'
+    assert res.snmmoves.shape[1] == 3, 'Split and merge moves should be (j,k,l)'
+    if res.naccepted > 0:
+        assert res.avgloglikedata > initial[-1], 'An accepted split and merge move should increase the likelihood'
+    for key in ['estep','mstep','snm']:
+        assert 0. <= res.time[key] <= res.time['total'], 'Time of %s is inconsistent' % key
+    # Hitting maxiter is reported
+    res= extreme_deconvolution(ydata,ycovar,numpy.ones(3)/3.,
+                               numpy.array([[1.,1.],[1.,0.8],[0.8,1.]]),
+                               numpy.tile(numpy.eye(2),(3,1,1)),maxiter=5,
+                               fullresult=True)
+    assert not res.converged, 'XD should not converge in 5 iterations'
+    assert list(res.emiter) == [5], 'XD should stop after maxiter iterations'
+    return None
+
+def test_triple_gauss_2d_snmworkers():
+    # Evaluating split and merge moves concurrently and accepting the first
+    # improvement should not depend on the number of workers
+    rng= numpy.random.RandomState(11)
+    ndata= 1001
+    xmean= numpy.array([[0.,0.],[2.,0.],[0.,2.],[2.,2.]])
+    ycovar= rng.uniform(size=(ndata,2))*0.1
+    ydata= xmean[rng.choice(4,size=ndata)]\
+        +rng.normal(size=(ndata,2))*0.3\
+        +rng.normal(size=(ndata,2))*numpy.sqrt(ycovar)
+    out= []
+    testep= []
+    for snmworkers, snmbest in [(1,False),(2,False),(3,False),(3,True)]:
+        initamp= numpy.ones(4)/4.
+        initmean= numpy.array([[1.,1.],[1.,0.8],[0.8,1.],[0.9,0.9]])
+        initcovar= numpy.tile(numpy.eye(2),(4,1,1))
+        res= extreme_deconvolution(ydata,ycovar,initamp,initmean,initcovar,
+                                   splitnmerge=3,snmworkers=snmworkers,
+                                   snmbest=snmbest,fullresult=True,
+                                   maxiter=1000)
+        assert len(res.emiter) == 1+2*len(res.snmmoves), 'Every split and merge move should run a partial and a full EM'
+        assert numpy.sum(res.emiter) == res.niter, 'Iterations of the EM calls do not add up to niter'
+        assert res.avgloglikedata >= res.loglike[res.emiter[0]-1], 'Split and merge decreased the likelihood'
+        out.append((res.avgloglikedata,initamp,initmean,initcovar))
+        testep.append(res.time['estep']/res.niter)
+    # The E-steps of the concurrent moves are timed as well
+    assert numpy.all(numpy.array(testep[1:]) > 0.25*testep[0]), 'E-step time of concurrent split and merge moves is not reported'
+    for a,b in zip(out[1],out[2]):
+        assert numpy.all(a == b), 'XD with concurrent split and merge depends on the number of workers'
+    for o in out[1:]:
+        assert numpy.fabs(o[0]-out[0][0]) < 0.01, 'XD with concurrent split and merge does not reach the same likelihood as XD'
+    return None
+
+def test_triple_gauss_2d_partialem():
+    # The partial EM of split and merge only evaluates the moved gaussians,
+    # with the others cached; it should still increase the likelihood, and
+    # leaving out data points far from the moved gaussians should reach
+    # about the same optimum
+    rng= numpy.random.RandomState(12)
+    ndata= 1001
+    xmean= numpy.array([[0.,0.],[3.,0.],[0.,3.],[3.,3.],[6.,0.]])
+    ycovar= rng.uniform(size=(ndata,2))*0.1
+    ydata= xmean[rng.choice(5,size=ndata)]\
+        +rng.normal(size=(ndata,2))*0.4\
+        +rng.normal(size=(ndata,2))*numpy.sqrt(ycovar)
+    out= []
+    for snmskip in [0.,1.e-3]:
+        initamp= numpy.ones(5)/5.
+        initmean= numpy.array([[1.,1.],[1.,0.8],[0.8,1.],[0.9,0.9],[1.,1.2]])
+        initcovar= numpy.tile(numpy.eye(2),(5,1,1))
+        res= extreme_deconvolution(ydata,ycovar,initamp,initmean,initcovar,
+                                   splitnmerge=4,snmskip=snmskip,
+                                   fullresult=True,maxiter=1000)
+        start= numpy.cumsum(numpy.r_[0,res.emiter])
+        for ii in range(1,len(res.emiter),2):
+            partial= res.loglike[start[ii]:start[ii+1]]
+            assert numpy.all(numpy.diff(partial) > -10.**-8.), 'Log likelihood decreases during the partial EM'
+        out.append(res.avgloglikedata)
+    assert numpy.fabs(out[0]-out[1]) < 0.01, 'Leaving data points out of the partial EM changes the result'
+    return None
+
+def test_triple_gauss_2d_snmhierarchy():
+    # Every split and merge move should split a gaussian different from the
+    # two that are merged, also when the data are projected
+    rng= numpy.random.RandomState(13)
+    ndata= 1001
+    xmean= numpy.array([[0.,0.],[3.,0.],[0.,3.],[3.,3.],[6.,0.]])
+    ycovar= rng.uniform(size=(ndata,2))*0.1
+    ydata= xmean[rng.choice(5,size=ndata)]\
+        +rng.normal(size=(ndata,2))*0.4\
+        +rng.normal(size=(ndata,2))*numpy.sqrt(ycovar)
+    initamp= numpy.ones(5)/5.
+    initmean= numpy.array([[1.,1.],[1.,0.8],[0.8,1.],[0.9,0.9],[1.,1.2]])
+    initcovar= numpy.tile(numpy.eye(2),(5,1,1))
+    res= extreme_deconvolution(ydata,ycovar,initamp,initmean,initcovar,
+                               splitnmerge=4,fullresult=True,maxiter=200)
+    moves= res.snmmoves
+    assert len(moves) > 0, 'No split and merge moves were tried'
+    assert numpy.all(moves[:,2] != moves[:,0]) \
+        and numpy.all(moves[:,2] != moves[:,1]), 'Split and merge move splits a merged gaussian'
+    #Half of the data only measured along x
+    projection= numpy.tile(numpy.eye(2),(ndata,1,1))
+    projection[::2,1]= 0.
+    pydata= numpy.einsum('ijk,ik->ij',projection,ydata)
+    pycovar= numpy.array([numpy.diag(c) for c in ycovar])
+    pycovar[::2,1,1]= 1.
+    res= extreme_deconvolution(pydata,pycovar,initamp,initmean,initcovar,
+                               projection=projection,splitnmerge=2,
+                               fullresult=True,maxiter=200)
+    assert numpy.isfinite(res.avgloglikedata), 'Split and merge with projections does not give a finite likelihood'
+    return None
+
+def test_triple_gauss_2d_snmtrial():
+    # Abandoning the full EM of hopeless split and merge moves after a few
+    # iterations should not change the result when no move is accepted
+    rng= numpy.random.RandomState(12)
+    ndata= 1001
+    xmean= numpy.array([[0.,0.],[3.,0.],[0.,3.],[3.,3.],[6.,0.]])
+    ycovar= rng.uniform(size=(ndata,2))*0.1
+    ydata= xmean[rng.choice(5,size=ndata)]\
+        +rng.normal(size=(ndata,2))*0.4\
+        +rng.normal(size=(ndata,2))*numpy.sqrt(ycovar)
+    out= []
+    for snmtrial in [0,3]:
+        initamp= numpy.ones(5)/5.
+        initmean= numpy.array([[1.,1.],[1.,0.8],[0.8,1.],[0.9,0.9],[1.,1.2]])
+        initcovar= numpy.tile(numpy.eye(2),(5,1,1))
+        res= extreme_deconvolution(ydata,ycovar,initamp,initmean,initcovar,
+                                   splitnmerge=4,snmtrial=snmtrial,
+                                   fullresult=True,maxiter=1000)
+        out.append(res)
+    assert out[1].naccepted == out[0].naccepted == 0, 'Split and merge moves were accepted, test does not test what it should'
+    assert numpy.fabs(out[0].avgloglikedata-out[1].avgloglikedata) < 10.**-10., 'Abandoning hopeless split and merge moves changes the result'
+    assert numpy.all(out[1].emiter[2::2] <= 3), 'Hopeless split and merge moves are not abandoned after snmtrial iterations'
+    assert out[1].niter < out[0].niter, 'Abandoning hopeless split and merge moves does not save iterations'
+    return None